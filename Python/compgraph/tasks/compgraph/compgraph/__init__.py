@@ -1 +1 @@
-from .graph import Graph  # noqa: F401
+from .graph import Graph, RunOptions  # noqa: F401
@@ -0,0 +1,236 @@
+"""
+Reduce and join sorting their own inputs, choosing how while reading them.
+
+The optimizer merges a sort with the reduce or join after it into these
+operations. An input is first grouped by keys in a hash table, which is
+cheaper than sending it through the external sort; groups are then
+emitted in order of keys, so results are the same as after sorting. An
+input outgrowing the memory limit falls back to the external sort with
+rows grouped so far sent first.
+
+A join keeps the joined side in memory if it fits and then gives what is
+left of the limit to the other side. With both sides in memory it is a
+hash join, with only the joined one the other side is still sorted to
+keep output in order of keys. Only if that order does not matter, as
+when the optimizer sees output sorted again, the other side is streamed
+unsorted past the hash table of joined rows: a broadcast join. Otherwise
+it is a sort-merge join. Inner and right joins also drop rows
+of the other side surely missing in the joined side before sorting them,
+see bloom module.
+
+Under a memory budget of the run hash tables also need its grants.
+"""
+import typing as tp
+from itertools import chain, groupby, islice
+from operator import itemgetter
+
+from . import bloom
+from . import budget
+from . import external_sort
+from . import operations as ops
+from .budget import row_size
+
+MiB = 1024 ** 2
+# Memory an operation may take for rows kept in hash tables
+MEMORY_LIMIT = 8 * MiB
+_SAMPLE = budget.SAMPLE
+
+
+def _drain(groups: dict[tp.Any, list[ops.TRow]]) -> ops.TRowsGenerator:
+    while groups:
+        yield from groups.popitem()[1]
+
+
+def _in_order(groups: dict[tp.Any, list[ops.TRow]],
+              memory: budget.MemoryBudget | None,
+              granted: int) -> ops.TRowsGenerator:
+    try:
+        for key in sorted(groups):
+            yield from groups.pop(key)
+    finally:
+        if memory is not None:
+            memory.release(granted)
+
+
+def _group(rows: ops.TRowsIterable, keys: tp.Sequence[str], limit: int
+           ) -> tuple[dict[tp.Any, list[ops.TRow]], int, int,
+                      tp.Iterator[ops.TRow] | None]:
+    """Group rows by keys in a hash table while they fit in the limit
+    :return: groups, memory they take, memory granted for them by active
+     memory budget and, if rows do not fit, the rest of rows starting
+     with the one over the limit; nothing is granted then
+    """
+    key = itemgetter(*keys)
+    groups: dict[tp.Any, list[ops.TRow]] = {}
+    iterator = iter(rows)
+    memory = budget.active()
+    granted = 0
+    used = 0
+    size = 0
+    fits = True
+    for count, row in enumerate(iterator):
+        if count % _SAMPLE == 0:
+            size = row_size(row) + 8
+            if memory is not None:
+                fits = memory.grant(size * _SAMPLE)
+                granted += size * _SAMPLE if fits else 0
+        used += size
+        if used > limit or not fits:
+            if memory is not None:
+                memory.release(granted)
+            return groups, used, 0, chain([row], iterator)
+        value = key(row)
+        group = groups.get(value)
+        if group is None:
+            groups[value] = [row]
+        else:
+            group.append(row)
+    return groups, used, granted, None
+
+
+def _external(groups: dict[tp.Any, list[ops.TRow]],
+              rest: tp.Iterator[ops.TRow], keys: tp.Sequence[str],
+              stats: dict[str, tp.Any] | None) -> ops.TRowsIterable:
+    sort = external_sort.ExternalSort(keys)
+    return sort(chain(_drain(groups), rest), stats=stats)
+
+
+def sorted_input(rows: ops.TRowsIterable, keys: tp.Sequence[str],
+                 limit: int, stats: dict[str, tp.Any] | None = None
+                 ) -> tuple[ops.TRowsIterable, int]:
+    """Sort rows by keys in memory or, if they do not fit, externally
+    :param rows: rows to sort, read at once up to the limit
+    :param keys: sorting keys
+    :param limit: memory rows may take in hash table, also granted by
+     active memory budget if any
+    :param stats: counters of the operation for the external sort
+    :return: sorted rows and memory they take, -1 if sorted externally
+    """
+    groups, used, granted, rest = _group(rows, keys, limit)
+    if rest is not None:
+        return _external(groups, rest, keys, stats), -1
+    return _in_order(groups, budget.active(), granted), used
+
+
+def _strategy(stats: dict[str, tp.Any] | None, strategy: str) -> None:
+    if stats is not None:
+        stats['strategy'] = strategy
+
+
+class AdaptiveReduce(ops.Reduce):
+    """Sort by keys and reduce, see module description"""
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str],
+                 memory_limit: int = MEMORY_LIMIT) -> None:
+        """
+        :param reducer: reducer to use
+        :param keys: keys for sorting and grouping
+        :param memory_limit: memory for hash table, 0 to sort externally
+        """
+        super().__init__(reducer, keys)
+        self.memory_limit = memory_limit
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        stats = kwargs.get('stats')
+        rows, used = sorted_input(rows, self.keys, self.memory_limit, stats)
+        _strategy(stats, 'hash' if used >= 0 else 'sort')
+        yield from self.reduce(rows)
+
+
+class AdaptiveJoin(ops.Join):
+    """Sort tables by keys and join them, see module description"""
+
+    def __init__(self, joiner: ops.Joiner, keys: tp.Sequence[str],
+                 sort_a: bool = True, sort_b: bool = True,
+                 memory_limit: int = MEMORY_LIMIT,
+                 bloom_error_rate: float | None = None,
+                 ordered: bool = True) -> None:
+        """
+        :param joiner: join strategy to use
+        :param keys: keys for sorting and joining
+        :param sort_a: whether rows are not sorted by keys yet
+        :param sort_b: whether joined rows are not sorted by keys yet
+        :param memory_limit: memory for hash tables of both sides
+        :param bloom_error_rate: false positive rate of Bloom filter of
+         joined keys pruning rows, None to not filter
+        :param ordered: whether output must come in order of keys; if
+         not, unsorted rows are joined with joined rows in memory as they
+         come, see module description
+        """
+        super().__init__(joiner, keys, bloom_error_rate)
+        self.sort_a = sort_a
+        self.sort_b = sort_b
+        self.memory_limit = memory_limit
+        self.ordered = ordered
+
+    def _prunes(self) -> bool:
+        """Whether rows without joined rows are dropped by the joiner and
+        can be filtered out before sorting"""
+        return self.bloom_error_rate is not None and self.sort_a and \
+            self.sort_b and \
+            isinstance(self.joiner, (ops.InnerJoiner, ops.RightJoiner))
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        stats = kwargs.get('stats')
+        rows_a, rows_b = rows, args[0]
+        limit = self.memory_limit
+        in_memory = 0
+        joined_keys = None
+        if self._prunes():
+            assert self.bloom_error_rate is not None
+            joined_keys = bloom.BloomFilter(self.bloom_error_rate)
+            rows_b = bloom.collect(rows_b, itemgetter(*self.keys),
+                                   joined_keys)
+        if self.sort_b:
+            groups, used, granted, rest = _group(rows_b, self.keys, limit)
+            if rest is not None:
+                rows_b = _external(groups, rest, self.keys, stats)
+                if joined_keys is not None:
+                    # the external sort reads all rows on the first one
+                    rows_b = iter(rows_b)
+                    rows_b = chain(list(islice(rows_b, 1)), rows_b)
+            elif self.sort_a and not self.ordered and self._fits(groups):
+                _strategy(stats, 'broadcast')
+                yield from self._probe(rows_a, groups, granted)
+                return
+            else:
+                rows_b = _in_order(groups, budget.active(), granted)
+                limit -= used
+                in_memory += 1
+        if joined_keys is not None:
+            rows_a = bloom.prune(rows_a, itemgetter(*self.keys),
+                                 joined_keys, stats)
+        if self.sort_a:
+            rows_a, used = sorted_input(rows_a, self.keys, limit, stats)
+            in_memory += used >= 0
+        _strategy(stats, ('sort-merge', 'hash+sort', 'hash')[in_memory])
+        yield from self._merge(rows_a, rows_b)
+
+    def _fits(self, groups: dict[tp.Any, list[ops.TRow]]) -> bool:
+        """Whether no joined group is spilled by the joiner, so each row
+        is joined with its group in the same order as after sorting"""
+        spill_rows = self.joiner.spill_rows
+        return spill_rows is None or \
+            all(len(group) <= spill_rows for group in groups.values())
+
+    def _probe(self, rows: ops.TRowsIterable,
+               groups: dict[tp.Any, list[ops.TRow]],
+               granted: int) -> ops.TRowsGenerator:
+        """Join rows in any order with joined rows grouped by keys, then
+        pass joined groups never met to the joiner"""
+        memory = budget.active()
+        met = set()
+        try:
+            for value, group in groupby(rows, key=itemgetter(*self.keys)):
+                joined = groups.get(value)
+                if joined is not None:
+                    met.add(value)
+                yield from self.joiner(self.keys, group, joined or [])
+            for value, joined in groups.items():
+                if value not in met:
+                    yield from self.joiner(self.keys, [], joined)
+        finally:
+            if memory is not None:
+                memory.release(granted)
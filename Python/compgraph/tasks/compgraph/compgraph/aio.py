@@ -0,0 +1,151 @@
+"""
+Running graphs from asyncio code.
+
+Operations of a graph are blocking generators, so the graph runs in a
+thread of its own, with external sorts in their worker processes as
+usual, and the event loop only passes rows in and out:
+
+- async sources are read by the loop by batches the graph thread asks
+  for; a batch holds rows available without waiting, so rows of a slow
+  stream are not held back;
+- output rows are sent to the loop by batches through a bounded queue,
+  the graph thread waits while it is full, so a slow consumer stops
+  reading of sources.
+"""
+import asyncio
+import contextvars
+import inspect
+import threading
+import typing as tp
+
+from . import operations as ops
+from . import pipeline
+
+if tp.TYPE_CHECKING:
+    from .graph import Graph, RunOptions
+
+# Rows of an async source the graph thread asks for at once
+SOURCE_BATCH = 1024
+
+
+class _AsyncSource:
+    """Async iterable read by a thread outside of the event loop"""
+
+    def __init__(self, rows: tp.AsyncIterable[ops.TRow],
+                 loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self._iterator = aiter(rows)
+        self._next: asyncio.Future[ops.TRow] | None = None
+        self._finished = False
+
+    async def _take(self, count: int) -> list[ops.TRow]:
+        """Wait for a row and take those following it without waiting"""
+        rows: list[ops.TRow] = []
+        while len(rows) < count and not self._finished:
+            if self._next is None:
+                self._next = asyncio.ensure_future(anext(self._iterator))
+                if rows:
+                    # let it run once, the row may be there already
+                    await asyncio.sleep(0)
+            if rows and not self._next.done():
+                break
+            try:
+                rows.append(await self._next)
+            except StopAsyncIteration:
+                self._finished = True
+            finally:
+                if self._next.done():
+                    self._next = None
+        return rows
+
+    def cancel(self) -> None:
+        """Stop waiting for a row, called in the loop"""
+        if self._next is not None:
+            self._next.cancel()
+
+    def __iter__(self) -> ops.TRowsGenerator:
+        while True:
+            rows = asyncio.run_coroutine_threadsafe(
+                self._take(SOURCE_BATCH), self.loop).result()
+            if not rows:
+                return
+            yield from rows
+
+
+def _source(value: tp.Any, loop: asyncio.AbstractEventLoop,
+            opened: list[_AsyncSource]) -> tp.Any:
+    """Factory of blocking iterables for ReadIterFactory from an async
+    iterable, a factory of them or of awaitables of them"""
+    def bridge(rows: tp.Any) -> tp.Any:
+        if not hasattr(rows, '__aiter__'):
+            return rows
+        source = _AsyncSource(rows, loop)
+        opened.append(source)
+        return iter(source)
+
+    if hasattr(value, '__aiter__'):
+        return lambda: bridge(value)
+    if not callable(value):
+        return value
+
+    def factory() -> tp.Any:
+        rows = value()
+        if inspect.isawaitable(rows):
+            rows = asyncio.run_coroutine_threadsafe(
+                _awaited(rows), loop).result()
+        return bridge(rows)
+    return factory
+
+
+async def _awaited(value: tp.Awaitable[tp.Any]) -> tp.Any:
+    return await value
+
+
+async def run(graph: 'Graph', options: 'RunOptions | None',
+              sources: dict[str, tp.Any],
+              queue_batches: int = pipeline.QUEUE_BATCHES
+              ) -> tp.AsyncGenerator[ops.TRow, None]:
+    """Run graph in a thread, see module description
+    :param graph: graph to run
+    :param options: options of the run, defaults if None
+    :param sources: sources by name, async ones included
+    :param queue_batches: batches of output rows sent ahead at most
+    """
+    loop = asyncio.get_running_loop()
+    channel: asyncio.Queue[tp.Any] = asyncio.Queue(queue_batches)
+    stop = threading.Event()
+    opened: list[_AsyncSource] = []
+    blocking = {name: _source(value, loop, opened)
+                for name, value in sources.items()}
+
+    def put(item: tp.Any) -> bool:
+        if stop.is_set():
+            return False
+        asyncio.run_coroutine_threadsafe(channel.put(item), loop).result()
+        return True
+
+    def produce() -> None:
+        try:
+            rows = graph.run(options, **blocking)
+        except BaseException as error:
+            put(pipeline.Failed(error))
+            return
+        pipeline.send_batches(rows, put)
+
+    context = contextvars.copy_context()
+    producer = threading.Thread(target=context.run, args=(produce,),
+                                name='compgraph-async', daemon=True)
+    producer.start()
+    try:
+        while (batch := pipeline.received(await channel.get())) is not None:
+            for row in batch:
+                yield row
+    finally:
+        stop.set()
+        for source in opened:
+            source.cancel()
+        # the graph thread may wait for room in the queue
+        while producer.is_alive():
+            while not channel.empty():
+                channel.get_nowait()
+            await asyncio.sleep(0.01)
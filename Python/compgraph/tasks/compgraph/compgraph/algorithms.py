@@ -1,6 +1,9 @@
+import typing as tp
 from copy import deepcopy
+from datetime import timedelta
 
-from . import Graph, operations
+from . import Graph, operations, windows
+from .expressions import col, length, side
 
 
 def word_count_graph(input_stream_name: str,
@@ -27,14 +30,13 @@ def inverted_index_graph(input_stream_name: str,
         .map(operations.Split(text_column))
 
     g2 = Graph.graph_from_iter(input_stream_name).reduce(
-        operations.CountRows('doc_count'), [doc_column]).map(
-        operations.Project(["doc_count"]))
+        operations.CountRows('doc_count'), [doc_column])
 
     g3 = deepcopy(g1).sort([doc_column, text_column]).reduce(
         operations.FirstReducer(), [doc_column, text_column]).sort(
-        [text_column]).reduce(operations.Count('count'), [text_column]).join(
-        operations.InnerJoiner(), g2, []).map(
-        operations.Idf('doc_count', 'count'))
+        [text_column]).reduce(operations.Count('count'), [text_column]).map(
+        operations.Idf(side('doc_count'), 'count'),
+        side_inputs={'doc_count': g2.as_scalar('doc_count')})
 
     g4 = deepcopy(g1).sort([doc_column]).reduce(
         operations.TermFrequency(text_column, 'tf'), [doc_column]).sort(
@@ -49,6 +51,22 @@ def inverted_index_graph(input_stream_name: str,
     return g4
 
 
+def term_frequency_graph(input_stream_name: str,
+                         doc_column: str = 'doc_id',
+                         text_column: str = 'text',
+                         result_column: str = 'tf') -> Graph:
+    """Constructs graph which calculates frequency of every word in every
+    document, sorted by words"""
+    return Graph.graph_from_iter(input_stream_name) \
+        .map(operations.FilterPunctuation(text_column)) \
+        .map(operations.LowerCase(text_column)) \
+        .map(operations.Split(text_column)) \
+        .sort([doc_column]) \
+        .reduce(operations.TermFrequency(text_column, result_column),
+                [doc_column]) \
+        .sort([text_column])
+
+
 def pmi_graph(input_stream_name: str,
               doc_column: str = 'doc_id',
               text_column: str = 'text',
@@ -59,24 +77,22 @@ def pmi_graph(input_stream_name: str,
         .map(operations.Split(text_column)).sort(
         [doc_column, text_column]).reduce(
         operations.Count("count"), [doc_column, text_column]).map(
-        operations.Filter(
-            lambda x: x['count'] >= 2 and len(x[text_column]) > 4))
+        operations.Filter((col('count') >= 2) &
+                          (length(col(text_column)) > 4)))
 
     g2 = deepcopy(g1).reduce(operations.SumOfAllTable
-                             ('count', 'f_table'), [doc_column]).map(
-        operations.Project(["f_table"]))
+                             ('count', 'f_table'), [doc_column])
 
     g_t = deepcopy(g1).reduce(operations.Sum('count'), [doc_column])
     g3 = deepcopy(g1).join(operations.InnerJoiner(), g_t, [doc_column]).map(
-        operations.Divide('count_1', 'count_2', "freq")).join(
-        operations.InnerJoiner(), g2, []).join(
-        operations.InnerJoiner(), g1, [doc_column, text_column]).sort(
-        [text_column])  # (freq, f_tabel, count, text_column, doc_column)
+        operations.Divide('count_1', 'count_2', "freq")).sort(
+        [text_column])  # (freq, count_1, count_2, text_column, doc_column)
     #
-    g4 = deepcopy(g1).sort([text_column]).reduce(
+    g4 = g1.sort([text_column]).reduce(
         operations.Sum('count'), [text_column]).join(
         operations.InnerJoiner(), g3, [text_column]).map(
-        operations.Divide('count_1', 'f_table', "freq_in_all")).map(
+        operations.Divide('count', side('f_table'), "freq_in_all"),
+        side_inputs={'f_table': g2.as_scalar('f_table')}).map(
         operations.Pmi('freq', 'freq_in_all')).sort(
         [doc_column]).reduce(
         operations.TopN(result_column, 10), [doc_column]).map(
@@ -133,3 +149,46 @@ def yandex_maps_graph(input_stream_name_time: str,
                       [weekday_result_column, hour_result_column]))
 
     return g_times
+
+
+def yandex_maps_stream_graph(input_stream_name_time: str,
+                             input_stream_name_length: str,
+                             enter_time_column: str = 'enter_time',
+                             leave_time_column: str = 'leave_time',
+                             edge_id_column: str = 'edge_id',
+                             start_coord_column: str = 'start',
+                             end_coord_column: str = 'end',
+                             weekday_result_column: str = 'weekday',
+                             hour_result_column: str = 'hour',
+                             speed_result_column: str = 'speed',
+                             window: tp.Any = timedelta(hours=1),
+                             slide: tp.Any = None,
+                             delay: tp.Any = timedelta(minutes=5)) -> Graph:
+    """Constructs graph which measures average speed in km/h depending on
+    the weekday and hour by windows of leave time. Travel times are read
+    as they come and need not end, edge lengths are held in memory"""
+
+    lengths = Graph.graph_from_iter(input_stream_name_length).map(
+        operations.Haversine(start_coord_column, end_coord_column, "dis")).map(
+        operations.Project([edge_id_column, "dis"])).as_table(
+        [edge_id_column])
+    edge = col(edge_id_column)
+
+    return Graph.graph_from_iter(input_stream_name_time).map(
+        operations.Filter(edge.isin(side('lengths'))),
+        side_inputs={'lengths': lengths}).map(
+        operations.Time(
+            leave_time_column, "%Y%m%dT%H%M%S.%f", "end_time")).map(
+        operations.Time(
+            enter_time_column, "%Y%m%dT%H%M%S.%f", "start_time")).map(
+        operations.WeekAndHour("end_time")).map(
+        operations.Compute([("dis", side('lengths')[edge]["dis"]),
+                            ("delta", col("end_time") - col("start_time"))]),
+        side_inputs={'lengths': lengths}).window(
+        windows.Sums(['dis', "delta"]),
+        [weekday_result_column, hour_result_column], "end_time",
+        window, slide, delay).map(
+        operations.Speed("sum_0", "sum_1", speed_result_column)).map(
+        operations.Project(
+            ['window_start', 'window_end', speed_result_column,
+             hour_result_column, weekday_result_column]))
@@ -0,0 +1,107 @@
+"""
+Bloom filter for semi-join reduction.
+
+A join sorting both of its inputs reads the joined side first. Keys of
+its rows are added to a Bloom filter, and rows of the other side whose
+keys are surely absent are dropped before they are sorted, when the
+joiner would not output them anyway.
+"""
+import math
+import typing as tp
+
+from .statistics import hash64
+
+ERROR_RATE = 0.01
+# Filter is no longer checked if it prunes less than MIN_PRUNED share of
+# the first SAMPLE_ROWS rows
+SAMPLE_ROWS = 10000
+MIN_PRUNED = 0.05
+
+TRow = dict[str, tp.Any]
+TRowsGenerator = tp.Generator[TRow, None, None]
+
+_MASK = (1 << 32) - 1
+
+
+class BloomFilter:
+    """Set of hashable values answering membership with false positives
+    at about the given rate. The filter grows with values added: when
+    full, a larger stage with a lower rate is added (scalable Bloom
+    filter), so the number of values need not be known in advance"""
+
+    def __init__(self, error_rate: float = ERROR_RATE,
+                 capacity: int = 4096) -> None:
+        """
+        :param error_rate: rate of false positives
+        :param capacity: values of the first stage
+        """
+        self.error_rate = error_rate
+        self.count = 0
+        # stages: bits, number of bits, number of hashes, capacity
+        self._stages: list[tuple[bytearray, int, int, int]] = []
+        self._capacity = 0
+        # rates of stages halve, so their sum stays under error_rate
+        self._add_stage(capacity, error_rate / 2)
+
+    def _add_stage(self, capacity: int, rate: float) -> None:
+        size = max(64, int(-capacity * math.log(rate) / math.log(2) ** 2))
+        hashes = max(1, round(size / capacity * math.log(2)))
+        self._stages.append((bytearray((size + 7) // 8), size, hashes,
+                             capacity))
+        self._capacity += capacity
+        self._rate = rate
+
+    def add(self, value: tp.Hashable) -> None:
+        if self.count >= self._capacity:
+            self._add_stage(2 * self._stages[-1][3], self._rate / 2)
+        self.count += 1
+        hashed = hash64(value)
+        first, second = hashed & _MASK, hashed >> 32 | 1
+        bits, size, hashes, _ = self._stages[-1]
+        for index in range(hashes):
+            position = (first + index * second) % size
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: tp.Hashable) -> bool:
+        hashed = hash64(value)
+        first, second = hashed & _MASK, hashed >> 32 | 1
+        for bits, size, hashes, _ in self._stages:
+            for index in range(hashes):
+                position = (first + index * second) % size
+                if not bits[position >> 3] >> (position & 7) & 1:
+                    break
+            else:
+                return True
+        return False
+
+
+def collect(rows: tp.Iterable[TRow], key: tp.Callable[[TRow], tp.Any],
+            bloom: BloomFilter) -> TRowsGenerator:
+    """Pass rows through, adding their keys to filter"""
+    for row in rows:
+        bloom.add(key(row))
+        yield row
+
+
+def prune(rows: tp.Iterable[TRow], key: tp.Callable[[TRow], tp.Any],
+          bloom: BloomFilter, stats: dict[str, tp.Any] | None = None
+          ) -> TRowsGenerator:
+    """Drop rows with keys not in filter, stop checking if few are dropped
+    :param stats: counters to add number of pruned rows to
+    """
+    iterator = iter(rows)
+    pruned = 0
+    checked = 0
+    try:
+        for row in iterator:
+            checked += 1
+            if key(row) in bloom:
+                yield row
+            else:
+                pruned += 1
+            if checked == SAMPLE_ROWS and pruned < MIN_PRUNED * checked:
+                break
+        yield from iterator
+    finally:
+        if stats is not None:
+            stats['bloom_pruned'] = stats.get('bloom_pruned', 0) + pruned
@@ -0,0 +1,200 @@
+"""
+Memory budget of graph runs.
+
+Graph.run(RunOptions(memory_limit=...)) creates a MemoryBudget, or takes
+one to share between several graphs. Operations keeping rows in memory
+ask it for grants and spill rows to temporary files when a grant is
+denied. The budget of the running graph is active while its operations
+produce rows, so joiners and reducers find it by active() without extra
+arguments.
+"""
+import contextvars
+import os
+import sys
+import tempfile
+import threading
+import typing as tp
+
+from . import records
+
+TRow = dict[str, tp.Any]
+TRowsGenerator = tp.Generator[TRow, None, None]
+
+# Size of every SAMPLE-th row is measured and taken for the next ones
+SAMPLE = 64
+# Rows written to a temporary file at once
+BLOCK_ROWS = 1024
+
+_active: contextvars.ContextVar['MemoryBudget | None'] = \
+    contextvars.ContextVar('budget', default=None)
+
+
+def row_size(row: TRow) -> int:
+    """Approximate memory taken by row with its values"""
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row.values()))
+
+
+class MemoryBudget:
+    """Memory operations may take, granted on request"""
+
+    def __init__(self, limit: int) -> None:
+        """
+        :param limit: bytes to grant in total
+        """
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.denied = 0
+        self.spilled_rows = 0
+        self._lock = threading.Lock()
+
+    def available(self) -> int:
+        return max(self.limit - self.used, 0)
+
+    def grant(self, size: int) -> bool:
+        """Take size bytes if available
+        :return: whether memory is granted
+        """
+        with self._lock:
+            if self.used + size > self.limit:
+                self.denied += 1
+                return False
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            return True
+
+    def reserve(self, size: int) -> int:
+        """Take up to size bytes, return bytes granted"""
+        with self._lock:
+            granted = min(size, self.available())
+            self.used += granted
+            self.peak = max(self.peak, self.used)
+            return granted
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self.used -= size
+
+
+def active() -> MemoryBudget | None:
+    """Budget of the graph whose operation is running"""
+    return _active.get()
+
+
+def within(budget: MemoryBudget,
+           rows: tp.Iterable[TRow]) -> TRowsGenerator:
+    """Pass rows through, making budget active while they are produced"""
+    iterator = iter(rows)
+    while True:
+        token = _active.set(budget)
+        try:
+            row = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _active.reset(token)
+        yield row
+
+
+class RowBuffer:
+    """Rows read possibly several times, kept in memory while the budget
+    grants it and in a temporary file after that"""
+
+    def __init__(self, budget: MemoryBudget | None = None,
+                 max_rows: int | None = None) -> None:
+        """
+        :param budget: budget to ask memory from, active one by default
+        :param max_rows: rows to keep in memory at most
+        """
+        self.budget = budget if budget is not None else active()
+        self.max_rows = max_rows
+        self.rows: list[TRow] = []
+        self.granted = 0
+        self._length = 0
+        self._path: str | None = None
+        self._writer: records.RecordWriter | None = None
+
+    def append(self, row: TRow) -> None:
+        self._length += 1
+        if self._writer is None and self.max_rows is not None \
+                and len(self.rows) >= self.max_rows:
+            self.spill()
+        if (self._writer is None and self.budget is not None
+                and len(self.rows) % SAMPLE == 0):
+            size = (row_size(row) + 8) * SAMPLE
+            if self.budget.grant(size):
+                self.granted += size
+            else:
+                self.spill()
+        if self._writer is None:
+            self.rows.append(row)
+            return
+        self._writer.write(row)
+        if self.budget is not None:
+            self.budget.spilled_rows += 1
+
+    def extend(self, rows: tp.Iterable[TRow]) -> 'RowBuffer':
+        for row in rows:
+            self.append(row)
+        return self
+
+    @property
+    def spilled(self) -> bool:
+        return self._path is not None
+
+    def spill(self) -> None:
+        """Move rows to a temporary file, next rows are written there too"""
+        if self._path is not None:
+            return
+        descriptor, self._path = tempfile.mkstemp(prefix='compgraph-',
+                                                  suffix='.rows')
+        self._writer = records.RecordWriter(os.fdopen(descriptor, 'wb'),
+                                            block_rows=BLOCK_ROWS)
+        self._writer.write_rows(self.rows)
+        if self.budget is not None:
+            self.budget.spilled_rows += len(self.rows)
+            self.budget.release(self.granted)
+        self.rows = []
+        self.granted = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> tp.Iterator[TRow]:
+        if self._path is None:
+            return iter(self.rows)
+        return self._read(self._path)
+
+    def _read(self, path: str) -> TRowsGenerator:
+        assert self._writer is not None
+        self._writer.flush()
+        self._writer.file.flush()
+        with open(path, 'rb') as file:
+            for block in records.RecordReader(file).blocks():
+                yield from block
+
+    def close(self) -> None:
+        """Free memory and remove the file"""
+        if self.budget is not None:
+            self.budget.release(self.granted)
+        self.granted = 0
+        self.rows = []
+        if self._writer is not None:
+            self._writer.file.close()
+            self._writer = None
+        if self._path is not None:
+            os.remove(self._path)
+            self._path = None
+
+    def __enter__(self) -> 'RowBuffer':
+        return self
+
+    def __exit__(self, *args: tp.Any) -> None:
+        self.close()
+
+
+def spill_rows(rows: tp.Iterable[TRow]) -> RowBuffer:
+    """Write rows to a temporary file right away"""
+    buffer = RowBuffer()
+    buffer.spill()
+    return buffer.extend(rows)
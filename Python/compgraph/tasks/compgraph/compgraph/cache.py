@@ -0,0 +1,94 @@
+"""
+Cache of graph results on disk.
+
+Graph.run(RunOptions(cache=ResultCache(directory))) looks the result up
+by the fingerprint of the plan together with paths, sizes and modification
+times of files it reads, or hashes of their contents. A hit streams rows
+of the cached file back without running the graph; on a miss the output
+is written while it is consumed and kept once it is complete.
+
+Files are evicted least recently used first when the cache outgrows its
+size, files left unfinished by runs that stopped once they are stale.
+Graphs reading iterators passed to run are cached only if states of all
+of them are passed as well in RunOptions.input_states, e.g.
+checkpoint.file_state of the file an iterator reads. Plans with some
+state not fingerprinted, see optimizer.fingerprint, are not cached.
+"""
+import os
+import typing as tp
+
+from . import checkpoint
+from . import operations as ops
+from . import optimizer
+from . import records
+
+MiB = 1024 ** 2
+MAX_BYTES = 1024 * MiB
+# Suffix of cached results, apart from checkpoints in the same directory
+SUFFIX = '.result'
+
+
+class ResultCache:
+    """Results of graphs in a directory, see module description"""
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES,
+                 hash_contents: bool = False) -> None:
+        """
+        :param directory: directory of cached results
+        :param max_bytes: size of results kept at most
+        :param hash_contents: identify files read by contents instead of
+         sizes and modification times
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, plan: optimizer.Plan,
+            inputs: tp.Mapping[str, str] | None = None) -> str | None:
+        """Name of the result of plan, None if it can not be cached
+        :param plan: plan with fingerprints
+        :param inputs: states of iterators read by the plan by name
+        """
+        if not plan.fingerprinted:
+            return None
+        states = optimizer.input_states(plan, inputs, self.hash_contents)
+        if states is None:
+            return None
+        return checkpoint.name(plan.nodes[-1].fingerprint, states, SUFFIX)
+
+    def get(self, key: str) -> ops.TRowsGenerator | None:
+        """Cached rows, None on a miss"""
+        path = os.path.join(self.directory, key)
+        try:
+            # the open file is read even if it is evicted meanwhile
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            # modification time orders results by use
+            os.utime(file.fileno())
+        except BaseException:
+            file.close()
+            raise
+        self.hits += 1
+        return _read(file)
+
+    def put(self, key: str,
+            rows: ops.TRowsIterable) -> ops.TRowsGenerator:
+        """Pass rows through, keeping them if all are read"""
+        yield from checkpoint.Checkpoint(
+            os.path.join(self.directory, key))(rows)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used results beyond the size and stale
+        unfinished ones"""
+        checkpoint.evict(self.directory, SUFFIX, self.max_bytes)
+
+
+def _read(file: tp.BinaryIO) -> ops.TRowsGenerator:
+    with file:
+        yield from records.RecordReader(file)
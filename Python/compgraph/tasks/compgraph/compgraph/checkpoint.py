@@ -0,0 +1,172 @@
+"""
+Checkpoints: outputs of stages kept on disk to resume failed runs.
+
+Graph.run(RunOptions(checkpoint_dir=...)) writes outputs of stages marked
+by Graph.checkpoint(), or of all sorts, joins and sorting reduces if none
+are marked, to files in the record format. A file is named by the
+fingerprint of the plan up to the stage together with sizes and times of
+files read by the plan, and appears only when the stage has produced all
+its rows. A rerun starts every plan from its deepest existing checkpoint
+instead of recomputing the operations before it.
+
+Rows from iterators passed to run are not seen in file names, so plans
+reading them are checkpointed only if states of all of them are passed as
+well in RunOptions.input_states, e.g. versions of data they give.
+
+Checkpoints are evicted as cached results are: once a checkpoint is
+written, least recently used ones beyond RunOptions.checkpoint_bytes are
+removed from the directory. A checkpoint a run resumes from counts as used
+when the run starts, so it goes only if new checkpoints alone outgrow the
+size.
+"""
+import hashlib
+import os
+import tempfile
+import time
+import typing as tp
+
+from . import operations as ops
+from . import records
+
+SUFFIX = '.rows'
+MAX_BYTES = 1024 ** 3
+# Suffix of files being written, named by the file they become
+PARTIAL = '.partial'
+# Seconds after which a partial file is no longer being written
+STALE_SECONDS = 24 * 3600
+
+
+def name(fingerprint: str, sources: str, suffix: str = SUFFIX) -> str:
+    """File name of the checkpoint of a stage
+    :param fingerprint: fingerprint of the plan up to the stage
+    :param sources: state of files the plan reads, see source_state
+    :param suffix: suffix of the file
+    """
+    return hashlib.sha1((fingerprint + sources).encode()).hexdigest() + \
+        suffix
+
+
+def file_state(path: str, contents: bool = False) -> str:
+    """Path, size and modification time of a file, or its path and hash
+    of contents
+    """
+    try:
+        if contents:
+            digest = hashlib.sha1()
+            with open(path, 'rb') as file:
+                while chunk := file.read(1 << 20):
+                    digest.update(chunk)
+            return f'{path}:{digest.hexdigest()}'
+        stat = os.stat(path)
+    except OSError:
+        return f'{path}:missing'
+    return f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def source_state(source: ops.Operation, contents: bool = False) -> str:
+    """State of a file read, see file_state, name of an iterator
+    :param contents: hash contents of files
+    """
+    if isinstance(source, ops.Read):
+        return file_state(source.filename, contents)
+    return getattr(source, 'name', '')
+
+
+def evict(directory: str, suffix: str, max_bytes: int,
+          stale_seconds: float = STALE_SECONDS) -> None:
+    """Remove least recently modified files with suffix in directory
+    beyond max_bytes in total, and their partial files gone stale
+    :param directory: directory of the files
+    :param suffix: suffix of the files, others are left alone
+    :param max_bytes: size of the files kept at most
+    :param stale_seconds: age of partial files to remove
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    stale = time.time() - stale_seconds
+    files = []
+    for entry in entries:
+        partial = suffix + '.' in entry.name and \
+            entry.name.endswith(PARTIAL)
+        if not partial and not entry.name.endswith(suffix):
+            continue
+        try:
+            stat = entry.stat()
+            if not partial:
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            elif stat.st_mtime < stale:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # removed or finished by another run meanwhile
+            pass
+    total = 0
+    for _, size, path in sorted(files, reverse=True):
+        total += size
+        if total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class Checkpoint(ops.Operation):
+    """Pass rows through, writing them to path if it is set; the file
+    appears once all rows are passed and older checkpoints are evicted"""
+
+    def __init__(self, path: str | None = None,
+                 max_bytes: int = MAX_BYTES) -> None:
+        """
+        :param path: file to write, nothing is written if None
+        :param max_bytes: size of checkpoints kept in its directory at most
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def required_columns(self, columns: ops.TColumns) -> set[str] | None:
+        return set(columns) if columns is not None else None
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        if self.path is None:
+            yield from rows
+            return
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        descriptor, partial = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(self.path) + '.',
+            suffix=PARTIAL)
+        written = False
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                with records.RecordWriter(file) as writer:
+                    for row in rows:
+                        # consumers may change rows before they are written
+                        writer.write(dict(row))
+                        yield row
+            os.replace(partial, self.path)
+            written = True
+        finally:
+            if not written:
+                os.remove(partial)
+        evict(directory, SUFFIX, self.max_bytes)
+        stats = kwargs.get('stats')
+        if stats is not None:
+            stats['checkpoint_bytes'] = writer.bytes_written
+
+
+class ReadCheckpoint(ops.Read):
+    """Read rows of a stage from its checkpoint"""
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: checkpoint file
+        """
+        # rows are decoded from records, not parsed from lines
+        super().__init__(path, parser=lambda line: {})
+        # modification time orders checkpoints by use
+        os.utime(path)
+
+    def _parse(self) -> ops.TRowsGenerator:
+        yield from records.read_records(self.filename)
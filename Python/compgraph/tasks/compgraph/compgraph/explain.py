@@ -0,0 +1,76 @@
+"""
+Text description of a graph plan, see Graph.explain.
+
+Operations are listed in order of execution, plans of joined graphs and
+side inputs are indented above operations consuming them. A plan starting
+with a computation already listed is shown by a reference to it: such a
+shared sub-graph is computed again for every use, but for a side input
+passed to several maps, which is computed once.
+"""
+import typing as tp
+
+from . import operations as ops
+from . import optimizer
+from . import profiler
+
+
+def render(plan: optimizer.Plan,
+           stages: list[profiler.Stage] | None = None) -> str:
+    """Describe plan with estimated rows of every operation
+    :param plan: plan with fingerprints and estimated rows
+    :param stages: stages of profiled run of the plan to show observed
+     rows and self time
+    """
+    header = f'{"id":>4}  {"operation":<52} {"strategy":<20} {"est rows":>10}'
+    if stages is not None:
+        header += f' {"rows":>10} {"time, s":>9}'
+    lines = [header]
+    _render(plan, stages, 0, {}, set(), lines)
+    return '\n'.join(lines)
+
+
+def _line(number: str, name: str, strategy: str, node: optimizer.Node,
+          stage: profiler.Stage | None) -> str:
+    line = f'{number:>4}  {name:<52} {strategy:<20} {node.rows:>10.0f}'
+    if stage is not None:
+        line += f' {stage.rows_out:>10} {stage.wall:>9.3f}'
+    return line
+
+
+def _render(plan: optimizer.Plan, stages: list[profiler.Stage] | None,
+            depth: int, seen: dict[str, int], side_inputs: set[int],
+            lines: list[str], reused: bool = False) -> None:
+    indent = '  ' * depth
+    start = 0
+    for position in reversed(range(len(plan.nodes))):
+        node = plan.nodes[position]
+        if node.fingerprint in seen:
+            first = seen[plan.nodes[0].fingerprint]
+            # a side input computed once has no stages of its own
+            stage = stages[position] if stages else None
+            lines.append(_line(
+                '', f'{indent}= #{first}..#{seen[node.fingerprint]}',
+                'shared, computed once' if reused else 'shared, recomputed',
+                node, stage))
+            start = position + 1
+            break
+
+    for position in range(start, len(plan.nodes)):
+        node = plan.nodes[position]
+        stage = stages[position] if stages is not None else None
+        inputs: list[tp.Any] = [None] * len(node.inputs)
+        if stage is not None:
+            inputs = stage.inputs + stage.side_inputs
+        side = node.operation.side_inputs.values() \
+            if isinstance(node.operation, ops.Map) else [None] * len(inputs)
+        for joined, joined_stages, side_input in zip(node.inputs, inputs,
+                                                     side):
+            _render(joined, joined_stages, depth + 1, seen, side_inputs,
+                    lines, id(side_input) in side_inputs)
+            if side_input is not None:
+                side_inputs.add(id(side_input))
+        number = len(seen) + 1
+        seen.setdefault(node.fingerprint, number)
+        lines.append(_line(f'#{number}',
+                           indent + optimizer.describe(node.operation),
+                           optimizer.strategy(node.operation), node, stage))
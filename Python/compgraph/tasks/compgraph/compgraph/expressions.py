@@ -0,0 +1,400 @@
+"""
+Column expressions compiled into plain Python functions.
+
+    >>> condition = (col('count') >= 2) & (length(col('text')) > 4)
+    >>> condition({'count': 3, 'text': 'hello'})
+    True
+
+Expressions know the columns they depend on, so filters and mappers built
+from them can be moved and fused by the optimizer.
+"""
+import math
+import typing as tp
+from abc import ABC, abstractmethod
+
+TRow = dict[str, tp.Any]
+TFunction = tp.Callable[[TRow], tp.Any]
+
+FUNCTIONS: dict[str, tp.Callable[..., tp.Any]] = {
+    'log': math.log,
+    'exp': math.exp,
+    'sqrt': math.sqrt,
+    'length': len,
+    'lower': str.lower,
+    'abs': abs,
+}
+
+
+class _Code:
+    """Collects constants referenced by generated source"""
+
+    def __init__(self, side: tp.Mapping[str, tp.Any] | None = None) -> None:
+        self.namespace: dict[str, tp.Any] = {
+            f'_{name}': function for name, function in FUNCTIONS.items()}
+        self.namespace['side'] = self.side = side if side is not None else {}
+
+    def constant(self, value: tp.Any) -> str:
+        name = f'_k{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+
+class Expression(ABC):
+    """Base class for column expressions"""
+
+    def __init__(self) -> None:
+        self._function: TFunction | None = None
+
+    @property
+    @abstractmethod
+    def columns(self) -> frozenset[str]:
+        """Columns the expression depends on"""
+        pass
+
+    @abstractmethod
+    def source(self, code: _Code) -> str:
+        """Python source computing the expression from `row`"""
+        pass
+
+    def compile(self, side: tp.Mapping[str, tp.Any] | None = None
+                ) -> TFunction:
+        """Fused Python function computing expression for a row
+        :param side: values of side inputs used by expression
+        """
+        if side is not None:
+            code = _Code(side)
+            return tp.cast(TFunction, eval(f'lambda row: {self.source(code)}',
+                                           code.namespace))
+        if self._function is None:
+            code = _Code()
+            self._function = eval(f'lambda row: {self.source(code)}',
+                                  code.namespace)
+        return self._function
+
+    def __call__(self, row: TRow) -> tp.Any:
+        return self.compile()(row)
+
+    def __getstate__(self) -> dict[str, tp.Any]:
+        state = self.__dict__.copy()
+        state['_function'] = None
+        return state
+
+    def __bool__(self) -> bool:
+        raise TypeError('Use & | ~ to combine conditions')
+
+    __hash__ = object.__hash__
+
+    def __add__(self, other: tp.Any) -> 'Expression':
+        return Binary('+', self, other)
+
+    def __radd__(self, other: tp.Any) -> 'Expression':
+        return Binary('+', other, self)
+
+    def __sub__(self, other: tp.Any) -> 'Expression':
+        return Binary('-', self, other)
+
+    def __rsub__(self, other: tp.Any) -> 'Expression':
+        return Binary('-', other, self)
+
+    def __mul__(self, other: tp.Any) -> 'Expression':
+        return Binary('*', self, other)
+
+    def __rmul__(self, other: tp.Any) -> 'Expression':
+        return Binary('*', other, self)
+
+    def __truediv__(self, other: tp.Any) -> 'Expression':
+        return Binary('/', self, other)
+
+    def __rtruediv__(self, other: tp.Any) -> 'Expression':
+        return Binary('/', other, self)
+
+    def __floordiv__(self, other: tp.Any) -> 'Expression':
+        return Binary('//', self, other)
+
+    def __mod__(self, other: tp.Any) -> 'Expression':
+        return Binary('%', self, other)
+
+    def __pow__(self, other: tp.Any) -> 'Expression':
+        return Binary('**', self, other)
+
+    def __neg__(self) -> 'Expression':
+        return Unary('-', self)
+
+    def __abs__(self) -> 'Expression':
+        return Call('abs', self)
+
+    def __eq__(self, other: tp.Any) -> 'Expression':  # type: ignore
+        return Binary('==', self, other)
+
+    def __ne__(self, other: tp.Any) -> 'Expression':  # type: ignore
+        return Binary('!=', self, other)
+
+    def __lt__(self, other: tp.Any) -> 'Expression':
+        return Binary('<', self, other)
+
+    def __le__(self, other: tp.Any) -> 'Expression':
+        return Binary('<=', self, other)
+
+    def __gt__(self, other: tp.Any) -> 'Expression':
+        return Binary('>', self, other)
+
+    def __ge__(self, other: tp.Any) -> 'Expression':
+        return Binary('>=', self, other)
+
+    def __and__(self, other: tp.Any) -> 'Expression':
+        return Binary('and', self, other)
+
+    def __rand__(self, other: tp.Any) -> 'Expression':
+        return Binary('and', other, self)
+
+    def __or__(self, other: tp.Any) -> 'Expression':
+        return Binary('or', self, other)
+
+    def __ror__(self, other: tp.Any) -> 'Expression':
+        return Binary('or', other, self)
+
+    def __invert__(self) -> 'Expression':
+        return Unary('not ', self)
+
+    def __getitem__(self, key: tp.Any) -> 'Expression':
+        return Item(self, key)
+
+    def isin(self, values: tp.Iterable[tp.Any] | 'Expression'
+             ) -> 'Expression':
+        if isinstance(values, Expression):
+            # e.g. keys of a side input table
+            return Binary('in', self, values)
+        return Binary('in', self, Literal(frozenset(values)))
+
+    @property
+    def side_inputs(self) -> frozenset[str]:
+        """Side inputs the expression depends on"""
+        return frozenset()
+
+
+class Column(Expression):
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return frozenset([self.name])
+
+    def source(self, code: _Code) -> str:
+        return f'row[{self.name!r}]'
+
+    def __repr__(self) -> str:
+        return f'col({self.name!r})'
+
+
+class Side(Expression):
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return frozenset()
+
+    @property
+    def side_inputs(self) -> frozenset[str]:
+        return frozenset([self.name])
+
+    def source(self, code: _Code) -> str:
+        if self.name in code.side:
+            return code.constant(code.side[self.name])
+        return f'side[{self.name!r}]'
+
+    def __repr__(self) -> str:
+        return f'side({self.name!r})'
+
+
+class Literal(Expression):
+    def __init__(self, value: tp.Any) -> None:
+        super().__init__()
+        self.value = value
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return frozenset()
+
+    def source(self, code: _Code) -> str:
+        if self.value is None or type(self.value) in (bool, int, str):
+            return repr(self.value)
+        return code.constant(self.value)
+
+    def __repr__(self) -> str:
+        if isinstance(self.value, (set, frozenset)):
+            try:
+                # the same text whatever the hash seed
+                return f'{{{", ".join(map(repr, sorted(self.value)))}}}'
+            except TypeError:
+                pass
+        return repr(self.value)
+
+
+class Unary(Expression):
+    def __init__(self, operator: str, operand: tp.Any) -> None:
+        super().__init__()
+        self.operator = operator
+        self.operand = as_expression(operand)
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return self.operand.columns
+
+    @property
+    def side_inputs(self) -> frozenset[str]:
+        return self.operand.side_inputs
+
+    def source(self, code: _Code) -> str:
+        return f'({self.operator}{self.operand.source(code)})'
+
+    def __repr__(self) -> str:
+        operator = '~' if self.operator == 'not ' else self.operator
+        return f'{operator}{self.operand!r}'
+
+
+class Binary(Expression):
+    def __init__(self, operator: str, left: tp.Any, right: tp.Any) -> None:
+        super().__init__()
+        self.operator = operator
+        self.left = as_expression(left)
+        self.right = as_expression(right)
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return self.left.columns | self.right.columns
+
+    @property
+    def side_inputs(self) -> frozenset[str]:
+        return self.left.side_inputs | self.right.side_inputs
+
+    def source(self, code: _Code) -> str:
+        return (f'({self.left.source(code)} {self.operator} '
+                f'{self.right.source(code)})')
+
+    def __repr__(self) -> str:
+        operator = {'and': '&', 'or': '|'}.get(self.operator, self.operator)
+        return f'({self.left!r} {operator} {self.right!r})'
+
+
+class Call(Expression):
+    def __init__(self, function: str, *arguments: tp.Any) -> None:
+        super().__init__()
+        if function not in FUNCTIONS:
+            raise ValueError(f'Unknown function {function}')
+        self.function = function
+        self.arguments = [as_expression(arg) for arg in arguments]
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return frozenset().union(*(arg.columns for arg in self.arguments))
+
+    @property
+    def side_inputs(self) -> frozenset[str]:
+        return frozenset().union(*(arg.side_inputs
+                                   for arg in self.arguments))
+
+    def source(self, code: _Code) -> str:
+        arguments = ', '.join(arg.source(code) for arg in self.arguments)
+        return f'_{self.function}({arguments})'
+
+    def __repr__(self) -> str:
+        arguments = ', '.join(repr(arg) for arg in self.arguments)
+        return f'{self.function}({arguments})'
+
+
+class Item(Expression):
+    def __init__(self, container: tp.Any, key: tp.Any) -> None:
+        super().__init__()
+        self.container = as_expression(container)
+        self.key = as_expression(key)
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return self.container.columns | self.key.columns
+
+    @property
+    def side_inputs(self) -> frozenset[str]:
+        return self.container.side_inputs | self.key.side_inputs
+
+    def source(self, code: _Code) -> str:
+        return f'{self.container.source(code)}[{self.key.source(code)}]'
+
+    def __repr__(self) -> str:
+        return f'{self.container!r}[{self.key!r}]'
+
+
+def as_expression(value: tp.Any) -> Expression:
+    """Wrap value into expression if it is not one"""
+    if isinstance(value, Expression):
+        return value
+    return Literal(value)
+
+
+def as_column(value: str | Expression) -> Expression:
+    """Treat strings as column names, keep expressions as they are"""
+    if isinstance(value, str):
+        return Column(value)
+    return value
+
+
+def conjuncts(expression: Expression) -> list[Expression]:
+    """Split expression combined by & into independent conditions"""
+    if isinstance(expression, Binary) and expression.operator == 'and':
+        return conjuncts(expression.left) + conjuncts(expression.right)
+    return [expression]
+
+
+def compile_assignments(assignments: tp.Sequence[tuple[str, Expression]],
+                        side: tp.Mapping[str, tp.Any] | None = None
+                        ) -> tp.Callable[[TRow], None]:
+    """Fuse assignments into one function setting row columns in order,
+    so later expressions see values set by earlier ones
+    :param assignments: result columns with expressions computing them
+    :param side: values of side inputs used by expressions
+    """
+    code = _Code(side)
+    lines = ['def _assign(row):']
+    for column, expression in assignments:
+        lines.append(f'    row[{column!r}] = {expression.source(code)}')
+    lines.append('    return None')
+    exec('\n'.join(lines), code.namespace)
+    return tp.cast(tp.Callable[[TRow], None], code.namespace['_assign'])
+
+
+def col(name: str) -> Expression:
+    """Value of the column"""
+    return Column(name)
+
+
+def side(name: str) -> Expression:
+    """Value of the side input passed to the mapper"""
+    return Side(name)
+
+
+def lit(value: tp.Any) -> Expression:
+    """Constant value"""
+    return Literal(value)
+
+
+def log(value: tp.Any) -> Expression:
+    return Call('log', value)
+
+
+def exp(value: tp.Any) -> Expression:
+    return Call('exp', value)
+
+
+def sqrt(value: tp.Any) -> Expression:
+    return Call('sqrt', value)
+
+
+def length(value: tp.Any) -> Expression:
+    return Call('length', value)
+
+
+def lower(value: tp.Any) -> Expression:
+    return Call('lower', value)
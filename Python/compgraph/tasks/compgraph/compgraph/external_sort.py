@@ -1,22 +1,147 @@
+import heapq
+import time
 import typing as tp
 
+from itertools import chain, islice
 from multiprocessing import Pipe, Process, connection
 from operator import itemgetter
 
+from . import budget
 from . import operations as ops
+from . import profiler
+from . import records
+from . import sortkeys
 
+BLOCK_ROWS = 1024
+# rows of a spilled run at least, however small the worker's grant is
+RUN_ROWS = 16 * BLOCK_ROWS
+# runs merged at once, a merge keeps a file of each open
+MERGE_RUNS = 64
 
-def do_sort(endpoint: connection.Connection, keys: tuple[str, ...]) -> None:
-    rows = []
+
+def _send_rows(endpoint: connection.Connection,
+               rows: tp.Iterable[ops.TRow]) -> tuple[int, int]:
+    """Send rows in blocks, return numbers of rows and bytes sent"""
+    block: list[ops.TRow] = []
+    sent = 0
+    size = 0
+    for row in rows:
+        block.append(row)
+        if len(block) >= BLOCK_ROWS:
+            payload = records.pack_block(block)
+            endpoint.send_bytes(payload)
+            sent += len(block)
+            size += len(payload)
+            block = []
+    if block:
+        payload = records.pack_block(block)
+        endpoint.send_bytes(payload)
+        sent += len(block)
+        size += len(payload)
+    endpoint.send_bytes(b'')
+    return sent, size
+
+
+def _recv_blocks(endpoint: connection.Connection
+                 ) -> tp.Generator[bytes, None, None]:
     while True:
-        row = endpoint.recv()
-        if row is None:
+        block = endpoint.recv_bytes()
+        if not block:
             break
-        rows.append(row)
-    rows.sort(key=itemgetter(*keys))
-    for row in rows:
-        endpoint.send(row)
-    endpoint.send(None)
+        yield block
+
+
+def sort_rows(rows: list[ops.TRow], keys: tp.Sequence[str],
+              key: tp.Callable[[ops.TRow], tp.Any]
+              ) -> tp.Callable[[ops.TRow], tp.Any]:
+    """Sort rows in place by key, by plain keys if values of some keys
+    can not be encoded
+    :return: key rows are sorted by
+    """
+    try:
+        rows.sort(key=key)
+    except TypeError:
+        plain = itemgetter(*keys)
+        if key is plain:
+            raise
+        key = plain
+        rows.sort(key=key)
+    return key
+
+
+def _merge_runs(runs: list[budget.RowBuffer],
+                key: tp.Callable[[ops.TRow], tp.Any]) -> budget.RowBuffer:
+    """Merge sorted runs into one spilled run and remove them"""
+    try:
+        return budget.spill_rows(heapq.merge(*runs, key=key))
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _add_run(levels: list[list[budget.RowBuffer]], run: budget.RowBuffer,
+             key: tp.Callable[[ops.TRow], tp.Any], merge_runs: int) -> None:
+    """Add a run to the first level, a full level is merged into a run
+    of the next one"""
+    for level in levels:
+        level.append(run)
+        if len(level) < merge_runs:
+            return
+        run = _merge_runs(level[:], key)
+        level.clear()
+    levels.append([run])
+
+
+def do_sort(endpoint: connection.Connection, keys: tuple[str, ...],
+            memory_limit: int | None = None,
+            encode_keys: bool = False,
+            run_rows: int = RUN_ROWS,
+            merge_runs: int = MERGE_RUNS) -> None:
+    """Sort rows received from endpoint and send them back
+    :param memory_limit: memory for rows, sorted runs of rows exceeding
+     it are spilled to temporary files and merged, None if unlimited
+    :param encode_keys: compare keys encoded into bytes
+    :param run_rows: rows of a spilled run at least
+    :param merge_runs: runs merged at once, at least 2
+    """
+    key: tp.Callable[[ops.TRow], tp.Any] = \
+        sortkeys.encoder(keys) if encode_keys else itemgetter(*keys)
+    rows: list[ops.TRow] = []
+    levels: list[list[budget.RowBuffer]] = [[]]
+    spilled = 0
+    used = 0
+    try:
+        for payload in _recv_blocks(endpoint):
+            block = records.unpack_block(payload)
+            rows.extend(block)
+            if memory_limit is None:
+                continue
+            used += (budget.row_size(block[0]) + 8) * len(block)
+            if used > memory_limit and len(rows) >= run_rows:
+                key = sort_rows(rows, keys, key)
+                _add_run(levels, budget.spill_rows(rows), key, merge_runs)
+                spilled += 1
+                rows = []
+                used = 0
+        key = sort_rows(rows, keys, key)
+        depth = len(levels)
+        # runs of higher levels are older, merging adjacent runs in order
+        # keeps equal rows in order of arrival
+        runs = [run for level in reversed(levels) for run in level]
+        levels = [runs]
+        while len(runs) >= merge_runs:
+            runs.append(_merge_runs(runs[-merge_runs:], key))
+            del runs[-merge_runs - 1:-1]
+        _send_rows(endpoint,
+                   heapq.merge(*runs, rows, key=key) if runs else rows)
+    finally:
+        for level in levels:
+            for run in level:
+                run.close()
+    endpoint.send({'worker_cpu': time.process_time(),
+                   'worker_peak_memory': profiler.peak_rss(),
+                   'worker_spilled_runs': spilled,
+                   'worker_merge_levels': depth})
 
 
 class ExternalSort(ops.Operation):
@@ -25,28 +150,80 @@ class ExternalSort(ops.Operation):
      in main process memory consumption, we delegate
     sorting to a separate process.
     This class illustrates cross-process streaming.
+    Rows travel through the pipe in record format blocks.
+    Sizes of the blocks and resources used by the worker are added to
+    `stats` if it is passed.
+    Inputs known to be small may be sorted in process, skipping the worker.
+    Keys may be compared encoded into bytes (see sortkeys), which is
+    faster for composite and string keys.
+    Under a memory budget the worker spills sorted runs over its grant
+    to temporary files and merges them.
+    Runs have run_rows rows at least, even if the grant is smaller, and
+    are merged merge_runs at a time in levels, so the files open at once
+    stay bounded.
     """
 
-    def __init__(self, keys: tp.Sequence[str]):
+    def __init__(self, keys: tp.Sequence[str], memory_rows: int = 0,
+                 encode_keys: bool = False, run_rows: int = RUN_ROWS,
+                 merge_runs: int = MERGE_RUNS):
+        """
+        :param keys: sorting keys
+        :param memory_rows: sort in process if input has at most
+         this many rows
+        :param encode_keys: compare keys encoded into bytes
+        :param run_rows: rows of a spilled run at least
+        :param merge_runs: runs merged at once, at least 2
+        """
+        assert merge_runs >= 2
         self.keys = keys
+        self.memory_rows = memory_rows
+        self.encode_keys = encode_keys
+        self.run_rows = run_rows
+        self.merge_runs = merge_runs
+
+    def required_columns(self, columns: ops.TColumns) -> set[str] | None:
+        if columns is None:
+            return None
+        return set(columns) | set(self.keys)
 
     def __call__(self, rows: ops.TRowsIterable,
                  *args: tp.Any,
                  **kwargs: tp.Any) -> ops.TRowsGenerator:
+        if self.memory_rows:
+            rows = iter(rows)
+            head = list(islice(rows, self.memory_rows + 1))
+            if len(head) <= self.memory_rows:
+                sort_rows(head, self.keys,
+                          sortkeys.encoder(self.keys) if self.encode_keys
+                          else itemgetter(*self.keys))
+                yield from head
+                return
+            rows = chain(head, rows)
+        # the worker takes half of the memory left in the budget
+        memory = budget.active()
+        granted = memory.reserve(memory.available() // 2) \
+            if memory is not None else 0
         local_endpoint, remote_endpoint = Pipe()
-        process = Process(target=do_sort, args=(remote_endpoint, self.keys))
+        process = Process(target=do_sort, args=(
+            remote_endpoint, self.keys,
+            granted if memory is not None else None, self.encode_keys,
+            self.run_rows, self.merge_runs))
         process.start()
-        row_count_before = 0
-        for row in rows:
-            local_endpoint.send(row)
-            row_count_before += 1
-        local_endpoint.send(None)
-        row_count_after = 0
-        while True:
-            local_endpoint_row = local_endpoint.recv()
-            if local_endpoint_row is None:
-                break
-            yield local_endpoint_row
-            row_count_after += 1
-        assert row_count_before == row_count_after
-        process.join()
+        try:
+            row_count_before, pipe_bytes = _send_rows(local_endpoint, rows)
+            row_count_after = 0
+            for payload in _recv_blocks(local_endpoint):
+                block = records.unpack_block(payload)
+                yield from block
+                row_count_after += len(block)
+                pipe_bytes += len(payload)
+            assert row_count_before == row_count_after
+            worker = local_endpoint.recv()
+            process.join()
+        finally:
+            if memory is not None:
+                memory.release(granted)
+        stats = kwargs.get('stats')
+        if stats is not None:
+            stats['pipe_bytes'] = stats.get('pipe_bytes', 0) + pipe_bytes
+            stats.update(worker)
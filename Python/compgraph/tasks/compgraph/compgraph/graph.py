@@ -1,6 +1,106 @@
 import typing as tp
+from functools import partial
+from operator import itemgetter
+
+from . import aio
+from . import bloom
+from . import cache as result_cache
+from . import checkpoint
+from . import budget
 from . import operations as ops
+from . import explain as explain_plan
 from . import external_sort
+from . import optimizer
+from . import parallel
+from . import pipeline as pipeline_stages
+from . import profiler
+from . import skew
+from . import statistics as stats
+from . import windows
+
+
+class SideInput:
+    """Result of a graph passed to mappers by reference instead of joining
+    it to every row: a single value of a column or a lookup table"""
+
+    def __init__(self, graph: 'Graph', column: str | None = None,
+                 keys: tp.Sequence[str] | None = None,
+                 default: tp.Any = None) -> None:
+        """
+        :param graph: graph computing the value
+        :param column: column of the only row to take as a scalar value
+        :param keys: keys to index rows by to get a lookup table
+        :param default: scalar value for graph without rows
+        """
+        self.graph = graph
+        self.column = column
+        self.keys = keys
+        self.default = default
+
+    def required_columns(self) -> ops.TColumns:
+        if self.keys is None and self.column is not None:
+            return {self.column}
+        return None
+
+    def value(self, rows: ops.TRowsIterable) -> tp.Any:
+        """Reduce graph rows to the side input value
+        :param rows: rows of the graph
+        """
+        if self.keys is None:
+            result = self.default
+            for ind, row in enumerate(rows):
+                if ind > 0:
+                    raise ValueError('Scalar side input has more than one row')
+                result = row[self.column] if self.column is not None else row
+            return result
+
+        key = itemgetter(*self.keys)
+        table: dict[tp.Any, ops.TRow] = {}
+        for row in rows:
+            row_key = key(row)
+            if row_key in table:
+                raise ValueError(f'Duplicate key {row_key!r} in side input')
+            table[row_key] = row
+        return table
+
+
+class RunOptions:
+    """Options of a graph run, passed apart from sources so that any name
+    of a source is free"""
+
+    def __init__(self, profile: bool = False,
+                 statistics: stats.Statistics | None = None,
+                 memory_limit: int | budget.MemoryBudget | None = None,
+                 pipeline: bool = False, checkpoint_dir: str | None = None,
+                 cache: result_cache.ResultCache | None = None,
+                 input_states: tp.Mapping[str, str] | None = None,
+                 checkpoint_bytes: int = checkpoint.MAX_BYTES) -> None:
+        """
+        :param profile: count rows, time and memory of every operation,
+         the report is filled in last_profile while rows are consumed
+        :param statistics: statistics of earlier runs to choose strategies
+         by, updated with statistics of this run
+        :param memory_limit: bytes operations may keep rows in, more rows
+         are spilled to disk; a MemoryBudget may be shared by several runs
+        :param pipeline: read sources and send rows to sorts and back in
+         threads, overlapping waits for disk and pipes with computation
+        :param checkpoint_dir: keep outputs of checkpointed stages in this
+         directory and start from the deepest ones kept by earlier runs
+        :param cache: cache to take the result from or to keep it in
+        :param input_states: states of iterator sources by name; results
+         of plans reading iterators are cached and checkpointed only if
+         states of all of them are known
+        :param checkpoint_bytes: size of checkpoints kept in checkpoint_dir
+         at most, least recently used ones are removed first
+        """
+        self.profile = profile
+        self.statistics = statistics
+        self.memory_limit = memory_limit
+        self.pipeline = pipeline
+        self.checkpoint_dir = checkpoint_dir
+        self.cache = cache
+        self.input_states = input_states
+        self.checkpoint_bytes = checkpoint_bytes
 
 
 class Graph:
@@ -9,10 +109,9 @@ class Graph:
     VAR = 0
 
     def __init__(self) -> None:
-        self.rows = None
         self.Operations_sequence: list[tp.Any] = []
         self.joiners: list['Graph'] = []
-        self.i = 0
+        self.last_profile: profiler.Profile | None = None
 
     @staticmethod
     def graph_from_iter(name: str) -> 'Graph':
@@ -40,66 +139,316 @@ class Graph:
         g.Operations_sequence.append(ops.Read(filename, parser))
         return g
 
-    def map(self, mapper: ops.Mapper) -> 'Graph':
+    def map(self, mapper: ops.Mapper,
+            side_inputs: tp.Mapping[str, SideInput] | None = None,
+            workers: int = 0, ordered: bool = True,
+            threads: bool = False) -> 'Graph':
         """Construct new graph extended with map
          operation with particular mapper
         :param mapper: mapper to use
+        :param side_inputs: values computed by other graphs passed to mapper
+         by name, see as_scalar and as_table
+        :param workers: map batches of rows by this many worker processes,
+         in process if 0
+        :param ordered: keep order of rows mapped by workers
+        :param threads: use worker threads, for mappers releasing the GIL
         """
-        self.Operations_sequence.append(ops.Map(mapper))
+        if workers:
+            self.Operations_sequence.append(parallel.ParallelMap(
+                mapper, side_inputs, workers, ordered, threads))
+        else:
+            self.Operations_sequence.append(ops.Map(mapper, side_inputs))
         return self
 
+    def as_scalar(self, column: str | None = None,
+                  default: tp.Any = None) -> SideInput:
+        """Use graph producing at most one row as a side input
+        :param column: column to take value from, whole row if None
+        :param default: value if graph produces no rows
+        """
+        return SideInput(self, column=column, default=default)
+
+    def as_table(self, keys: tp.Sequence[str]) -> SideInput:
+        """Use graph as a side input lookup table: dict from key values
+        (a tuple for several keys) to rows
+        :param keys: unique keys of graph rows
+        """
+        return SideInput(self, keys=keys)
+
     def reduce(self, reducer: ops.Reducer,
-               keys: tp.Sequence[str]) -> 'Graph':
+               keys: tp.Sequence[str],
+               partitions: int | None = None, workers: int = 0,
+               threads: bool = False) -> 'Graph':
         """Construct new graph extended with reduce
          operation with particular reducer
         :param reducer: reducer to use
         :param keys: keys for grouping
+        :param partitions: reduce rows split into this many partitions by
+         keys, spreading hot keys over all of them if reducer results can
+         be combined; rows need not be sorted then, see skew module
+        :param workers: reduce batches of groups by this many worker
+         processes, in process if 0
+        :param threads: use worker threads, for reducers releasing the GIL
         """
-        self.Operations_sequence.append(ops.Reduce(reducer, keys))
+        if partitions is not None and workers:
+            raise ValueError('Partitioned reduce runs in process')
+        if workers:
+            self.Operations_sequence.append(
+                parallel.ParallelReduce(reducer, keys, workers, threads))
+        elif partitions is not None:
+            self.Operations_sequence.append(
+                skew.PartitionedReduce(reducer, keys, partitions))
+        else:
+            self.Operations_sequence.append(ops.Reduce(reducer, keys))
         return self
 
-    def sort(self, keys: tp.Sequence[str]) -> 'Graph':
+    def window(self, accumulator: windows.Accumulator,
+               keys: tp.Sequence[str], time_column: str, size: tp.Any,
+               slide: tp.Any = None, delay: tp.Any = None) -> 'Graph':
+        """Construct new graph extended with aggregation by windows of
+        event time; rows need not be sorted and may never end, results are
+        sent as windows close, see windows module
+        :param accumulator: aggregate of rows of a window and keys
+        :param keys: keys for grouping within windows
+        :param time_column: column of event time, a number or datetime
+        :param size: length of windows, a number or timedelta
+        :param slide: time between starts of windows, tumbling if None
+        :param delay: how late rows may come, none if None
+        """
+        self.Operations_sequence.append(windows.WindowReduce(
+            accumulator, keys, time_column, size, slide, delay))
+        return self
+
+    def sort(self, keys: tp.Sequence[str],
+             encode_keys: bool = False) -> 'Graph':
         """Construct new graph extended with sort operation
         :param keys: sorting keys (typical is tuple of strings)
+        :param encode_keys: compare keys encoded into order-preserving
+         bytes, pays off for composite keys; keys with values of other
+         types than numbers, str, bytes and datetime are compared as is
         """
-        sort = external_sort.ExternalSort(keys)
+        sort = external_sort.ExternalSort(keys, encode_keys=encode_keys)
         self.Operations_sequence.append(sort)
         return self
 
+    def prefetch(self, queue_batches: int = pipeline_stages.QUEUE_BATCHES
+                 ) -> 'Graph':
+        """Construct new graph extended with a stage boundary: operations
+        before it run in a thread of their own, see pipeline module
+        :param queue_batches: batches of rows read ahead at most
+        """
+        self.Operations_sequence.append(
+            pipeline_stages.Prefetch(queue_batches))
+        return self
+
+    def checkpoint(self) -> 'Graph':
+        """Construct new graph extended with a checkpoint: runs with
+        checkpoint_dir keep output of the graph so far on disk and reruns
+        start from it, see checkpoint module
+        """
+        self.Operations_sequence.append(checkpoint.Checkpoint())
+        return self
+
     def join(self, joiner: ops.Joiner,
              join_graph: 'Graph',
-             keys: tp.Sequence[str]) -> 'Graph':
+             keys: tp.Sequence[str],
+             bloom_error_rate: float | None = bloom.ERROR_RATE) -> 'Graph':
         """Construct new graph extended with join operation with another graph
         :param joiner: join strategy to use
         :param join_graph: other graph to join with
         :param keys: keys for grouping
+        :param bloom_error_rate: false positive rate of Bloom filter of keys
+         of join_graph dropping rows without a match before they are
+         sorted, None to not filter; see bloom module
         """
-        self.Operations_sequence.append(ops.Join(joiner, keys))
+        self.Operations_sequence.append(
+            ops.Join(joiner, keys, bloom_error_rate))
         self.joiners.append(join_graph)
         return self
 
-    def run(self, **kwargs: tp.Any) -> ops.TRowsIterable:
-        self.i = 0
-        self.rows = None
-        """Single method to start execution; data sources passed as kwargs"""
-        for ind, operation in enumerate(self.Operations_sequence):
-            if isinstance(operation, ops.ReadIterFactory):
-                self.rows = operation(**kwargs)  # type:ignore
-                continue
-            elif isinstance(operation, ops.Read):
-                self.rows = operation()  # type:ignore
-                continue
-            elif isinstance(operation, ops.Join):
-                cur_joiner = self.joiners[self.i]
-                self.i += 1
-                if self.rows is not None:
-                    self.rows = operation(  # type:ignore
-                        self.rows, cur_joiner.run(**kwargs))
-                continue
-
-            self.rows = operation(self.rows)
-
-        if self.rows is not None:
-            return iter(self.rows)  # type:ignore
+    def join_many(self, join_graphs: tp.Sequence['Graph'],
+                  keys: tp.Sequence[str],
+                  suffixes: tp.Sequence[str] | None = None,
+                  left: bool = False) -> 'Graph':
+        """Construct new graph extended with join of several graphs in one
+        pass; all graphs must be sorted by keys
+        :param join_graphs: other graphs to join with
+        :param keys: keys for grouping
+        :param suffixes: suffixes of colliding columns of this and other
+         graphs, '_1', '_2', ... by default
+        :param left: keep rows without a match in some of other graphs
+        """
+        if suffixes is None:
+            suffixes = [f'_{ind + 1}' for ind in range(len(join_graphs) + 1)]
+        if len(suffixes) != len(join_graphs) + 1:
+            raise ValueError('Expected a suffix for every joined graph')
+        self.Operations_sequence.append(ops.JoinMany(keys, suffixes, left))
+        self.joiners.extend(join_graphs)
+        return self
+
+    def run(self, options: RunOptions | None = None, /,
+            **kwargs: tp.Any) -> ops.TRowsIterable:
+        """Single method to start execution; data sources passed as kwargs
+        :param options: options of the run, defaults if None
+        """
+        options = options if options is not None else RunOptions()
+        cache = options.cache
+        plan = optimizer.optimize(self)
+        key = cache.key(plan, options.input_states) \
+            if cache is not None else None
+        if cache is not None and key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        if options.statistics is not None:
+            optimizer.choose_strategies(plan, options.statistics)
+        if options.checkpoint_dir is not None:
+            optimizer.add_checkpoints(plan, options.checkpoint_dir,
+                                      options.input_states,
+                                      max_bytes=options.checkpoint_bytes)
+        if options.pipeline:
+            optimizer.add_prefetch(plan)
+        run = _Run(kwargs, statistics=options.statistics)
+        if isinstance(options.memory_limit, budget.MemoryBudget):
+            run.budget = options.memory_limit
+        elif options.memory_limit is not None:
+            run.budget = budget.MemoryBudget(options.memory_limit)
+        if options.profile:
+            run.profile = self.last_profile = profiler.Profile()
+            rows = _execute(plan, run, run.profile.stages)
+        else:
+            rows = _execute(plan, run)
+        if cache is not None and key is not None:
+            rows = cache.put(key, rows)
+        return iter(rows)
+
+    def run_async(self, options: RunOptions | None = None, /,
+                  **kwargs: tp.Any) -> tp.AsyncIterator[ops.TRow]:
+        """Run the graph in a thread from asyncio code: sources passed as
+        kwargs may also be async iterables or factories of them, rows are
+        iterated by async for; see aio module
+        :param options: options of the run, defaults if None
+        """
+        return aio.run(self, options, kwargs)
+
+    def explain(self, analyze: bool = False,
+                statistics: stats.Statistics | None = None, /,
+                **kwargs: tp.Any) -> str:
+        """Describe how the graph runs: operations of the plan with their
+        strategies and estimated output rows. Estimates use statistics
+        and rows observed in the last profiled run
+        :param analyze: also run the graph on sources passed as kwargs and
+         show observed rows and time of every operation
+        :param statistics: statistics of earlier runs
+        """
+        plan = optimizer.optimize(self)
+        known = stats.Statistics()
+        if statistics is not None:
+            known.nodes.update(statistics.nodes)
+        if self.last_profile is not None:
+            known.update(self.last_profile.observed_rows())
+        optimizer.estimate_rows(plan, known)
+        if statistics is not None:
+            optimizer.choose_strategies(plan, statistics)
+        if not analyze:
+            return explain_plan.render(plan)
+        profile = self.last_profile = profiler.Profile()
+        for _ in _execute(plan, _Run(kwargs, profile, statistics),
+                          profile.stages):
+            pass
+        return explain_plan.render(plan, profile.stages)
+
+
+class _Run:
+    """State of a graph run shared by plans of joined graphs and side
+    inputs"""
+
+    def __init__(self, sources: dict[str, tp.Any],
+                 profile: profiler.Profile | None = None,
+                 statistics: stats.Statistics | None = None) -> None:
+        self.sources = sources
+        self.profile = profile
+        self.statistics = statistics
+        self.budget: budget.MemoryBudget | None = None
+        # values of side inputs used by several maps are computed once
+        self.side_values: dict[int, tp.Any] = {}
+
+
+def _keys(operation: ops.Operation) -> tp.Sequence[str]:
+    if isinstance(operation, (ops.Reduce, ops.Join, ops.JoinMany)):
+        return operation.keys
+    return ()
+
+
+def _consumer_keys(plan: optimizer.Plan, position: int,
+                   keys: tp.Sequence[str]) -> tp.Sequence[str]:
+    """Keys the operation reading output of node at position groups by"""
+    for node in plan.nodes[position + 1:]:
+        if not isinstance(node.operation, optimizer.PASS_THROUGH):
+            return _keys(node.operation)
+    return keys
+
+
+def _execute(plan: optimizer.Plan, run: _Run,
+             stages: list[profiler.Stage] | None = None,
+             keys: tp.Sequence[str] = ()) -> ops.TRowsIterable:
+    """Chain operations of plan
+    :param stages: stages to add profiled operations to
+    :param keys: keys the consumer of plan output groups rows by
+    """
+    rows: tp.Any = None
+    for position, node in enumerate(plan.nodes):
+        operation = node.operation
+        options: dict[str, tp.Any] = {}
+        inputs: list[tp.Any] = [None] * len(node.inputs)
+        stage = None
+        if run.profile is not None and stages is not None:
+            stage = profiler.Stage(optimizer.describe(operation),
+                                   node.fingerprint)
+            stages.append(stage)
+            inputs = [[] for _ in node.inputs]
+            if isinstance(operation, (ops.Join, ops.JoinMany)):
+                stage.inputs = inputs
+            else:
+                stage.side_inputs = inputs
+            options['stats'] = stage.counters
+
+        if isinstance(operation, optimizer.SOURCES):
+            rows = operation(**run.sources)
+        elif isinstance(operation, ops.Join):
+            joined = _execute(node.inputs[0], run, inputs[0], operation.keys)
+            rows = operation(rows, joined, **options)
+        elif isinstance(operation, ops.JoinMany):
+            rows = operation(rows, *[
+                _execute(joined_plan, run, joined_stages, operation.keys)
+                for joined_plan, joined_stages in zip(node.inputs, inputs)],
+                **options)
+        elif isinstance(operation, ops.Map) and operation.side_inputs:
+            options['side_inputs'] = {
+                name: partial(_side_input, side_input, side_plan, run,
+                              side_stages)
+                for (name, side_input), side_plan, side_stages
+                in zip(operation.side_inputs.items(), node.inputs, inputs)}
+            rows = operation(rows, **options)
         else:
-            assert False
+            rows = operation(rows, **options)
+
+        if run.budget is not None:
+            rows = budget.within(run.budget, rows)
+        if run.profile is not None and stage is not None:
+            rows = run.profile.track(rows, stage)
+        if run.statistics is not None and \
+                not isinstance(operation, optimizer.PASS_THROUGH):
+            rows = run.statistics.collect(rows, node.fingerprint,
+                                          _consumer_keys(plan, position,
+                                                         keys))
+    assert rows is not None
+    return rows
+
+
+def _side_input(side_input: SideInput, plan: optimizer.Plan, run: _Run,
+                stages: list[profiler.Stage] | None) -> tp.Any:
+    if id(side_input) not in run.side_values:
+        run.side_values[id(side_input)] = side_input.value(
+            _execute(plan, run, stages))
+    return run.side_values[id(side_input)]
@@ -0,0 +1,198 @@
+"""
+Word counts and tf-idf kept up to date over a growing corpus.
+
+word_count_graph and inverted_index_graph read the whole corpus on every
+run. The classes here keep their aggregates in an SQLite database and
+merge rows of appended documents into them:
+
+- IncrementalWordCount keeps the count of every word;
+- IncrementalTfIdf keeps the number of documents, the number of documents
+  with every word and the documents of every word with the highest term
+  frequencies. Idf is the same for all documents of a word, so these are
+  its documents with the highest tf-idf too, and only new documents may
+  displace them.
+
+An update runs the graph over new documents only, then reads and writes
+the state of words found in them, so it costs in proportion to the new
+documents rather than to the corpus. Documents are only added: one passed
+again is counted twice.
+"""
+import heapq
+import math
+import sqlite3
+import typing as tp
+from itertools import groupby
+from operator import itemgetter
+
+from . import algorithms
+from . import operations as ops
+
+
+class _State:
+    """Aggregates in a database, committed by every update"""
+
+    _schema: tp.Sequence[str] = ()
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: database file, created if missing
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            for statement in self._schema:
+                self.connection.execute(statement)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> tp.Any:
+        return self
+
+    def __exit__(self, *args: tp.Any) -> None:
+        self.close()
+
+
+class IncrementalWordCount(_State):
+    """Counts of words as given by word_count_graph, see module
+    description"""
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS words '
+        '(word TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS words_by_count ON words (count, word)',
+    )
+
+    def __init__(self, path: str, text_column: str = 'text',
+                 count_column: str = 'count') -> None:
+        """
+        :param path: database file, created if missing
+        :param text_column: column of texts of documents and of words
+        :param count_column: column of counts
+        """
+        super().__init__(path)
+        self.text_column = text_column
+        self.count_column = count_column
+        self._graph = algorithms.word_count_graph('documents', text_column,
+                                                  count_column)
+
+    def update(self, documents: tp.Iterable[ops.TRow]) -> list[ops.TRow]:
+        """Add documents, return counts of their words sorted by counts
+        :param documents: new documents
+        """
+        changed: list[ops.TRow] = []
+        with self.connection:
+            for row in self._graph.run(documents=lambda: documents):
+                word = row[self.text_column]
+                count, = self.connection.execute(
+                    'INSERT INTO words VALUES (?, ?) ON CONFLICT (word) '
+                    'DO UPDATE SET count = count + excluded.count '
+                    'RETURNING count', (word, row[self.count_column])
+                ).fetchone()
+                changed.append({self.text_column: word,
+                                self.count_column: count})
+        changed.sort(key=itemgetter(self.count_column, self.text_column))
+        return changed
+
+    def rows(self) -> ops.TRowsGenerator:
+        """Counts of all words sorted by counts"""
+        for word, count in self.connection.execute(
+                'SELECT word, count FROM words ORDER BY count, word'):
+            yield {self.text_column: word, self.count_column: count}
+
+
+class IncrementalTfIdf(_State):
+    """Documents of every word with the highest tf-idf as given by
+    inverted_index_graph, see module description"""
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS corpus (documents INTEGER NOT NULL)',
+        'INSERT INTO corpus SELECT 0 WHERE NOT EXISTS '
+        '(SELECT * FROM corpus)',
+        'CREATE TABLE IF NOT EXISTS words '
+        '(word TEXT PRIMARY KEY, documents INTEGER NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS top (word TEXT NOT NULL, doc, '
+        'tf REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS top_by_word ON top (word)',
+    )
+
+    def __init__(self, path: str, doc_column: str = 'doc_id',
+                 text_column: str = 'text', result_column: str = 'tf_idf',
+                 n: int = 3) -> None:
+        """
+        :param path: database file, created if missing
+        :param doc_column: column of ids of documents
+        :param text_column: column of texts of documents and of words
+        :param result_column: column of tf-idf
+        :param n: documents of a word kept
+        """
+        super().__init__(path)
+        self.doc_column = doc_column
+        self.text_column = text_column
+        self.result_column = result_column
+        self.n = n
+        self._graph = algorithms.term_frequency_graph(
+            'documents', doc_column, text_column)
+
+    @property
+    def documents(self) -> int:
+        """Number of documents added"""
+        count: int = self.connection.execute(
+            'SELECT documents FROM corpus').fetchone()[0]
+        return count
+
+    def update(self, documents: tp.Iterable[ops.TRow]) -> list[ops.TRow]:
+        """Add documents, return tf-idf of top documents of their words
+        sorted by documents and words. Tf-idf of other words changes
+        with the number of documents as well, see rows
+        :param documents: new documents
+        """
+        added = 0
+
+        def counted() -> ops.TRowsGenerator:
+            nonlocal added
+            for row in documents:
+                added += 1
+                yield row
+
+        execute = self.connection.execute
+        changed: list[tuple[str, int, list[tuple[tp.Any, float]]]] = []
+        with self.connection:
+            rows = self._graph.run(documents=counted)
+            for word, group in groupby(rows,
+                                       key=itemgetter(self.text_column)):
+                new = [(row[self.doc_column], row['tf']) for row in group]
+                containing, = execute(
+                    'INSERT INTO words VALUES (?, ?) ON CONFLICT (word) '
+                    'DO UPDATE SET documents = documents + '
+                    'excluded.documents RETURNING documents',
+                    (word, len(new))).fetchone()
+                kept = execute('SELECT doc, tf FROM top WHERE word = ? '
+                               'ORDER BY rowid', (word,)).fetchall()
+                # kept documents win ties, as earlier rows do in TopN
+                top = heapq.nlargest(self.n, kept + new, key=itemgetter(1))
+                execute('DELETE FROM top WHERE word = ?', (word,))
+                self.connection.executemany(
+                    'INSERT INTO top VALUES (?, ?, ?)',
+                    [(word, doc, tf) for doc, tf in top])
+                changed.append((word, containing, top))
+            execute('UPDATE corpus SET documents = documents + ?', (added,))
+            total = self.documents
+        result = [self._row(doc, word, tf, total, containing)
+                  for word, containing, top in changed for doc, tf in top]
+        result.sort(key=itemgetter(self.doc_column, self.text_column))
+        return result
+
+    def rows(self) -> ops.TRowsGenerator:
+        """Tf-idf of top documents of all words sorted by documents and
+        words, computed from the state without reading documents"""
+        total = self.documents
+        for word, doc, tf, containing in self.connection.execute(
+                'SELECT top.word, doc, tf, documents FROM top '
+                'JOIN words USING (word) ORDER BY doc, top.word'):
+            yield self._row(doc, word, tf, total, containing)
+
+    def _row(self, doc: tp.Any, word: str, tf: float, total: int,
+             containing: int) -> ops.TRow:
+        return {self.doc_column: doc, self.text_column: word,
+                self.result_column: tf * math.log(total / containing)}
@@ -5,12 +5,25 @@ from abc import abstractmethod, ABC
 import typing as tp
 from copy import copy
 from datetime import datetime, timedelta
-from itertools import groupby
+from functools import lru_cache, partial
+from itertools import chain, groupby, islice
 from operator import itemgetter
 
+from . import budget
+from . import expressions as ex
+
 TRow = dict[str, tp.Any]
 TRowsIterable = tp.Iterable[TRow]
 TRowsGenerator = tp.Generator[TRow, None, None]
+TColumns = tp.AbstractSet[str] | None
+TMerge = tp.Callable[[TRow, TRow], TRow]
+
+
+def _required(columns: TColumns, produced: tp.Iterable[str],
+              consumed: tp.Iterable[str]) -> set[str] | None:
+    if columns is None:
+        return None
+    return (set(columns) - set(produced)) | set(consumed)
 
 
 class Operation(ABC):
@@ -19,29 +32,52 @@ class Operation(ABC):
                  **kwargs: tp.Any) -> TRowsGenerator:
         pass
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        """Columns of input rows needed to produce columns of output
+        :param columns: output columns used downstream, None if all
+        :return: input columns to keep, None if all
+        """
+        return None
+
+
+def _select(rows: TRowsIterable, columns: TColumns) -> TRowsGenerator:
+    if columns is None:
+        yield from rows
+        return
+    for row in rows:
+        if columns >= row.keys():
+            yield row
+        else:
+            yield {key: value for key, value in row.items()
+                   if key in columns}
+
 
 class Read(Operation):
     def __init__(self, filename: str,
                  parser: tp.Callable[[str], TRow]) -> None:
         self.filename = filename
         self.parser = parser
+        self.columns: TColumns = None
 
-    def __call__(self, *args: tp.Any,
-                 **kwargs: tp.Any) -> TRowsGenerator:
+    def _parse(self) -> TRowsGenerator:
         with open(self.filename) as f:
             for line in f:
                 line = line.strip()
                 yield self.parser(line)
 
+    def __call__(self, *args: tp.Any,
+                 **kwargs: tp.Any) -> TRowsGenerator:
+        yield from _select(self._parse(), self.columns)
+
 
 class ReadIterFactory(Operation):
     def __init__(self, name: str) -> None:
         self.name = name
+        self.columns: TColumns = None
 
     def __call__(self, *args: tp.Any,
                  **kwargs: tp.Any) -> TRowsGenerator:
-        for row in kwargs[self.name]():
-            yield row
+        yield from _select(kwargs[self.name](), self.columns)
 
 
 # Operations
@@ -50,6 +86,9 @@ class ReadIterFactory(Operation):
 class Mapper(ABC):
     """Base class for mappers"""
 
+    # Expected number of output rows per input row, used in plan estimates
+    fanout = 1.
+
     @abstractmethod
     def __call__(self, row: TRow) -> TRowsGenerator:
         """
@@ -57,28 +96,119 @@ class Mapper(ABC):
         """
         pass
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        """Columns of input row needed to produce columns of output
+        :param columns: output columns used downstream, None if all
+        :return: input columns to keep, None if all
+        """
+        return None
+
+    def changed_columns(self) -> set[str] | None:
+        """Columns the mapper adds or overwrites, None if unknown"""
+        return None
+
+    def map_rows(self, rows: TRowsIterable) -> TRowsGenerator:
+        """Apply mapper to every row of the stream
+        :param rows: table rows
+        """
+        for row in rows:
+            yield from self(row)
+
+    def bind(self, side_inputs: tp.Mapping[str, tp.Any]) -> 'Mapper':
+        """Mapper to apply with known values of side inputs
+        :param side_inputs: values of side inputs by name
+        """
+        return self
+
 
 class Map(Operation):
-    def __init__(self, mapper: Mapper) -> None:
+    def __init__(self, mapper: Mapper,
+                 side_inputs: tp.Mapping[str, tp.Any] | None = None) -> None:
+        """
+        :param mapper: mapper to use
+        :param side_inputs: descriptions of side inputs by name, their
+         values are computed on start by callables passed in kwargs
+        """
         self.mapper = mapper
+        self.side_inputs = dict(side_inputs) if side_inputs else {}
+
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return self.mapper.required_columns(columns)
 
     def __call__(self, rows: TRowsIterable,
                  *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
-        for row in rows:
-            for row_mapper in self.mapper(row):
-                yield row_mapper
+        mapper = self.mapper
+        if self.side_inputs:
+            mapper = mapper.bind({name: resolve() for name, resolve
+                                  in kwargs['side_inputs'].items()})
+        yield from mapper.map_rows(rows)
 
 
 class Reducer(ABC):
     """Base class for reducers"""
 
-    @abstractmethod
+    # True if groups by keys are reduced independently of each other
+    groupwise = False
+    # Expected number of output rows per input row of groupwise reducer
+    fanout = 0.1
+
+    def __init_subclass__(cls, **kwargs: tp.Any) -> None:
+        super().__init_subclass__(**kwargs)
+        # each of them is implemented by the other one
+        if cls.__call__ is Reducer.__call__ and \
+                cls.reduce_group is Reducer.reduce_group:
+            raise TypeError(f'{cls.__name__} must override __call__ or '
+                            'reduce_group')
+
     def __call__(self, group_key: tuple[str, ...],
                  rows: TRowsIterable) -> TRowsGenerator:
         """
         :param rows: table rows
         """
-        pass
+        for _, group in groupby(rows, key=row_key(group_key)):
+            yield from self.reduce_group(group_key, group)
+
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        """Reduce rows of one group. Groupwise reducers override it and
+        Reduce calls it for every group, others get the group as a table
+        :param group_key: keys for grouping
+        :param rows: rows of the group, not empty
+        """
+        yield from self(group_key, rows)
+
+    def reduce_batch(self, group_key: tuple[str, ...],
+                     groups: list[list[TRow]]) -> TRowsGenerator:
+        """Reduce several small groups at once, reducers doing it cheaper
+        than group by group override it
+        :param group_key: keys for grouping
+        :param groups: rows of consecutive groups
+        """
+        for group in groups:
+            yield from self.reduce_group(group_key, group)
+
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        """Columns of input rows needed to produce columns of output
+        :param group_key: keys for grouping
+        :param columns: output columns used downstream, None if all
+        :return: input columns to keep, None if all
+        """
+        return None
+
+    def combiner(self) -> 'Reducer | None':
+        """Reducer merging results of this one on parts of a group into
+        the result on the whole group, None if results can not be merged"""
+        return None
+
+
+def row_key(keys: tp.Sequence[str]) -> tp.Callable[[TRow], tp.Any]:
+    """Function getting values of keys from row, () for no keys"""
+    return itemgetter(*keys) if keys else lambda row: ()
+
+
+# Rows of small groups passed to Reducer.reduce_batch at once
+BATCH_ROWS = 1024
 
 
 class Reduce(Operation):
@@ -86,18 +216,68 @@ class Reduce(Operation):
         self.reducer = reducer
         self.keys = keys
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return self.reducer.required_columns(tuple(self.keys), columns)
+
     def __call__(self, rows: TRowsIterable,
                  *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
-        for row in self.reducer(tuple(self.keys), rows):
-            yield row
+        yield from self.reduce(rows)
+
+    def reduce(self, rows: TRowsIterable) -> TRowsGenerator:
+        """Reduce rows sorted by keys: group them once and pass groups to
+        reducer, batches of small groups if it takes them"""
+        reducer = self.reducer
+        group_key = tuple(self.keys)
+        if not reducer.groupwise or \
+                type(reducer).reduce_group is Reducer.reduce_group:
+            yield from reducer(group_key, rows)
+            return
+        groups = groupby(rows, key=row_key(self.keys))
+        if type(reducer).reduce_batch is Reducer.reduce_batch:
+            for _, group in groups:
+                yield from reducer.reduce_group(group_key, group)
+            return
+
+        batch: list[list[TRow]] = []
+        size = 0
+        for _, group in groups:
+            head = list(islice(group, BATCH_ROWS))
+            if len(head) == BATCH_ROWS:
+                # a large group is not collected, it goes on its own
+                if batch:
+                    yield from reducer.reduce_batch(group_key, batch)
+                    batch, size = [], 0
+                yield from reducer.reduce_group(group_key,
+                                                chain(head, group))
+                continue
+            batch.append(head)
+            size += len(head)
+            if size >= BATCH_ROWS:
+                yield from reducer.reduce_batch(group_key, batch)
+                batch, size = [], 0
+        if batch:
+            yield from reducer.reduce_batch(group_key, batch)
+
+
+# Rows of a joined key group kept in memory, larger groups are spilled
+JOIN_SPILL_ROWS = 100_000
 
 
 class Joiner(ABC):
     """Base class for joiners"""
 
-    def __init__(self, suffix_a: str = '_1', suffix_b: str = '_2') -> None:
+    def __init__(self, suffix_a: str = '_1', suffix_b: str = '_2',
+                 spill_rows: int | None = JOIN_SPILL_ROWS) -> None:
+        """
+        :param suffix_a: suffix of colliding columns of left table
+        :param suffix_b: suffix of colliding columns of right table
+        :param spill_rows: rows of a key group to keep in memory, larger
+         groups are spilled to disk and read back once per block of rows
+         of the other side; None to keep all in memory
+        """
         self._a_suffix = suffix_a
         self._b_suffix = suffix_b
+        self.spill_rows = spill_rows
 
     @abstractmethod
     def __call__(self, keys: tp.Sequence[str],
@@ -110,45 +290,186 @@ class Joiner(ABC):
         """
         pass
 
+    def required_columns(self, keys: tp.Sequence[str],
+                         columns: TColumns) -> set[str] | None:
+        """Columns of both tables needed to produce columns of output.
+        A column is kept on both sides at once, so columns colliding
+        in the original tables still collide and get suffixes
+        :param keys: join keys
+        :param columns: output columns used downstream, None if all
+        :return: columns to keep in both tables, None if all
+        """
+        if columns is None:
+            return None
+        required = set(columns) | set(keys)
+        for column in columns:
+            for suffix in (self._a_suffix, self._b_suffix):
+                if suffix and column.endswith(suffix):
+                    required.add(column[:-len(suffix)])
+        return required
+
+    def _buffer(self, rows: TRowsIterable) -> budget.RowBuffer:
+        """Key group to read once per row of the other side"""
+        return budget.RowBuffer(max_rows=self.spill_rows).extend(rows)
+
+    def _combine(self, keys: tp.Collection[str],
+                 row_a: TRow, row_b: TRow) -> TRow:
+        new_row = copy(row_a)
+        for key, value in row_b.items():
+            if key in keys:
+                continue
+
+            if key in new_row:
+                new_row.pop(key, None)
+                new_row[key + self._a_suffix] = row_a[key]
+                new_row[key + self._b_suffix] = value
+                continue
+            new_row[key] = value
+        return new_row
+
+    def _combine_right(self, keys: tp.Collection[str],
+                       row_b: TRow, row_a: TRow) -> TRow:
+        new_row = copy(row_b)
+        for key, value in row_a.items():
+            if key in keys:
+                continue
+
+            if key in new_row:
+                new_row.pop(key, None)
+                new_row[key + self._a_suffix] = value
+                new_row[key + self._b_suffix] = row_b[key]
+                continue
+            new_row[key] = value
+        return new_row
+
+    def _merger(self, keys: frozenset[str], right: bool,
+                row: TRow, other: TRow) -> TMerge:
+        """Function joining rows of the same schemas as row and other"""
+        merge = _merge_plan(keys, tuple(row), tuple(other),
+                            self._a_suffix, self._b_suffix, right)
+        if merge is not None:
+            return merge
+        return partial(self._combine_right if right else self._combine,
+                       keys)
+
+    def _product(self, keys: tp.Sequence[str], rows: TRowsIterable,
+                 group: budget.RowBuffer,
+                 right: bool = False) -> TRowsGenerator:
+        """Join every row with every row of group, rows are of the right
+        table if right is set. A spilled group is read once per block of
+        rows rather than once per row, so output comes block by block"""
+        merger = partial(self._merger, frozenset(keys), right)
+        if not group.spilled:
+            others = group.rows
+            if _same_schema(others):
+                schema: tuple[str, ...] = ()
+                merge = None
+                for row in rows:
+                    if merge is None or tuple(row) != schema:
+                        schema = tuple(row)
+                        merge = merger(row, others[0])
+                    for other in others:
+                        yield merge(row, other)
+            else:
+                for row in rows:
+                    for other in others:
+                        yield merger(row, other)(row, other)
+            return
+        iterator = iter(rows)
+        while block := list(islice(iterator, budget.BLOCK_ROWS)):
+            for other in group:
+                for row in block:
+                    yield merger(row, other)(row, other)
+
+
+def _same_schema(rows: list[TRow]) -> bool:
+    """Whether rows are not empty and have the same columns in order"""
+    if not rows:
+        return False
+    schema = tuple(rows[0])
+    return all(tuple(row) == schema for row in rows)
+
+
+@lru_cache(maxsize=1024)
+def _merge_plan(keys: frozenset[str], schema: tuple[str, ...],
+                other_schema: tuple[str, ...], suffix_a: str, suffix_b: str,
+                right: bool) -> TMerge | None:
+    """Compile joining of rows with given columns into a dict display
+    building the row joiners build column by column, with the same
+    columns in the same order
+    :param keys: join keys
+    :param schema: columns of row of the table iterated over
+    :param other_schema: columns of row of the group joined to it
+    :param right: whether the table iterated over is the right one
+    :return: function of row and other row, None if joiners fail on such
+     rows
+    """
+    side, other_side = ('b', 'a') if right else ('a', 'b')
+    columns = {column: (side, column) for column in schema}
+    for column in other_schema:
+        if column in keys:
+            continue
+        if column in columns:
+            if column not in schema:
+                return None
+            columns.pop(column)
+            columns[column + suffix_a] = ('a', column)
+            columns[column + suffix_b] = ('b', column)
+            continue
+        columns[column] = (other_side, column)
+    items = ', '.join(f'{name!r}: {source}[{column!r}]'
+                      for name, (source, column) in columns.items())
+    return tp.cast(TMerge, eval(f'lambda {side}, {other_side}: {{{items}}}'))
+
 
 class Join(Operation):
-    def __init__(self, joiner: Joiner, keys: tp.Sequence[str]):
+    def __init__(self, joiner: Joiner, keys: tp.Sequence[str],
+                 bloom_error_rate: float | None = None):
+        """
+        :param joiner: join strategy to use
+        :param keys: join keys
+        :param bloom_error_rate: false positive rate of Bloom filter of
+         joined keys pruning rows before sorting them when the join sorts
+         its inputs itself, see adaptive; None to not filter
+        """
         self.keys = keys
         self.joiner = joiner
+        self.bloom_error_rate = bloom_error_rate
+
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        joiner = self.joiner if len(self.keys) > 0 else \
+            CrossJoin(spill_rows=self.joiner.spill_rows)
+        return joiner.required_columns(self.keys, columns)
 
     def __call__(self, rows: TRowsIterable,
                  *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
         rows_a = rows
         rows_b = args[0]
-        if len(self.keys) > 0:
-            key_item_a = groupby(rows_a,
-                                 key=lambda x: itemgetter(*self.keys)(x))
-            key_items_b = (iter
-                           (groupby
-                            (rows_b,
-                             key=lambda x: itemgetter(*self.keys)(x))))
-        else:
-            joiner = CrossJoin()
+        if len(self.keys) == 0:
+            joiner = CrossJoin(spill_rows=self.joiner.spill_rows)
             for el in joiner(self.keys, rows_a, rows_b):
                 yield el
             return
-        row_b: tuple[tp.Any, tp.Iterator[tp.Any]] | None = next(key_items_b)
+        yield from self._merge(rows_a, rows_b)
+
+    def _merge(self, rows_a: TRowsIterable,
+               rows_b: TRowsIterable) -> TRowsGenerator:
+        """Join tables sorted by keys group by group"""
+        key = row_key(self.keys)
+        key_item_a = groupby(rows_a, key=key)
+        key_items_b = groupby(rows_b, key=key)
+        row_b: tuple[tp.Any, tp.Iterator[tp.Any]] | None = \
+            next(key_items_b, None)
         for key, group_items in key_item_a:
             while row_b is not None and row_b[0] < key:
                 for el in self.joiner(self.keys, [], row_b[1]):
                     yield el
-                try:
-                    row_b = next(key_items_b)
-                except StopIteration:
-                    row_b = None
+                row_b = next(key_items_b, None)
 
             if row_b is not None and row_b[0] == key:
                 for el in self.joiner(self.keys, group_items, row_b[1]):
                     yield el
-                try:
-                    row_b = next(key_items_b)
-                except StopIteration:
-                    row_b = None
+                row_b = next(key_items_b, None)
                 continue
 
             for el in self.joiner(self.keys, group_items, []):
@@ -157,10 +478,107 @@ class Join(Operation):
         while row_b is not None:
             for el in self.joiner(self.keys, [], row_b[1]):
                 yield el
+            row_b = next(key_items_b, None)
+
+
+class JoinMany(Operation):
+    """
+    Join several tables sorted by the same keys in one pass.
+    A column other than keys found in more than one of joined rows gets
+    the suffix of its table in all of them, so names do not depend on
+    the order of joining
+    """
+
+    def __init__(self, keys: tp.Sequence[str], suffixes: tp.Sequence[str],
+                 left: bool = False,
+                 spill_rows: int | None = JOIN_SPILL_ROWS) -> None:
+        """
+        :param keys: join keys
+        :param suffixes: suffixes of colliding columns by table, the first
+         is of the table joined to
+        :param left: keep rows of the first table without a match in some
+         other table, otherwise only keys present in all tables are joined
+        :param spill_rows: rows of a key group of other tables to keep in
+         memory, larger groups are spilled to disk
+        """
+        self.keys = keys
+        self.suffixes = suffixes
+        self.left = left
+        self.spill_rows = spill_rows
+
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        if columns is None:
+            return None
+        required = set(columns) | set(self.keys)
+        for column in columns:
+            for suffix in self.suffixes:
+                if suffix and column.endswith(suffix):
+                    required.add(column[:-len(suffix)])
+        return required
+
+    def __call__(self, rows: TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        assert len(args) + 1 == len(self.suffixes)
+        key = itemgetter(*self.keys)
+        iterators = [groupby(table, key=key) for table in (rows, *args)]
+        heads = [next(iterator, None) for iterator in iterators]
+        while heads[0] is not None:
+            value = heads[0][0]
+            # groups of other tables with the key and their suffixes
+            matched: list[tuple[str, budget.RowBuffer]] = []
+            for position in range(1, len(heads)):
+                head = heads[position]
+                while head is not None and head[0] < value:
+                    head = next(iterators[position], None)
+                heads[position] = head
+                if head is not None and head[0] == value:
+                    matched.append((self.suffixes[position], budget.RowBuffer(
+                        max_rows=self.spill_rows).extend(head[1])))
+                    heads[position] = next(iterators[position], None)
+                elif not self.left:
+                    break
             try:
-                row_b = next(key_items_b)
-            except StopIteration:
-                row_b = None
+                if self.left or len(matched) == len(heads) - 1:
+                    suffixes = [self.suffixes[0]] + \
+                        [suffix for suffix, _ in matched]
+                    groups = [group for _, group in matched]
+                    for row in heads[0][1]:
+                        yield from self._combinations([row], groups,
+                                                      suffixes)
+            finally:
+                for _, group in matched:
+                    group.close()
+            heads[0] = next(iterators[0], None)
+
+    def _combinations(self, rows: list[TRow],
+                      groups: list[budget.RowBuffer],
+                      suffixes: list[str]) -> TRowsGenerator:
+        """Combine rows with every combination of rows of next groups"""
+        if len(rows) > len(groups):
+            yield self._combine(rows, suffixes)
+            return
+        for other in groups[len(rows) - 1]:
+            rows.append(other)
+            yield from self._combinations(rows, groups, suffixes)
+            rows.pop()
+
+    def _combine(self, rows: list[TRow], suffixes: list[str]) -> TRow:
+        if len(rows) == 1:
+            return rows[0]
+        counts: dict[str, int] = {}
+        for row in rows:
+            for column in row:
+                counts[column] = counts.get(column, 0) + 1
+        new_row: TRow = {}
+        for row, suffix in zip(rows, suffixes):
+            for column, value in row.items():
+                if column in self.keys:
+                    new_row.setdefault(column, value)
+                elif counts[column] > 1:
+                    new_row[column + suffix] = value
+                else:
+                    new_row[column] = value
+        return new_row
 
 
 # Dummy operators
@@ -172,17 +590,32 @@ class DummyMapper(Mapper):
     def __call__(self, row: TRow) -> TRowsGenerator:
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [], [])
+
+    def changed_columns(self) -> set[str] | None:
+        return set()
+
 
 class FirstReducer(Reducer):
     """Yield only first row from passed ones"""
 
-    def __call__(self, group_key: tuple[str, ...],
-                 rows: TRowsIterable) -> TRowsGenerator:
-        for key, group_items in (
-                groupby(rows, key=lambda x: itemgetter(*group_key)(x))):
-            for el in group_items:
-                yield el
-                break
+    groupwise = True
+
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return _required(columns, [], group_key)
+
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        for el in rows:
+            yield el
+            break
+
+    def reduce_batch(self, group_key: tuple[str, ...],
+                     groups: list[list[TRow]]) -> TRowsGenerator:
+        for group in groups:
+            yield group[0]
 
 
 # Mappers
@@ -202,6 +635,12 @@ class FilterPunctuation(Mapper):
                             (str.maketrans('', '', string.punctuation)))
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [], [self.column])
+
+    def changed_columns(self) -> set[str] | None:
+        return {self.column}
+
 
 class LowerCase(Mapper):
     """Replace column value with value in lower case"""
@@ -220,44 +659,108 @@ class LowerCase(Mapper):
         row[self.column] = LowerCase._lower_case(row[self.column])
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [], [self.column])
+
+    def changed_columns(self) -> set[str] | None:
+        return {self.column}
+
+
+class Compute(Mapper):
+    """Set columns to values of expressions in one fused function"""
+
+    def __init__(self, assignments: tp.Mapping[str, tp.Any] |
+                 tp.Sequence[tuple[str, tp.Any]]) -> None:
+        """
+        :param assignments: result columns with expressions computing them,
+         later expressions see columns set by earlier ones
+        """
+        items = assignments.items() \
+            if isinstance(assignments, tp.Mapping) else assignments
+        self.assignments = [(column, ex.as_expression(expression))
+                            for column, expression in items]
+        self._side: tp.Mapping[str, tp.Any] | None = None
+        self._assign: tp.Callable[[TRow], None] | None = None
+
+    def _compiled(self) -> tp.Callable[[TRow], None]:
+        if self._assign is None:
+            self._assign = ex.compile_assignments(self.assignments,
+                                                  self._side)
+        return self._assign
+
+    def bind(self, side_inputs: tp.Mapping[str, tp.Any]) -> Mapper:
+        bound = copy(self)
+        bound._side = side_inputs
+        bound._assign = None
+        return bound
 
-class Divide(Mapper):
+    def __call__(self, row: TRow) -> TRowsGenerator:
+        self._compiled()(row)
+        yield row
+
+    def map_rows(self, rows: TRowsIterable) -> TRowsGenerator:
+        assign = self._compiled()
+        for row in rows:
+            assign(row)
+            yield row
+
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        produced: set[str] = set()
+        consumed: set[str] = set()
+        for column, expression in self.assignments:
+            consumed |= expression.columns - produced
+            produced.add(column)
+        return _required(columns, produced, consumed)
+
+    def changed_columns(self) -> set[str] | None:
+        return {column for column, _ in self.assignments}
+
+    def __getstate__(self) -> dict[str, tp.Any]:
+        state = self.__dict__.copy()
+        state['_assign'] = None
+        return state
+
+
+class Divide(Compute):
     """Divide columns"""
 
-    def __init__(self, dividend_column: str,
-                 divisor_column: str, res_column: str):
+    def __init__(self, dividend_column: str | ex.Expression,
+                 divisor_column: str | ex.Expression, res_column: str):
         """
-        :param column: name of column to process
+        :param dividend_column: name of dividend column or expression
+        :param divisor_column: name of divisor column or expression
+        :param res_column: name of result column
         """
         self.dividend_column = dividend_column
         self.divisor_column = divisor_column
         self.res_column = res_column
+        super().__init__([(res_column, ex.as_column(dividend_column)
+                           / ex.as_column(divisor_column))])
 
-    def __call__(self, row: TRow) -> TRowsGenerator:
-        row[self.res_column] = (row[self.dividend_column]
-                                / row[self.divisor_column])
-        yield row
 
-
-class Idf(Mapper):
+class Idf(Compute):
     """Idf count"""
 
-    def __init__(self, column_count_documents: str, column_other: str):
+    def __init__(self, column_count_documents: str | ex.Expression,
+                 column_other: str | ex.Expression):
         """
-        :param column: name of column to process
+        :param column_count_documents: name of documents count column
+         or expression
+        :param column_other: name of documents with word count column
+         or expression
         """
         self.column_count_documents = column_count_documents
         self.column_other = column_other
-
-    def __call__(self, row: TRow) -> TRowsGenerator:
-        row['idf'] = math.log(row[self.column_count_documents]
-                              / row[self.column_other])
-        yield row
+        super().__init__([('idf', ex.log(
+            ex.as_column(column_count_documents)
+            / ex.as_column(column_other)))])
 
 
 class Split(Mapper):
     """Split row on multiple rows by separator"""
 
+    fanout = 10.
+
     def __init__(self, column: str, separator: str | None = None) -> None:
         """
         :param column: name of column to split
@@ -290,8 +793,14 @@ class Split(Mapper):
 
         yield None  # type: ignore
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [], [self.column])
 
-class Product(Mapper):
+    def changed_columns(self) -> set[str] | None:
+        return {self.column}
+
+
+class Product(Compute):
     """Calculates product of multiple columns"""
 
     def __init__(self, columns: tp.Sequence[str],
@@ -302,17 +811,10 @@ class Product(Mapper):
         """
         self.columns = columns
         self.result_column = result_column
-
-    def __call__(self, row: TRow) -> TRowsGenerator:
-        res: tp.Any = None
-        for column in self.columns:
-            if res is None:
-                res = row[column]
-                continue
-            res *= row[column]
-
-        row[self.result_column] = res
-        yield row
+        product = ex.lit(None)
+        for ind, column in enumerate(columns):
+            product = ex.col(column) if ind == 0 else product * ex.col(column)
+        super().__init__([(result_column, product)])
 
 
 class Haversine(Mapper):
@@ -345,22 +847,68 @@ class Haversine(Mapper):
         row[self.res_column] = c * r
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [self.res_column],
+                         [self.start_point, self.end_point])
+
+    def changed_columns(self) -> set[str] | None:
+        return {self.res_column}
+
 
 class Filter(Mapper):
     """Remove records that don't satisfy some condition"""
 
-    def __init__(self, condition: tp.Callable[[TRow], bool]) -> None:
+    fanout = 0.5
+
+    def __init__(self, condition: tp.Callable[[TRow], bool],
+                 columns: tp.Sequence[str] | None = None) -> None:
         """
-        :param condition: if condition is not true - remove record
+        :param condition: if condition is not true - remove record,
+         column expressions are compiled and know their columns
+        :param columns: columns condition depends on, None if unknown
         """
         self.condition = condition
+        if columns is None and isinstance(condition, ex.Expression):
+            columns = sorted(condition.columns)
+        self.columns = columns
+        self._side: tp.Mapping[str, tp.Any] | None = None
+        self._function: tp.Callable[[TRow], bool] | None = None
+
+    def _compiled(self) -> tp.Callable[[TRow], bool]:
+        if not isinstance(self.condition, ex.Expression):
+            return self.condition
+        if self._function is None:
+            self._function = self.condition.compile(self._side)
+        return self._function
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        if self.condition(row):
+        if self._compiled()(row):
             yield row
         else:
             return
 
+    def map_rows(self, rows: TRowsIterable) -> TRowsGenerator:
+        yield from filter(self._compiled(), rows)
+
+    def bind(self, side_inputs: tp.Mapping[str, tp.Any]) -> Mapper:
+        bound = copy(self)
+        bound._side = side_inputs
+        bound._function = None
+        return bound
+
+    def __getstate__(self) -> dict[str, tp.Any]:
+        state = self.__dict__.copy()
+        state['_function'] = None
+        return state
+
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        if self.columns is None:
+            return None
+        return _required(columns, [], self.columns)
+
+    def changed_columns(self) -> set[str] | None:
+        return set()
+
 
 class WeekAndHour(Mapper):
     """Add weekday and hour from datetime column"""
@@ -385,6 +933,12 @@ class WeekAndHour(Mapper):
         row["hour"] = row[self.column].hour
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, ['weekday', 'hour'], [self.column])
+
+    def changed_columns(self) -> set[str] | None:
+        return {'weekday', 'hour'}
+
 
 class Speed(Mapper):
     """Cal speed in km/h"""
@@ -407,6 +961,12 @@ class Speed(Mapper):
         row[self.res_column] = row[self.kil] / full_time
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [self.res_column], [self.kil, self.time])
+
+    def changed_columns(self) -> set[str] | None:
+        return {self.res_column}
+
 
 class Time(Mapper):
     """Convert str to time"""
@@ -425,8 +985,14 @@ class Time(Mapper):
         row[self.res_column] = datetime.strptime(row[self.column], self.fmt)
         yield row
 
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        return _required(columns, [self.res_column], [self.column])
 
-class Minus(Mapper):
+    def changed_columns(self) -> set[str] | None:
+        return {self.res_column}
+
+
+class Minus(Compute):
     """column a minus column b"""
 
     def __init__(self, a: str, b: str, res_column: str) -> None:
@@ -438,10 +1004,7 @@ class Minus(Mapper):
         self.a = a
         self.b = b
         self.res_column = res_column
-
-    def __call__(self, row: TRow) -> TRowsGenerator:
-        row[self.res_column] = row[self.a] - row[self.b]
-        yield row
+        super().__init__([(res_column, ex.col(a) - ex.col(b))])
 
 
 class Project(Mapper):
@@ -452,34 +1015,34 @@ class Project(Mapper):
         :param columns: names of columns
         """
         self.columns = columns
+        self._columns = set(columns)
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        res = copy(row)
-        for key in row.keys():
-            if key not in self.columns:
-                res.pop(key, None)
+        yield {key: value for key, value in row.items()
+               if key in self._columns}
 
-        yield res
+    def required_columns(self, columns: TColumns) -> set[str] | None:
+        if columns is None:
+            return set(self.columns)
+        return set(self.columns) & set(columns)
 
+    def changed_columns(self) -> set[str] | None:
+        return set()
 
-class Pmi(Mapper):
-    """Leave only mentioned columns"""
+
+class Pmi(Compute):
+    """Pmi count"""
 
     def __init__(self, column_freq_in_docj: str,
                  column_freq_ind_all: str) -> None:
         """
-        :param columns: names of columns
+        :param column_freq_in_docj: name of word frequency in document column
+        :param column_freq_ind_all: name of word frequency in corpus column
         """
         self.column_freq_in_docj = column_freq_in_docj
         self.column_freq_ind_all = column_freq_ind_all
-
-    def __call__(self, row: TRow) -> TRowsGenerator:
-        row['pmi'] = math.log(row[self.column_freq_in_docj]
-                              / row[self.column_freq_ind_all])
-        yield row
-
-
-# Reducers
+        super().__init__([('pmi', ex.log(ex.col(column_freq_in_docj)
+                                         / ex.col(column_freq_ind_all)))])
 
 
 class TopN(Reducer):
@@ -499,6 +1062,8 @@ class TopN(Reducer):
 
     """Calculate top N by value"""
 
+    groupwise = True
+
     def __init__(self, column: str, n: int) -> None:
         """
         :param column: column name to get top by
@@ -507,23 +1072,27 @@ class TopN(Reducer):
         self.column_max = column
         self.n = n
 
-    def __call__(self, group_key: tuple[str, ...],
-                 rows: TRowsIterable) -> TRowsGenerator:
-        for key, group_items in (
-                groupby(rows, key=lambda x: itemgetter(*group_key)(x))):
-            arr: list[TopN.ComparableDict] = []
-            for el in group_items:
-                heapq.heappush(arr, TopN.ComparableDict(self.column_max, el))
-                if len(arr) > self.n:
-                    heapq.heappop(arr)
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        arr: list[TopN.ComparableDict] = []
+        for el in rows:
+            heapq.heappush(arr, TopN.ComparableDict(self.column_max, el))
+            if len(arr) > self.n:
+                heapq.heappop(arr)
+
+        for el in reversed(arr):  # type: ignore
+            yield el.get_dict()  # type: ignore
 
-            for el in reversed(arr):  # type: ignore
-                yield el.get_dict()  # type: ignore
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return _required(columns, [], [*group_key, self.column_max])
 
 
 class TermFrequency(Reducer):
     """Calculate frequency of values in column"""
 
+    groupwise = True
+
     def __init__(self, words_column: str, result_column: str = 'tf') -> None:
         """
         :param words_column: name for column with words
@@ -532,28 +1101,68 @@ class TermFrequency(Reducer):
         self.words_column = words_column
         self.result_column = result_column
 
-    def __call__(self, group_key: tuple[str, ...],
-                 rows: TRowsIterable) -> TRowsGenerator:
-        for key, group_items in (
-                groupby(rows, key=lambda x: itemgetter(*group_key)(x))):
-            rows_dict: dict[str, TRow] = {}
-            length = 0
-            for el in group_items:
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        memory = budget.active()
+        rows_dict: dict[str, TRow] = {}
+        # counts of words spilled when memory budget is exhausted
+        runs: list[budget.RowBuffer] = []
+        granted = 0
+        length = 0
+        try:
+            for el in rows:
                 length += 1
                 if el[self.words_column] in rows_dict:
-                    rows_dict[el[self.words_column]][self.result_column] += 1
-                else:
-                    new_el = copy(el)
-                    for column in el.keys():
-                        if (column not in group_key and
-                                column != self.words_column):
-                            new_el.pop(column, None)
-                    new_el[self.result_column] = 1
-                    rows_dict[el[self.words_column]] = new_el
-
-            for row in rows_dict.values():
+                    rows_dict[el[self.words_column]][
+                        self.result_column] += 1
+                    continue
+                if (memory is not None and
+                        len(rows_dict) % budget.SAMPLE == 0):
+                    size = (budget.row_size(el) + 8) * budget.SAMPLE
+                    if memory.grant(size):
+                        granted += size
+                    elif rows_dict:
+                        runs.append(self._spill(rows_dict))
+                        rows_dict = {}
+                        memory.release(granted)
+                        granted = 0
+                new_el = copy(el)
+                for column in el.keys():
+                    if (column not in group_key and
+                            column != self.words_column):
+                        new_el.pop(column, None)
+                new_el[self.result_column] = 1
+                rows_dict[el[self.words_column]] = new_el
+
+            counted: tp.Iterable[TRow] = rows_dict.values()
+            if runs:
+                runs.append(self._spill(rows_dict))
+                counted = self._merge_runs(runs)
+            for row in counted:
                 row[self.result_column] /= length
                 yield row
+        finally:
+            for run in runs:
+                run.close()
+            if memory is not None:
+                memory.release(granted)
+
+    def _spill(self, rows_dict: dict[str, TRow]) -> budget.RowBuffer:
+        return budget.spill_rows(
+            sorted(rows_dict.values(), key=itemgetter(self.words_column)))
+
+    def _merge_runs(self, runs: list[budget.RowBuffer]) -> TRowsGenerator:
+        """Sum counts of words in runs sorted by words"""
+        word = itemgetter(self.words_column)
+        for _, group in groupby(heapq.merge(*runs, key=word), key=word):
+            row = next(group)
+            for other in group:
+                row[self.result_column] += other[self.result_column]
+            yield row
+
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return {*group_key, self.words_column}
 
 
 class Count(Reducer):
@@ -566,29 +1175,45 @@ class Count(Reducer):
         {'a': 1, 'd': 2}
     """
 
+    groupwise = True
+
     def __init__(self, column: str) -> None:
         """
         :param column: name for result column
         """
         self.column = column
 
-    def __call__(self, group_key: tuple[str, ...],
-                 rows: TRowsIterable) -> TRowsGenerator:
-        for key, group_items in (
-                groupby(rows, key=lambda x: itemgetter(*group_key)(x))):
-            first_el = next(group_items)
-            new_el = copy(first_el)
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        group_items = iter(rows)
+        first_el = next(group_items)
+        length = 1
+        for _ in group_items:
+            length += 1
+        yield self._counted(group_key, first_el, length)
 
-            for column in first_el.keys():
-                if column not in group_key:
-                    new_el.pop(column, None)
+    def reduce_batch(self, group_key: tuple[str, ...],
+                     groups: list[list[TRow]]) -> TRowsGenerator:
+        for group in groups:
+            yield self._counted(group_key, group[0], len(group))
 
-            length = 1
-            for _ in group_items:
-                length += 1
+    def _counted(self, group_key: tuple[str, ...], first_el: TRow,
+                 length: int) -> TRow:
+        new_el = copy(first_el)
+
+        for column in first_el.keys():
+            if column not in group_key:
+                new_el.pop(column, None)
+
+        new_el[self.column] = length
+        return new_el
+
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return set(group_key)
 
-            new_el[self.column] = length
-            yield new_el
+    def combiner(self) -> Reducer | None:
+        return Sum(self.column)
 
 
 class CountRows(Reducer):
@@ -616,6 +1241,10 @@ class CountRows(Reducer):
         else:
             return
 
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return _required(columns, [self.result_column], [])
+
 
 class SumOfAllTable(Reducer):
     """
@@ -645,6 +1274,13 @@ class SumOfAllTable(Reducer):
         else:
             return
 
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return _required(columns, [self.res_column], [self.colum])
+
+    def combiner(self) -> Reducer | None:
+        return SumOfAllTable(self.res_column, self.res_column)
+
 
 class Sum(Reducer):
     """
@@ -656,29 +1292,37 @@ class Sum(Reducer):
         {'a': 1, 'b': 5}
     """
 
+    groupwise = True
+
     def __init__(self, column: str) -> None:
         """
         :param column: name for sum column
         """
         self.column = column
 
-    def __call__(self, group_key: tuple[str, ...],
-                 rows: TRowsIterable) -> TRowsGenerator:
-        for key, group_items in (
-                groupby(rows, key=lambda x: itemgetter(*group_key)(x))):
-            first_el = next(group_items)
-            new_el = copy(first_el)
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        group_items = iter(rows)
+        first_el = next(group_items)
+        new_el = copy(first_el)
 
-            for column in first_el.keys():
-                if column not in group_key:
-                    new_el.pop(column, None)
+        for column in first_el.keys():
+            if column not in group_key:
+                new_el.pop(column, None)
 
-            sum: tp.Any = first_el[self.column]
-            for el in group_items:
-                sum += el[self.column]
+        sum: tp.Any = first_el[self.column]
+        for el in group_items:
+            sum += el[self.column]
 
-            new_el[self.column] = sum
-            yield new_el
+        new_el[self.column] = sum
+        yield new_el
+
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return {*group_key, self.column}
+
+    def combiner(self) -> Reducer | None:
+        return Sum(self.column)
 
 
 class MulSum(Reducer):
@@ -691,36 +1335,44 @@ class MulSum(Reducer):
         {'a': 1, 'b': 5, 'c': 9}
     """
 
+    groupwise = True
+
     def __init__(self, columns: tp.Sequence[str]) -> None:
         """
         :param columns: names for sum columns
         """
         self.columns = columns
 
-    def __call__(self, group_key: tuple[str, ...],
-                 rows: TRowsIterable) -> TRowsGenerator:
-        for key, group_items in (
-                groupby(rows, key=lambda x: itemgetter(*group_key)(x))):
-            first_el = next(group_items)
-            new_el = copy(first_el)
+    def reduce_group(self, group_key: tuple[str, ...],
+                     rows: TRowsIterable) -> TRowsGenerator:
+        group_items = iter(rows)
+        first_el = next(group_items)
+        new_el = copy(first_el)
+
+        for column in first_el.keys():
+            if column not in group_key:
+                new_el.pop(column, None)
 
-            for column in first_el.keys():
-                if column not in group_key:
-                    new_el.pop(column, None)
+        sums: list[tp.Any] = []
 
-            sums: list[tp.Any] = []
+        for column in self.columns:
+            sums.append(first_el[column])
+
+        for el in group_items:
+            for ind, column in enumerate(self.columns):
+                sums[ind] += el[column]
 
-            for column in self.columns:
-                sums.append(first_el[column])
+        for ind, obj in enumerate(sums):
+            new_el[f'sum_{ind}'] = obj
 
-            for el in group_items:
-                for ind, column in enumerate(self.columns):
-                    sums[ind] += el[column]
+        yield new_el
 
-            for ind, obj in enumerate(sums):
-                new_el[f'sum_{ind}'] = obj
+    def required_columns(self, group_key: tuple[str, ...],
+                         columns: TColumns) -> set[str] | None:
+        return {*group_key, *self.columns}
 
-            yield new_el
+    def combiner(self) -> Reducer | None:
+        return MulSum([f'sum_{ind}' for ind in range(len(self.columns))])
 
 
 # Joiners
@@ -732,23 +1384,8 @@ class InnerJoiner(Joiner):
     def __call__(self, keys: tp.Sequence[str],
                  rows_a: TRowsIterable,
                  rows_b: TRowsIterable) -> TRowsGenerator:
-        list_b: list[TRow] = []
-        for el in rows_b:
-            list_b.append(el)
-        for row_a in rows_a:
-            for row_b in list_b:
-                new_row = copy(row_a)
-                for key, value in row_b.items():
-                    if key in keys:
-                        continue
-
-                    if key in new_row:
-                        new_row.pop(key, None)
-                        new_row[key + self._a_suffix] = row_a[key]
-                        new_row[key + self._b_suffix] = row_b[key]
-                        continue
-                    new_row[key] = value
-                yield new_row
+        with self._buffer(rows_b) as list_b:
+            yield from self._product(keys, rows_a, list_b)
 
 
 class OuterJoiner(Joiner):
@@ -757,33 +1394,18 @@ class OuterJoiner(Joiner):
     def __call__(self, keys: tp.Sequence[str],
                  rows_a: TRowsIterable,
                  rows_b: TRowsIterable) -> TRowsGenerator:
-        list_b: list[TRow] = []
-        for el in rows_b:
-            list_b.append(el)
-
-        if len(list_b) == 0:
-            yield from rows_a
-            return
-
-        empty = True
-        for row_a in rows_a:
-            empty = False
-            for row_b in list_b:
-                new_row = copy(row_a)
-                for key, value in row_b.items():
-                    if key in keys:
-                        continue
-
-                    if key in new_row:
-                        new_row.pop(key, None)
-                        new_row[key + self._a_suffix] = row_a[key]
-                        new_row[key + self._b_suffix] = row_b[key]
-                        continue
-                    new_row[key] = value
-                yield new_row
+        with self._buffer(rows_b) as list_b:
+            if len(list_b) == 0:
+                yield from rows_a
+                return
+
+            empty = True
+            for row in self._product(keys, rows_a, list_b):
+                empty = False
+                yield row
 
-        if empty:
-            yield from list_b
+            if empty:
+                yield from list_b
 
 
 class LeftJoiner(Joiner):
@@ -792,48 +1414,20 @@ class LeftJoiner(Joiner):
     def __call__(self, keys: tp.Sequence[str],
                  rows_a: TRowsIterable,
                  rows_b: TRowsIterable) -> TRowsGenerator:
-        list_b: list[TRow] = []
-        for el in rows_b:
-            list_b.append(el)
-
-        if len(list_b) == 0:
-            yield from rows_a
-            return
+        with self._buffer(rows_b) as list_b:
+            if len(list_b) == 0:
+                yield from rows_a
+                return
 
-        for row_a in rows_a:
-            for row_b in list_b:
-                new_row = copy(row_a)
-                for key, value in row_b.items():
-                    if key in keys:
-                        continue
-
-                    if key in new_row:
-                        new_row.pop(key, None)
-                        new_row[key + self._a_suffix] = row_a[key]
-                        new_row[key + self._b_suffix] = row_b[key]
-                        continue
-                    new_row[key] = value
-                yield new_row
+            yield from self._product(keys, rows_a, list_b)
 
 
 class CrossJoin(Joiner):
     def __call__(self, keys: tp.Sequence[str],
                  rows_a: TRowsIterable,
                  rows_b: TRowsIterable) -> TRowsGenerator:
-        list_b: list[TRow] = []
-        for el in rows_b:
-            list_b.append(el)
-        for row_a in rows_a:
-            for row_b in list_b:
-                new_row = copy(row_a)
-                for key, value in row_b.items():
-                    if key in new_row:
-                        new_row.pop(key, None)
-                        new_row[key + self._a_suffix] = row_a[key]
-                        new_row[key + self._b_suffix] = row_b[key]
-                        continue
-                    new_row[key] = value
-                yield new_row
+        with self._buffer(rows_b) as list_b:
+            yield from self._product((), rows_a, list_b)
 
 
 class RightJoiner(Joiner):
@@ -842,25 +1436,9 @@ class RightJoiner(Joiner):
     def __call__(self, keys: tp.Sequence[str],
                  rows_a: TRowsIterable,
                  rows_b: TRowsIterable) -> TRowsGenerator:
-        list_a: list[TRow] = []
-        for el in rows_a:
-            list_a.append(el)
-
-        if len(list_a) == 0:
-            yield from rows_b
-            return
+        with self._buffer(rows_a) as list_a:
+            if len(list_a) == 0:
+                yield from rows_b
+                return
 
-        for row_b in rows_b:
-            for row_a in list_a:
-                new_row = copy(row_b)
-                for key, value in row_a.items():
-                    if key in keys:
-                        continue
-
-                    if key in new_row:
-                        new_row.pop(key, None)
-                        new_row[key + self._a_suffix] = row_a[key]
-                        new_row[key + self._b_suffix] = row_b[key]
-                        continue
-                    new_row[key] = value
-                yield new_row
+            yield from self._product(keys, rows_b, list_a, right=True)
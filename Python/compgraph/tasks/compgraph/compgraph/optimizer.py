@@ -0,0 +1,780 @@
+import copyreg
+import functools
+import hashlib
+import os
+import sys
+import sysconfig
+import types
+import typing as tp
+from copy import copy
+
+from . import operations as ops
+from . import adaptive
+from . import checkpoint
+from . import expressions as ex
+from . import external_sort
+from . import parallel
+from . import pipeline
+from . import skew
+from . import statistics as stats
+from . import windows
+
+if tp.TYPE_CHECKING:
+    from .graph import Graph
+
+SOURCES = (ops.Read, ops.ReadIterFactory)
+# Operations passing rows through unchanged
+PASS_THROUGH = (pipeline.Prefetch, checkpoint.Checkpoint)
+# Operations whose outputs are checkpointed if no stage is marked
+CHECKPOINTED = (external_sort.ExternalSort, ops.Join, ops.JoinMany,
+                adaptive.AdaptiveReduce, skew.PartitionedReduce)
+# Rows of a source assumed when nothing is known about it
+DEFAULT_ROWS = 1000
+# Inputs of sorts seen to have at most this many rows are sorted in process
+MEMORY_SORT_ROWS = 50000
+
+
+class Node:
+    """Operation of a plan with plans of graphs it consumes"""
+
+    def __init__(self, operation: ops.Operation,
+                 inputs: list['Plan'] | None = None) -> None:
+        """
+        :param operation: operation to run
+        :param inputs: plans of joined graphs
+        """
+        self.operation = operation
+        self.inputs = inputs if inputs is not None else []
+        # Set by fingerprint and estimate_rows
+        self.fingerprint = ''
+        # the fingerprint captures all operations producing node output
+        self.fingerprinted = False
+        self.rows = 0.
+
+
+class Plan:
+    """Operations of a graph prepared for execution"""
+
+    def __init__(self, graph: 'Graph', nodes: list[Node]) -> None:
+        """
+        :param graph: graph the plan is built from
+        :param nodes: operations in order of execution
+        """
+        self.graph = graph
+        self.nodes = nodes
+
+    @property
+    def fingerprinted(self) -> bool:
+        """The fingerprint of output captures all operations, see
+        fingerprint"""
+        return bool(self.nodes) and self.nodes[-1].fingerprinted
+
+
+def describe(operation: ops.Operation) -> str:
+    """Short description of operation for plan reports"""
+    if isinstance(operation, ops.ReadIterFactory):
+        return f'ReadIterFactory({operation.name})'
+    if isinstance(operation, ops.Read):
+        return f'Read({operation.filename})'
+    if isinstance(operation, ops.Map):
+        return f'Map({type(operation.mapper).__name__})'
+    if isinstance(operation, ops.Reduce):
+        return f'Reduce({type(operation.reducer).__name__}, ' \
+            f'keys={list(operation.keys)})'
+    if isinstance(operation, external_sort.ExternalSort):
+        return f'Sort(keys={list(operation.keys)})'
+    if isinstance(operation, ops.Join):
+        return f'Join({type(operation.joiner).__name__}, ' \
+            f'keys={list(operation.keys)})'
+    if isinstance(operation, ops.JoinMany):
+        return f'JoinMany(tables={len(operation.suffixes)}, ' \
+            f'keys={list(operation.keys)})'
+    if isinstance(operation, windows.WindowReduce):
+        return f'Window({type(operation.accumulator).__name__}, ' \
+            f'keys={list(operation.keys)})'
+    return type(operation).__name__
+
+
+def build_plan(graph: 'Graph') -> Plan:
+    """Make plan executing graph operations as they are"""
+    joined = iter(graph.joiners)
+    nodes = []
+    for operation in graph.Operations_sequence:
+        inputs = []
+        if isinstance(operation, ops.Join):
+            inputs.append(build_plan(next(joined)))
+        if isinstance(operation, ops.JoinMany):
+            for _ in operation.suffixes[1:]:
+                inputs.append(build_plan(next(joined)))
+        if isinstance(operation, ops.Map):
+            for side_input in operation.side_inputs.values():
+                inputs.append(build_plan(side_input.graph))
+        nodes.append(Node(operation, inputs))
+    return Plan(graph, nodes)
+
+
+def _passes_filter(node: Node, columns: set[str]) -> bool:
+    operation = node.operation
+    if isinstance(operation, (external_sort.ExternalSort, *PASS_THROUGH)):
+        return True
+    if isinstance(operation, ops.Map):
+        mapper = operation.mapper
+        if isinstance(mapper, ops.Project):
+            return columns <= set(mapper.columns)
+        changed = mapper.changed_columns()
+        return changed is not None and not changed & columns
+    if isinstance(operation, ops.Reduce):
+        return operation.reducer.groupwise and columns <= set(operation.keys)
+    if isinstance(operation, (ops.Join, ops.JoinMany)):
+        return len(operation.keys) > 0 and columns <= set(operation.keys)
+    return False
+
+
+def _sink_filter(nodes: list[Node], node: Node, columns: set[str]) -> None:
+    position = len(nodes)
+    while position > 0 and _passes_filter(nodes[position - 1], columns):
+        for joined in nodes[position - 1].inputs:
+            _sink_filter(joined.nodes, Node(node.operation), columns)
+        position -= 1
+    nodes.insert(position, node)
+
+
+def push_filters(plan: Plan) -> None:
+    """Move filters with known columns upstream past operations that
+    keep these columns intact: sorts, mappers not changing them, reduces
+    and joins by keys including them
+    :param plan: plan to change
+    """
+    nodes: list[Node] = []
+    for node in plan.nodes:
+        for joined in node.inputs:
+            push_filters(joined)
+        operation = node.operation
+        if not isinstance(operation, ops.Map) or \
+                isinstance(operation, parallel.ParallelMap) or \
+                not isinstance(operation.mapper, ops.Filter) or \
+                operation.mapper.columns is None or operation.side_inputs:
+            nodes.append(node)
+            continue
+        condition = operation.mapper.condition
+        if isinstance(condition, ex.Expression):
+            for part in ex.conjuncts(condition):
+                _sink_filter(nodes, Node(ops.Map(ops.Filter(part))),
+                             set(part.columns))
+        else:
+            _sink_filter(nodes, node, set(operation.mapper.columns))
+    plan.nodes = nodes
+
+
+def _fuse(first: ops.Mapper, second: ops.Mapper) -> ops.Mapper | None:
+    if isinstance(first, ops.Compute) and isinstance(second, ops.Compute):
+        return ops.Compute(first.assignments + second.assignments)
+    if isinstance(first, ops.Filter) and isinstance(second, ops.Filter) \
+            and isinstance(first.condition, ex.Expression) \
+            and isinstance(second.condition, ex.Expression):
+        return ops.Filter(first.condition & second.condition)
+    return None
+
+
+def fuse_maps(plan: Plan) -> None:
+    """Replace chains of expression mappers and of expression filters
+    with single mappers computing them in one pass
+    :param plan: plan to change
+    """
+    nodes: list[Node] = []
+    for node in plan.nodes:
+        for joined in node.inputs:
+            fuse_maps(joined)
+        operation = node.operation
+        if nodes and type(operation) is ops.Map and \
+                type(nodes[-1].operation) is ops.Map and \
+                not operation.side_inputs and \
+                not nodes[-1].operation.side_inputs:
+            fused = _fuse(nodes[-1].operation.mapper, operation.mapper)
+            if fused is not None:
+                nodes[-1] = Node(ops.Map(fused))
+                continue
+        nodes.append(node)
+    plan.nodes = nodes
+
+
+def _sorted_by(node: Node | None, keys: tp.Sequence[str]) -> bool:
+    return node is not None and \
+        isinstance(node.operation, external_sort.ExternalSort) and \
+        list(node.operation.keys) == list(keys)
+
+
+# Joiners joining each row with its whole joined group in turn, so their
+# output is the same for any split of rows into groups
+_ROW_BY_ROW = (ops.InnerJoiner, ops.LeftJoiner, ops.OuterJoiner)
+
+
+def _reordered(nodes: list[Node], keys: tp.Sequence[str]) -> bool:
+    """Whether rows passed to nodes are only mapped keeping keys and then
+    stably sorted by keys among others, so rows of different values of
+    keys do not mix and their order before does not matter"""
+    for node in nodes:
+        operation = node.operation
+        if isinstance(operation, PASS_THROUGH):
+            continue
+        if type(operation) is ops.Map:
+            changed = operation.mapper.changed_columns()
+            if changed is None or not changed.isdisjoint(keys):
+                return False
+            continue
+        return isinstance(operation, external_sort.ExternalSort) and \
+            set(keys) <= set(operation.keys)
+    return False
+
+
+def adapt(plan: Plan) -> None:
+    """Merge sorts into reduces and joins by the same keys after them,
+    so these choose between hashing and sorting while running
+    :param plan: plan to change
+    """
+    nodes: list[Node] = []
+    for index, node in enumerate(plan.nodes):
+        for joined in node.inputs:
+            adapt(joined)
+        operation = node.operation
+        previous = nodes[-1] if nodes else None
+        if type(operation) is ops.Reduce and operation.keys and \
+                _sorted_by(previous, operation.keys):
+            nodes[-1] = Node(adaptive.AdaptiveReduce(operation.reducer,
+                                                     operation.keys))
+            continue
+        if isinstance(operation, skew.PartitionedReduce) and \
+                _sorted_by(previous, operation.keys):
+            # partitions are sorted separately, each in memory or
+            # externally, and spill to disk, so memory stays bounded
+            nodes.pop()
+        if type(operation) is ops.Join and operation.keys:
+            joined = node.inputs[0]
+            sort_a = _sorted_by(previous, operation.keys)
+            sort_b = _sorted_by(joined.nodes[-1], operation.keys)
+            if sort_a or sort_b:
+                if sort_a:
+                    nodes.pop()
+                if sort_b:
+                    joined.nodes.pop()
+                ordered = not (
+                    isinstance(operation.joiner, _ROW_BY_ROW) and
+                    _reordered(plan.nodes[index + 1:], operation.keys))
+                node = Node(adaptive.AdaptiveJoin(
+                    operation.joiner, operation.keys, sort_a, sort_b,
+                    bloom_error_rate=operation.bloom_error_rate,
+                    ordered=ordered), node.inputs)
+        nodes.append(node)
+    plan.nodes = nodes
+
+
+def _adds_unused(mapper: ops.Mapper, columns: ops.TColumns) -> bool:
+    if columns is None:
+        return False
+    read = mapper.required_columns(set())
+    changed = mapper.changed_columns()
+    if read is None or changed is None:
+        return True
+    return not (read | changed) <= columns
+
+
+def push_projections(plan: Plan, columns: ops.TColumns = None) -> bool:
+    """Keep only columns used downstream: make sources drop the rest and
+    insert Project before sorts and joins if extra columns may appear
+    :param plan: plan to change
+    :param columns: columns used from plan output, None if all
+    :return: whether plan output may still have unused columns
+    """
+    used: list[ops.TColumns] = []
+    for node in reversed(plan.nodes):
+        used.append(columns)
+        columns = node.operation.required_columns(columns)
+    used.reverse()
+
+    nodes: list[Node] = []
+    unused = False
+    for node, output in zip(plan.nodes, used):
+        operation = node.operation
+        if isinstance(operation, SOURCES):
+            operation = copy(operation)
+            operation.columns = output
+            node = Node(operation, node.inputs)
+            unused = False
+        elif isinstance(operation, (external_sort.ExternalSort, ops.Join,
+                                    ops.JoinMany, adaptive.AdaptiveReduce,
+                                    skew.PartitionedReduce)):
+            required = operation.required_columns(output)
+            if unused and required is not None:
+                nodes.append(Node(ops.Map(ops.Project(sorted(required)))))
+            for joined in node.inputs:
+                if push_projections(joined, required) and \
+                        required is not None:
+                    joined.nodes.append(
+                        Node(ops.Map(ops.Project(sorted(required)))))
+            unused = False
+        elif isinstance(operation, ops.Map):
+            for side_input, side_plan in zip(
+                    operation.side_inputs.values(), node.inputs):
+                push_projections(side_plan, side_input.required_columns())
+            if isinstance(operation.mapper, ops.Project):
+                unused = output is not None and \
+                    not set(operation.mapper.columns) <= output
+            else:
+                unused = unused or _adds_unused(operation.mapper, output)
+        elif isinstance(operation, ops.Reduce):
+            unused = unused or output is not None and \
+                not set(operation.keys) <= output
+        elif not isinstance(operation, PASS_THROUGH):
+            unused = True
+        nodes.append(node)
+    plan.nodes = nodes
+    return unused
+
+
+def sources(plan: Plan) -> tp.Generator[ops.Operation, None, None]:
+    """Sources of the plan and of plans it reads"""
+    for node in plan.nodes:
+        if isinstance(node.operation, SOURCES):
+            yield node.operation
+        for joined in node.inputs:
+            yield from sources(joined)
+
+
+def source_states(plan: Plan, contents: bool = False) -> str:
+    """States of sources of the plan, see checkpoint.source_state"""
+    return ''.join(sorted(checkpoint.source_state(source, contents)
+                          for source in sources(plan)))
+
+
+def input_states(plan: Plan, inputs: tp.Mapping[str, str] | None = None,
+                 contents: bool = False) -> str | None:
+    """States of sources of the plan with states of iterators it reads
+    :param inputs: states of iterators by name
+    :param contents: hash contents of files
+    :return: states, None if an iterator read has no state
+    """
+    inputs = inputs or {}
+    states = [source_states(plan, contents)]
+    for source in sources(plan):
+        if isinstance(source, ops.ReadIterFactory):
+            if source.name not in inputs:
+                return None
+            states.append(f'{source.name}={inputs[source.name]}')
+    return ''.join(states)
+
+
+def source_columns(plan: Plan) -> dict[str, ops.TColumns]:
+    """Columns read from every source of the plan, None if all
+    :param plan: plan after push_projections
+    """
+    result: dict[str, ops.TColumns] = {}
+    for source in sources(plan):
+        if isinstance(source, ops.ReadIterFactory):
+            name = source.name
+        else:
+            name = tp.cast(ops.Read, source).filename
+        known = result.get(name, set())
+        columns = tp.cast(ops.TColumns, getattr(source, 'columns'))
+        if known is None or columns is None:
+            result[name] = None
+        else:
+            result[name] = set(known) | set(columns)
+    return result
+
+
+def strategy(operation: ops.Operation) -> str:
+    """How operation processes rows, for plan reports"""
+    if isinstance(operation, SOURCES):
+        return 'scan'
+    if isinstance(operation, parallel.ParallelMap):
+        return f'{operation.workers} ' \
+            f'{"threads" if operation.threads else "processes"}, ' \
+            f'{"ordered" if operation.ordered else "unordered"}'
+    if isinstance(operation, ops.Map):
+        return 'stream, side inputs' if operation.side_inputs else 'stream'
+    if isinstance(operation, skew.PartitionedReduce):
+        return f'{operation.partitions} partitions'
+    if isinstance(operation, parallel.ParallelReduce):
+        return f'{operation.workers} ' \
+            f'{"threads" if operation.threads else "processes"}, ' \
+            'sorted groups'
+    if isinstance(operation, adaptive.AdaptiveReduce):
+        return 'hash or sort' if operation.memory_limit else 'sort'
+    if isinstance(operation, ops.Reduce):
+        return 'sorted groups' if operation.reducer.groupwise and \
+            operation.keys else 'whole table'
+    if isinstance(operation, external_sort.ExternalSort):
+        return 'in-memory sort' if operation.memory_rows else 'external sort'
+    if isinstance(operation, adaptive.AdaptiveJoin):
+        if not operation.memory_limit:
+            return 'sort-merge join'
+        return 'adaptive hash join' if operation.ordered \
+            else 'adaptive broadcast join'
+    if isinstance(operation, ops.Join):
+        return 'merge join' if operation.keys else 'nested loop'
+    if isinstance(operation, ops.JoinMany):
+        return 'multi-way merge join'
+    if isinstance(operation, pipeline.Prefetch):
+        return f'thread, {operation.queue_batches} batches ahead'
+    if isinstance(operation, checkpoint.Checkpoint):
+        return 'write to disk' if operation.path is not None else ''
+    if isinstance(operation, windows.WindowReduce):
+        if operation.slide == operation.size:
+            return f'tumbling {operation.size}'
+        return f'sliding {operation.size} by {operation.slide}'
+    return ''
+
+
+class _Unknown(Exception):
+    """Value whose state can not be captured"""
+
+
+# Deepest nesting of values described
+_MAX_DEPTH = 32
+
+
+def _name(value: tp.Any) -> str:
+    module = getattr(value, '__module__', None) or getattr(
+        getattr(value, '__objclass__', None), '__module__', '')
+    return f'{module}.{value.__qualname__}'
+
+
+@functools.cache
+def _library(module_name: str) -> bool:
+    """Module is built in or installed, not code of the graph author"""
+    module = sys.modules.get(module_name)
+    path = getattr(module, '__file__', None)
+    if path is None:
+        return module is not None
+    paths = sysconfig.get_paths()
+    return any(path.startswith(paths[name])
+               for name in ('stdlib', 'platstdlib', 'purelib', 'platlib'))
+
+
+def _global_names(code: types.CodeType) -> set[str]:
+    """Names code and functions defined in it may read from globals"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _state(value: tp.Any, active: tuple[int, ...] = ()) -> str:
+    """Canonical description of value, stable between processes
+    :param active: ids of values being described, to stop at cycles
+    :raises _Unknown: if some part of value can not be described
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return repr(value)
+    if id(value) in active:
+        return '<cycle>'
+    if len(active) >= _MAX_DEPTH:
+        raise _Unknown(value)
+    active += (id(value),)
+    if isinstance(value, list):
+        return '[' + ','.join(_state(item, active) for item in value) + ']'
+    if isinstance(value, tuple):
+        return '(' + ','.join(_state(item, active) for item in value) + ')'
+    if isinstance(value, (set, frozenset)):
+        return '{' + ','.join(sorted(_state(item, active)
+                                     for item in value)) + '}'
+    if isinstance(value, dict):
+        return '{' + ','.join(sorted(
+            f'{_state(key, active)}:{_state(item, active)}'
+            for key, item in value.items())) + '}'
+    if isinstance(value, types.CodeType):
+        return _state((value.co_code, value.co_consts, value.co_names),
+                      active)
+    if isinstance(value, types.FunctionType) and _library(value.__module__) \
+            and value.__name__ != '<lambda>':
+        # functions of libraries are known by names, as pickle does
+        return _name(value)
+    if isinstance(value, types.FunctionType):
+        closure = []
+        for cell in value.__closure__ or ():
+            try:
+                closure.append(cell.cell_contents)
+            except ValueError:
+                # a variable not assigned yet
+                closure.append('<empty>')
+        # globals read by the function change what it computes as well
+        used = {name: value.__globals__[name]
+                for name in _global_names(value.__code__)
+                if name in value.__globals__}
+        return _name(value) + _state(
+            (value.__code__, value.__defaults__, value.__kwdefaults__,
+             closure, used), active)
+    if isinstance(value, types.ModuleType):
+        return f'module {value.__name__}'
+    if isinstance(value, type):
+        return _name(value)
+    if isinstance(value, (types.BuiltinFunctionType,
+                          types.MethodDescriptorType,
+                          types.WrapperDescriptorType,
+                          types.ClassMethodDescriptorType)):
+        bound = getattr(value, '__self__', None)
+        if bound is None or isinstance(bound, types.ModuleType):
+            return _name(value)
+        return _name(value) + _state(bound, active)
+    if isinstance(value, types.MethodType):
+        return _state((value.__self__, value.__func__), active)
+    # other values as they are pickled: datetimes and decimals by their
+    # values, objects by their classes and __getstate__
+    try:
+        reducer = copyreg.dispatch_table.get(type(value))
+        reduced = reducer(value) if reducer is not None \
+            else value.__reduce_ex__(4)
+    except Exception as error:
+        raise _Unknown(value) from error
+    if isinstance(reduced, str):
+        # a global singleton
+        return f'{type(value).__module__}.{reduced}'
+    parts = [_name(reduced[0]) if hasattr(reduced[0], '__qualname__')
+             else _state(reduced[0], active)]
+    parts.extend(_state(part if not isinstance(part, tp.Iterator)
+                        else list(part), active)
+                 for part in reduced[1:])
+    return f'{type(value).__qualname__}(' + ','.join(parts) + ')'
+
+
+def _operation_state(operation: ops.Operation) -> str:
+    if isinstance(operation, ops.Map):
+        side_inputs = {name: (side_input.column, side_input.keys,
+                              side_input.default)
+                       for name, side_input in operation.side_inputs.items()}
+        return _state(('Map', operation.mapper, side_inputs))
+    return _state(operation)
+
+
+def fingerprint(plan: Plan) -> str:
+    """Set fingerprints of plan nodes: digests of operations producing
+    node output, equal for equal computations. Nodes after an operation
+    whose state can not be captured, e.g. a function reading a generator,
+    get fingerprints unique to the process and are not fingerprinted, so
+    their outputs are never taken from checkpoints or caches
+    :return: fingerprint of plan output
+    """
+    digest = ''
+    fingerprinted = True
+    for node in plan.nodes:
+        if isinstance(node.operation, PASS_THROUGH):
+            # rows are the same as before it
+            node.fingerprint = digest
+            node.fingerprinted = fingerprinted
+            continue
+        inputs = [fingerprint(joined) for joined in node.inputs]
+        fingerprinted = fingerprinted and all(
+            joined.fingerprinted for joined in node.inputs)
+        try:
+            state = _operation_state(node.operation)
+        except _Unknown:
+            state = f'{describe(node.operation)}@{id(node.operation)}'
+            fingerprinted = False
+        node.fingerprint = digest = hashlib.sha1(
+            (digest + state + ''.join(inputs)).encode()).hexdigest()
+        node.fingerprinted = fingerprinted
+    return digest
+
+
+def estimate_rows(plan: Plan,
+                  statistics: stats.Statistics | None = None) -> float:
+    """Set estimated output rows of plan nodes
+    :param plan: plan with fingerprints
+    :param statistics: statistics observed in earlier runs
+    :return: estimated rows of plan output
+    """
+    statistics = statistics if statistics is not None else stats.Statistics()
+    rows = 0.
+    previous = ''
+    for node in plan.nodes:
+        operation = node.operation
+        inputs = [estimate_rows(joined, statistics)
+                  for joined in node.inputs]
+        known = statistics.rows(node.fingerprint)
+        if known is not None:
+            rows = known
+        elif isinstance(operation, SOURCES):
+            rows = DEFAULT_ROWS
+        elif isinstance(operation, ops.Map):
+            rows *= operation.mapper.fanout
+        elif isinstance(operation, ops.Reduce):
+            reducer = operation.reducer
+            if not reducer.groupwise or not operation.keys:
+                rows = min(rows, 1.)
+            else:
+                rows = statistics.distinct(previous, operation.keys) or \
+                    max(1., rows * reducer.fanout)
+        elif isinstance(operation, ops.Join):
+            rows = _join_rows(operation, rows, inputs[0], statistics,
+                              previous, node.inputs[0])
+        elif isinstance(operation, ops.JoinMany):
+            rows = rows if operation.left else max([rows, *inputs])
+        node.rows = rows
+        previous = node.fingerprint
+    return rows
+
+
+def _join_rows(join: ops.Join, rows: float, other: float,
+               statistics: stats.Statistics, fingerprint: str,
+               joined: Plan) -> float:
+    joiner = join.joiner
+    if not join.keys or isinstance(joiner, ops.CrossJoin):
+        return rows * other
+    if isinstance(joiner, ops.OuterJoiner):
+        return rows + other
+    if isinstance(joiner, ops.LeftJoiner):
+        return rows
+    if isinstance(joiner, ops.RightJoiner):
+        return other
+    distinct = statistics.distinct(fingerprint, join.keys)
+    other_distinct = statistics.distinct(
+        joined.nodes[-1].fingerprint, join.keys) if joined.nodes else None
+    if distinct and other_distinct:
+        return rows * other / max(distinct, other_distinct)
+    return max(rows, other)
+
+
+def choose_strategies(plan: Plan, statistics: stats.Statistics) -> None:
+    """Switch operations to cheaper implementations where statistics of
+    earlier runs allow: sort inputs seen to be small in process, sort big
+    inputs of reduces and joins at once instead of trying hash tables,
+    salt keys seen to be hot in partitioned reduces
+    :param plan: plan with fingerprints
+    :param statistics: statistics observed in earlier runs
+    """
+    previous = ''
+    for node in plan.nodes:
+        for joined in node.inputs:
+            choose_strategies(joined, statistics)
+        operation = node.operation
+        rows = statistics.rows(previous)
+        if isinstance(operation, external_sort.ExternalSort):
+            if rows is not None and rows <= MEMORY_SORT_ROWS:
+                node.operation = external_sort.ExternalSort(
+                    operation.keys, memory_rows=MEMORY_SORT_ROWS,
+                    encode_keys=operation.encode_keys)
+        elif isinstance(operation, (adaptive.AdaptiveReduce,
+                                    adaptive.AdaptiveJoin)):
+            if isinstance(operation, adaptive.AdaptiveJoin) and \
+                    node.inputs[0].nodes:
+                joined_rows = statistics.rows(
+                    node.inputs[0].nodes[-1].fingerprint)
+                if joined_rows is not None and rows is not None:
+                    rows = min(rows, joined_rows)
+            if rows is not None and rows > MEMORY_SORT_ROWS:
+                node.operation = copy(operation)
+                node.operation.memory_limit = 0
+        elif isinstance(operation, skew.PartitionedReduce):
+            heavy = statistics.heavy(previous, operation.keys)
+            if operation.hot is None and heavy is not None and rows:
+                node.operation = copy(operation)
+                node.operation.hot = skew.hot_keys(heavy, rows,
+                                                   operation.partitions)
+        previous = node.fingerprint
+
+
+def _prefetch(node: Node) -> Node:
+    prefetch = Node(pipeline.Prefetch())
+    prefetch.fingerprint = node.fingerprint
+    prefetch.rows = node.rows
+    return prefetch
+
+
+def add_prefetch(plan: Plan) -> None:
+    """Put Prefetch after sources and on both sides of external sorts, so
+    reading, sending rows to sort workers and receiving them back overlap
+    with other operations
+    :param plan: plan with fingerprints to change
+    """
+    nodes: list[Node] = []
+    for node in plan.nodes:
+        for joined in node.inputs:
+            add_prefetch(joined)
+        operation = node.operation
+        sort = isinstance(operation, external_sort.ExternalSort)
+        if sort and nodes and \
+                not isinstance(nodes[-1].operation, pipeline.Prefetch):
+            nodes.append(_prefetch(nodes[-1]))
+        nodes.append(node)
+        if sort or isinstance(operation, SOURCES):
+            nodes.append(_prefetch(node))
+    plan.nodes = nodes
+
+
+def _marked(plan: Plan) -> bool:
+    return any(isinstance(node.operation, checkpoint.Checkpoint) or
+               any(_marked(joined) for joined in node.inputs)
+               for node in plan.nodes)
+
+
+def _checkpoint(node: Node, directory: str, sources: str,
+                max_bytes: int) -> Node:
+    path = os.path.join(directory,
+                        checkpoint.name(node.fingerprint, sources))
+    saved = Node(checkpoint.Checkpoint(path, max_bytes))
+    saved.fingerprint = node.fingerprint
+    saved.rows = node.rows
+    return saved
+
+
+def add_checkpoints(plan: Plan, directory: str,
+                    inputs: tp.Mapping[str, str] | None = None,
+                    auto: bool | None = None,
+                    max_bytes: int = checkpoint.MAX_BYTES) -> None:
+    """Write outputs of marked stages, or of sorts, joins and sorting
+    reduces if none are marked, to checkpoints in directory, and start
+    plans from their deepest existing checkpoints. Plans reading
+    iterators without states are left as they are
+    :param plan: plan with fingerprints to change
+    :param directory: directory of checkpoints
+    :param inputs: states of iterators read by the plan by name
+    :param auto: checkpoint sorts, joins and sorting reduces, by default
+     if no stage is marked
+    :param max_bytes: size of checkpoints kept in directory at most
+    """
+    states = input_states(plan, inputs)
+    if states is None:
+        return
+    if auto is None:
+        auto = not _marked(plan)
+    _add_checkpoints(plan, directory, states, auto, max_bytes)
+
+
+def _add_checkpoints(plan: Plan, directory: str, sources: str,
+                     auto: bool, max_bytes: int) -> None:
+    nodes: list[Node] = []
+    for node in plan.nodes:
+        operation = node.operation
+        if isinstance(operation, checkpoint.Checkpoint):
+            nodes.append(_checkpoint(node, directory, sources, max_bytes))
+            continue
+        nodes.append(node)
+        if auto and isinstance(operation, CHECKPOINTED):
+            nodes.append(_checkpoint(node, directory, sources, max_bytes))
+
+    for position in reversed(range(len(nodes))):
+        operation = nodes[position].operation
+        if isinstance(operation, checkpoint.Checkpoint) and \
+                operation.path is not None and \
+                os.path.exists(operation.path):
+            resumed = Node(checkpoint.ReadCheckpoint(operation.path))
+            resumed.fingerprint = nodes[position].fingerprint
+            resumed.rows = nodes[position].rows
+            nodes = [resumed] + nodes[position + 1:]
+            break
+    for node in nodes:
+        for joined in node.inputs:
+            _add_checkpoints(joined, directory, sources, auto, max_bytes)
+    plan.nodes = nodes
+
+
+def optimize(graph: 'Graph') -> Plan:
+    """Make plan for running graph"""
+    plan = build_plan(graph)
+    push_filters(plan)
+    fuse_maps(plan)
+    adapt(plan)
+    push_projections(plan)
+    fingerprint(plan)
+    return plan
@@ -0,0 +1,225 @@
+"""
+Map and reduce running on several workers.
+
+Rows are cut into batches which are mapped by a pool of processes, or of
+threads for mappers spending their time outside of the GIL. Processes get
+the mapper once on start and batches in the record format both ways.
+At most a few batches per worker are in flight, so a slow consumer stops
+reading of input instead of piling mapped rows up in memory.
+
+In ordered mode mapped batches are sent in order of input, otherwise as
+soon as they are ready, so one slow batch does not hold up the others.
+Reduce cuts sorted input into batches at boundaries of groups and always
+sends results in order, so its output stays sorted by keys. A group of
+more than group_rows rows is not gathered into a batch but streamed
+through the reducer in the calling process, after results of the batches
+before it, so a batch holds at most batch_rows + group_rows rows.
+"""
+import typing as tp
+from collections import deque
+from concurrent import futures
+from itertools import chain, groupby, islice
+
+from . import operations as ops
+from . import records
+
+BATCH_ROWS = 1024
+# Rows of a group sent to a worker at most, larger ones are reduced locally
+GROUP_ROWS = 64 * BATCH_ROWS
+# Batches sent to a worker before its results are taken
+IN_FLIGHT = 2
+
+_function: tp.Callable[[ops.TRowsIterable], ops.TRowsIterable] | None = None
+
+
+def _start(function: tp.Callable[[ops.TRowsIterable],
+                                 ops.TRowsIterable]) -> None:
+    global _function
+    _function = function
+
+
+def _run_block(payload: bytes) -> bytes:
+    """Process rows of a block in a worker process"""
+    assert _function is not None
+    return records.pack_block(
+        list(_function(records.unpack_block(payload))))
+
+
+def _run_rows(function: tp.Callable[[ops.TRowsIterable], ops.TRowsIterable],
+              rows: list[ops.TRow]) -> list[ops.TRow]:
+    return list(function(rows))
+
+
+class _Local(tp.NamedTuple):
+    """Rows processed in the calling process instead of by a worker"""
+    rows: ops.TRowsIterable
+
+
+def in_pool(function: tp.Callable[[ops.TRowsIterable], ops.TRowsIterable],
+            batches: tp.Iterable[list[ops.TRow] | _Local], workers: int,
+            ordered: bool = True, threads: bool = False,
+            stats: dict[str, tp.Any] | None = None) -> ops.TRowsGenerator:
+    """Apply function to batches of rows by a pool of workers
+    :param function: function taking rows of a batch, picklable unless
+     threads are used
+    :param batches: batches of rows, rows to process locally once
+     results of the batches before them are sent
+    :param workers: number of workers
+    :param ordered: send results in order of batches
+    :param threads: use threads instead of processes
+    :param stats: counters of the operation
+    """
+    executor: futures.Executor
+    if threads:
+        executor = futures.ThreadPoolExecutor(workers)
+
+        def submit(batch: list[ops.TRow]) -> futures.Future[tp.Any]:
+            return executor.submit(_run_rows, function, batch)
+    else:
+        executor = futures.ProcessPoolExecutor(
+            workers, initializer=_start, initargs=(function,))
+
+        def submit(batch: list[ops.TRow]) -> futures.Future[tp.Any]:
+            return executor.submit(_run_block, records.pack_block(batch))
+
+    def result(future: futures.Future[tp.Any]) -> list[ops.TRow]:
+        done = future.result()
+        return done if threads else records.unpack_block(done)
+
+    iterator = iter(batches)
+    pending: deque[futures.Future[tp.Any]] = deque()
+    limit = workers * IN_FLIGHT
+    count = 0
+    local = 0
+    try:
+        while True:
+            batch = next(iterator, None)
+            if isinstance(batch, _Local):
+                while pending:
+                    yield from result(pending.popleft())
+                yield from function(batch.rows)
+                local += 1
+                continue
+            if batch is not None:
+                pending.append(submit(batch))
+                count += 1
+                if len(pending) < limit:
+                    continue
+            if not pending:
+                break
+            if ordered:
+                yield from result(pending.popleft())
+                continue
+            done, _ = futures.wait(pending,
+                                   return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield from result(future)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    if stats is not None:
+        stats['batches'] = count
+        if local:
+            stats['local_batches'] = local
+
+
+def _batches(rows: ops.TRowsIterable,
+             batch_rows: int) -> tp.Generator[list[ops.TRow], None, None]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_rows)):
+        yield batch
+
+
+def _group_batches(rows: ops.TRowsIterable, keys: tp.Sequence[str],
+                   batch_rows: int, group_rows: int = GROUP_ROWS
+                   ) -> tp.Generator[list[ops.TRow] | _Local, None, None]:
+    """Batches of whole groups, of at least batch_rows rows but the last,
+    groups of more than group_rows rows come alone to be processed locally
+    """
+    batch: list[ops.TRow] = []
+    for _, group in groupby(rows, key=ops.row_key(keys)):
+        head = list(islice(group, group_rows + 1))
+        if len(head) > group_rows:
+            if batch:
+                yield batch
+                batch = []
+            # the group is read to its end before groupby goes on
+            yield _Local(chain(head, group))
+            continue
+        batch.extend(head)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ParallelMap(ops.Map):
+    """Map by a pool of workers, see module description"""
+
+    def __init__(self, mapper: ops.Mapper,
+                 side_inputs: tp.Mapping[str, tp.Any] | None = None,
+                 workers: int = 2, ordered: bool = True,
+                 threads: bool = False,
+                 batch_rows: int = BATCH_ROWS) -> None:
+        """
+        :param mapper: mapper to use, picklable unless threads are used
+        :param side_inputs: descriptions of side inputs by name
+        :param workers: number of workers
+        :param ordered: keep order of rows
+        :param threads: use threads instead of processes
+        :param batch_rows: rows sent to a worker at once
+        """
+        super().__init__(mapper, side_inputs)
+        self.workers = workers
+        self.ordered = ordered
+        self.threads = threads
+        self.batch_rows = batch_rows
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        mapper = self.mapper
+        if self.side_inputs:
+            mapper = mapper.bind({name: resolve() for name, resolve
+                                  in kwargs['side_inputs'].items()})
+        yield from in_pool(mapper.map_rows, _batches(rows, self.batch_rows),
+                           self.workers, self.ordered, self.threads,
+                           kwargs.get('stats'))
+
+
+class ParallelReduce(ops.Reduce):
+    """Reduce batches of whole groups by a pool of workers, results come
+    in order of keys as from Reduce"""
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str],
+                 workers: int = 2, threads: bool = False,
+                 batch_rows: int = BATCH_ROWS,
+                 group_rows: int = GROUP_ROWS) -> None:
+        """
+        :param reducer: reducer to use, picklable unless threads are used
+        :param keys: keys for grouping
+        :param workers: number of workers
+        :param threads: use threads instead of processes
+        :param batch_rows: rows sent to a worker at once at least, unless
+         groups end
+        :param group_rows: rows of a group sent to a worker at most,
+         larger groups are reduced in the calling process
+        """
+        super().__init__(reducer, keys)
+        self.workers = workers
+        self.threads = threads
+        self.batch_rows = batch_rows
+        self.group_rows = group_rows
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        if not self.reducer.groupwise or not self.keys:
+            yield from self.reduce(rows)
+            return
+        # a plain Reduce is sent to workers, not this one with its pool
+        reduce = ops.Reduce(self.reducer, self.keys)
+        yield from in_pool(reduce.reduce,
+                           _group_batches(rows, self.keys, self.batch_rows,
+                                          self.group_rows),
+                           self.workers, threads=self.threads,
+                           stats=kwargs.get('stats'))
@@ -0,0 +1,213 @@
+"""
+Stages of a graph running in their own threads.
+
+Operations of a graph are generators pulled one row at a time by the
+consumer, so while a source waits for the disk or a sort for its pipe
+nothing else runs. Prefetch runs everything upstream of it in a producer
+thread which hands rows over by batches through a bounded queue: the
+producer is stopped by a full queue, so at most a few batches are read
+ahead. Batches start small, for the first rows to come soon, and double
+while they are produced quickly. Rows are pulled from upstream by a
+reader thread of their own, so a batch is sent FLUSH_SECONDS after its
+first row even while upstream waits for the next one.
+
+Graph.run(RunOptions(pipeline=True)) puts Prefetch after sources and on
+both sides of external sorts, or it may be placed by Graph.prefetch().
+"""
+import contextvars
+import queue
+import threading
+import time
+import typing as tp
+from collections import deque
+
+from . import operations as ops
+
+# Batches read ahead by the producer
+QUEUE_BATCHES = 4
+MIN_BATCH = 16
+MAX_BATCH = 4096
+# A batch is sent after this time even if not full
+FLUSH_SECONDS = 0.05
+# How often a blocked producer checks whether the consumer has gone
+_POLL_SECONDS = 0.1
+
+
+class Failed:
+    """Error of a producer passed to the consumer"""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+END = object()
+
+
+class _Batch:
+    """Rows read by the reader thread and not yet taken by the sender.
+    Rows are appended and popped without the lock, which is only taken
+    to wake the other thread up"""
+
+    def __init__(self) -> None:
+        self.changed = threading.Condition()
+        self.rows: deque[ops.TRow] = deque()
+        # when the first of rows came
+        self.started = 0.
+        self.size = MIN_BATCH
+        self.ended = False
+        self.error: BaseException | None = None
+        self.stopped = False
+
+    def read(self, rows: ops.TRowsIterable) -> None:
+        """Append rows while the sender takes them, in the reader thread;
+        upstream generators are closed at the end"""
+        iterator = iter(rows)
+        changed = self.changed
+        append = self.rows.append
+        try:
+            for row in iterator:
+                append(row)
+                count = len(self.rows)
+                if count == 1:
+                    with changed:
+                        self.started = time.perf_counter()
+                        changed.notify()
+                elif count >= self.size:
+                    with changed:
+                        changed.notify()
+                        while len(self.rows) >= self.size and \
+                                not self.stopped:
+                            changed.wait()
+                if self.stopped:
+                    return
+        except BaseException as error:
+            self.error = error
+        finally:
+            # upstream generators are finished in the thread running them
+            if isinstance(iterator, tp.Generator):
+                iterator.close()
+            with changed:
+                self.ended = True
+                changed.notify()
+
+    def take(self) -> list[ops.TRow]:
+        """Rows once there are enough of them, the first of them came
+        FLUSH_SECONDS ago or reading has ended"""
+        changed = self.changed
+        with changed:
+            while not self.ended and len(self.rows) < self.size:
+                if not self.rows:
+                    changed.wait()
+                    continue
+                left = self.started + FLUSH_SECONDS - time.perf_counter()
+                if left <= 0:
+                    break
+                changed.wait(left)
+            popleft = self.rows.popleft
+            rows = [popleft() for _ in range(min(len(self.rows),
+                                                 self.size))]
+            if len(rows) >= self.size:
+                self.size = min(self.size * 2, MAX_BATCH)
+            if self.rows:
+                self.started = time.perf_counter()
+            changed.notify()
+            return rows
+
+    def stop(self) -> None:
+        with self.changed:
+            self.stopped = True
+            self.changed.notify()
+
+
+def send_batches(rows: ops.TRowsIterable,
+                 put: tp.Callable[[tp.Any], bool]) -> None:
+    """Send rows by batches growing up to MAX_BATCH, then the end marker
+    or the error raised by rows. Rows are read by a reader thread in the
+    current context, upstream generators are closed there at the end
+    :param rows: rows to send
+    :param put: function sending a batch or marker, False if the consumer
+     has gone
+    """
+    batch = _Batch()
+    context = contextvars.copy_context()
+    reader = threading.Thread(target=context.run, args=(batch.read, rows),
+                              name='compgraph-reader', daemon=True)
+    reader.start()
+    try:
+        while True:
+            rows = batch.take()
+            if rows and not put(rows):
+                return
+            if batch.ended and not batch.rows:
+                break
+        if batch.error is not None:
+            put(Failed(batch.error))
+        else:
+            put(END)
+    finally:
+        batch.stop()
+        reader.join()
+
+
+def _produce(rows: ops.TRowsIterable, channel: 'queue.Queue[tp.Any]',
+             stop: threading.Event) -> None:
+    def put(item: tp.Any) -> bool:
+        while not stop.is_set():
+            try:
+                channel.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    send_batches(rows, put)
+
+
+def received(item: tp.Any) -> list[ops.TRow] | None:
+    """Rows of a batch sent by send_batches, None at the end
+    :raises: the error of the producer
+    """
+    if item is END:
+        return None
+    if isinstance(item, Failed):
+        raise item.error
+    return tp.cast(list[ops.TRow], item)
+
+
+def prefetch(rows: ops.TRowsIterable,
+             queue_batches: int = QUEUE_BATCHES) -> ops.TRowsGenerator:
+    """Produce rows in a thread, see module description
+    :param rows: rows to produce
+    :param queue_batches: batches read ahead at most
+    """
+    channel: queue.Queue[tp.Any] = queue.Queue(queue_batches)
+    stop = threading.Event()
+    # the producer sees the memory budget and other context of the run
+    context = contextvars.copy_context()
+    producer = threading.Thread(
+        target=context.run, args=(_produce, rows, channel, stop),
+        name='compgraph-prefetch', daemon=True)
+    producer.start()
+    try:
+        while (batch := received(channel.get())) is not None:
+            yield from batch
+    finally:
+        stop.set()
+        producer.join()
+
+
+class Prefetch(ops.Operation):
+    """Pass rows through, producing them in a thread"""
+
+    def __init__(self, queue_batches: int = QUEUE_BATCHES) -> None:
+        """
+        :param queue_batches: batches read ahead at most
+        """
+        self.queue_batches = queue_batches
+
+    def required_columns(self, columns: ops.TColumns) -> set[str] | None:
+        return set(columns) if columns is not None else None
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from prefetch(rows, self.queue_batches)
@@ -0,0 +1,181 @@
+"""
+Per-operation profile of a graph run.
+
+Every operation of the plan gets a Stage counting rows it produced and the
+time and memory spent inside it. Time is self time: while a stage waits
+for rows of upstream stages the clock runs for them, not for it.
+"""
+import json
+import resource
+import sys
+import threading
+import time
+import typing as tp
+
+TRowsIterable = tp.Iterable[dict[str, tp.Any]]
+TRowsGenerator = tp.Generator[dict[str, tp.Any], None, None]
+
+
+def peak_rss() -> int:
+    """Peak resident set size of the process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Stage:
+    """Counters of one operation of the plan"""
+
+    def __init__(self, operation: str, fingerprint: str = '') -> None:
+        """
+        :param operation: description of the operation
+        :param fingerprint: fingerprint of the plan node
+        """
+        self.operation = operation
+        self.fingerprint = fingerprint
+        self.finished = False
+        self.rows_out = 0
+        self.wall = 0.
+        self.cpu = 0.
+        self.memory = 0
+        self.counters: dict[str, tp.Any] = {}
+        self.inputs: list[list['Stage']] = []
+        self.side_inputs: list[list['Stage']] = []
+
+
+class Profile:
+    """Stages of a graph run, plans of joined graphs and side inputs
+    are nested into stages consuming them"""
+
+    def __init__(self) -> None:
+        self.stages: list[Stage] = []
+        self.peak_memory = peak_rss()
+        # [wall, cpu, memory] spent by stages called from the running one,
+        # stages of a pipeline run in several threads
+        self._local = threading.local()
+
+    @property
+    def _stack(self) -> list[list[float]]:
+        stack: list[list[float]] | None = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def track(self, rows: TRowsIterable, stage: Stage) -> TRowsGenerator:
+        """Pass rows through, accounting time spent producing them
+        :param rows: output of the stage operation
+        :param stage: stage to account time to
+        """
+        iterator = iter(rows)
+        stack = self._stack
+        while True:
+            stack.append([0., 0., 0])
+            wall, cpu, peak = time.perf_counter(), time.process_time(), \
+                peak_rss()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                stage.finished = True
+                return
+            else:
+                stage.rows_out += 1
+            finally:
+                wall = time.perf_counter() - wall
+                cpu = time.process_time() - cpu
+                self.peak_memory = peak_rss()
+                memory = self.peak_memory - peak
+                nested = stack.pop()
+                stage.wall += wall - nested[0]
+                stage.cpu += cpu - nested[1]
+                stage.memory += memory - int(nested[2])
+                if stack:
+                    stack[-1][0] += wall
+                    stack[-1][1] += cpu
+                    stack[-1][2] += memory
+            yield row
+
+    def observed_rows(self) -> dict[str, int]:
+        """Output rows of stages run to completion by node fingerprint"""
+        return {stage.fingerprint: stage.rows_out
+                for stage in _walk(self.stages)
+                if stage.finished and stage.fingerprint}
+
+    def to_dict(self) -> dict[str, tp.Any]:
+        """Report as plain data: totals and stages with their inputs"""
+        return {
+            'wall': sum(stage.wall for stage in _walk(self.stages)),
+            'cpu': sum(stage.cpu for stage in _walk(self.stages)),
+            'peak_memory': self.peak_memory,
+            'stages': _stages_dict(self.stages),
+        }
+
+    def to_json(self, **kwargs: tp.Any) -> str:
+        """Report as JSON
+        :param kwargs: arguments of json.dumps
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def table(self) -> str:
+        """Report as a text table, inputs indented under their stages"""
+        report = self.to_dict()
+        lines = [f'{"operation":<48} {"rows in":>10} {"rows out":>10} '
+                 f'{"wall, s":>9} {"cpu, s":>9} {"memory":>9} {"pipe":>9}']
+        for depth, stage in _rows(report['stages']):
+            name = '  ' * depth + stage['operation']
+            pipe = stage['counters'].get('pipe_bytes')
+            lines.append(
+                f'{name:<48} {stage["rows_in"]:>10} {stage["rows_out"]:>10} '
+                f'{stage["wall"]:>9.3f} {stage["cpu"]:>9.3f} '
+                f'{_size(stage["memory"]):>9} '
+                f'{_size(pipe) if pipe is not None else "":>9}')
+        lines.append(f'total wall {report["wall"]:.3f} s, '
+                     f'cpu {report["cpu"]:.3f} s, '
+                     f'peak memory {_size(report["peak_memory"])}')
+        return '\n'.join(lines)
+
+    __str__ = table
+
+
+def _stages_dict(stages: list[Stage]) -> list[dict[str, tp.Any]]:
+    result = []
+    rows_in = 0
+    for stage in stages:
+        inputs = [_stages_dict(plan) for plan in stage.inputs]
+        rows_in += sum(plan[-1]['rows_out'] for plan in inputs if plan)
+        result.append({
+            'operation': stage.operation,
+            'rows_in': rows_in,
+            'rows_out': stage.rows_out,
+            'wall': stage.wall,
+            'cpu': stage.cpu,
+            'memory': stage.memory,
+            'counters': dict(stage.counters),
+            'inputs': inputs,
+            'side_inputs': [_stages_dict(plan) for plan in stage.side_inputs],
+        })
+        rows_in = stage.rows_out
+    return result
+
+
+def _walk(stages: list[Stage]) -> tp.Generator[Stage, None, None]:
+    for stage in stages:
+        yield stage
+        for plan in stage.inputs + stage.side_inputs:
+            yield from _walk(plan)
+
+
+def _rows(stages: list[dict[str, tp.Any]], depth: int = 0
+          ) -> tp.Generator[tuple[int, dict[str, tp.Any]], None, None]:
+    for stage in stages:
+        for plan in stage['inputs'] + stage['side_inputs']:
+            yield from _rows(plan, depth + 1)
+        yield depth, stage
+
+
+def _size(size: int) -> str:
+    value = float(size)
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(value) < 1024:
+            return f'{value:.0f} {unit}' if unit == 'B' \
+                else f'{value:.1f} {unit}'
+        value /= 1024
+    return f'{value:.1f} GiB'
@@ -0,0 +1,296 @@
+"""
+Compact binary format for rows put on disk or sent between processes.
+
+Stream layout: header (magic, version, codec) followed by blocks.
+Every block is length-prefixed and optionally compressed; inside a block
+rows are stored by segments of consecutive rows sharing the same columns.
+Each segment starts with its schema header (column names and type codes)
+followed by typed columns.
+"""
+import lzma
+import pickle
+import struct
+import typing as tp
+import zlib
+from array import array
+
+TRow = dict[str, tp.Any]
+
+MAGIC = b'CGRF'
+VERSION = 1
+
+CODECS: dict[str | None, int] = {None: 0, 'zlib': 1, 'lzma': 2}
+
+OBJECT, INT, FLOAT, STR, BOOL, NONE = range(6)
+
+_HEADER = struct.Struct('<4sBB')
+_BLOCK = struct.Struct('<II')
+_COUNT = struct.Struct('<I')
+_NAME = struct.Struct('<H')
+
+
+def _compress(codec: int, data: bytes) -> bytes:
+    if codec == 1:
+        return zlib.compress(data, 1)
+    if codec == 2:
+        return lzma.compress(data, preset=1)
+    return data
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == 1:
+        return zlib.decompress(data)
+    if codec == 2:
+        return lzma.decompress(data)
+    return data
+
+
+def _encode_column(values: list[tp.Any], out: list[bytes]) -> int:
+    first = type(values[0])
+    if all(type(value) is first for value in values):
+        if first is str:
+            text = ''.join(values).encode('utf-8', 'surrogatepass')
+            out.append(array('I', map(len, values)).tobytes())
+            out.append(_COUNT.pack(len(text)))
+            out.append(text)
+            return STR
+        if first is int:
+            try:
+                out.append(array('q', values).tobytes())
+                return INT
+            except OverflowError:
+                pass
+        if first is float:
+            out.append(array('d', values).tobytes())
+            return FLOAT
+        if first is bool:
+            out.append(bytes(values))
+            return BOOL
+        if values[0] is None:
+            return NONE
+    data = pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+    out.append(_COUNT.pack(len(data)))
+    out.append(data)
+    return OBJECT
+
+
+def _decode_column(kind: int, n: int, data: memoryview,
+                   pos: int) -> tuple[tp.Sequence[tp.Any], int]:
+    if kind == INT or kind == FLOAT:
+        values = array('q' if kind == INT else 'd')
+        end = pos + n * values.itemsize
+        values.frombytes(data[pos:end])
+        return values.tolist(), end
+    if kind == STR:
+        lengths = array('I')
+        end = pos + n * lengths.itemsize
+        lengths.frombytes(data[pos:end])
+        size, = _COUNT.unpack_from(data, end)
+        end += _COUNT.size
+        text = str(data[end:end + size], 'utf-8', 'surrogatepass')
+        strings = []
+        offset = 0
+        for length in lengths:
+            strings.append(text[offset:offset + length])
+            offset += length
+        return strings, end + size
+    if kind == BOOL:
+        return [bool(b) for b in data[pos:pos + n]], pos + n
+    if kind == NONE:
+        return [None] * n, pos
+    size, = _COUNT.unpack_from(data, pos)
+    pos += _COUNT.size
+    return pickle.loads(data[pos:pos + size]), pos + size
+
+
+def _encode_segment(rows: list[TRow], out: list[bytes]) -> None:
+    columns = list(rows[0])
+    out.append(_COUNT.pack(len(rows)))
+    out.append(_NAME.pack(len(columns)))
+    kinds = bytearray()
+    data: list[bytes] = []
+    for column in columns:
+        kinds.append(_encode_column([row[column] for row in rows], data))
+    for column in columns:
+        name = column.encode('utf-8')
+        out.append(_NAME.pack(len(name)))
+        out.append(name)
+    out.append(bytes(kinds))
+    out.extend(data)
+
+
+def encode_rows(rows: tp.Sequence[TRow]) -> bytes:
+    """Encode rows into raw (uncompressed) block payload
+    :param rows: rows to encode, may have different columns
+    """
+    out: list[bytes] = []
+    start = 0
+    columns: tuple[str, ...] | None = None
+    for ind, row in enumerate(rows):
+        row_columns = tuple(row)
+        if row_columns != columns:
+            if ind > start:
+                _encode_segment(list(rows[start:ind]), out)
+            start = ind
+            columns = row_columns
+    if len(rows) > start:
+        _encode_segment(list(rows[start:]), out)
+    return b''.join(out)
+
+
+def decode_rows(payload: bytes) -> list[TRow]:
+    """Decode rows from raw block payload made by encode_rows
+    :param payload: raw block payload
+    """
+    data = memoryview(payload)
+    rows: list[TRow] = []
+    pos = 0
+    while pos < len(data):
+        n, = _COUNT.unpack_from(data, pos)
+        n_columns, = _NAME.unpack_from(data, pos + _COUNT.size)
+        pos += _COUNT.size + _NAME.size
+        names = []
+        for _ in range(n_columns):
+            size, = _NAME.unpack_from(data, pos)
+            pos += _NAME.size
+            names.append(str(data[pos:pos + size], 'utf-8'))
+            pos += size
+        kinds = bytes(data[pos:pos + n_columns])
+        pos += n_columns
+        columns = []
+        for kind in kinds:
+            values, pos = _decode_column(kind, n, data, pos)
+            columns.append(values)
+        if not columns:
+            # rows without columns, e.g. projected away before CountRows
+            rows.extend({} for _ in range(n))
+            continue
+        rows.extend(dict(zip(names, values)) for values in zip(*columns))
+    return rows
+
+
+def pack_block(rows: tp.Sequence[TRow],
+               compression: str | None = None) -> bytes:
+    """Encode rows into a self-contained length-prefixed block
+    :param rows: rows to encode
+    :param compression: None, 'zlib' or 'lzma'
+    """
+    codec = CODECS[compression]
+    raw = encode_rows(rows)
+    stored = _compress(codec, raw)
+    return _BLOCK.pack(len(stored), len(raw)) + bytes([codec]) + stored
+
+
+def unpack_block(block: bytes) -> list[TRow]:
+    """Decode rows from block made by pack_block
+    :param block: packed block
+    """
+    size, _ = _BLOCK.unpack_from(block)
+    codec = block[_BLOCK.size]
+    start = _BLOCK.size + 1
+    return decode_rows(_decompress(codec, block[start:start + size]))
+
+
+class RecordWriter:
+    """Write rows to binary stream block by block"""
+
+    def __init__(self, file: tp.BinaryIO, compression: str | None = None,
+                 block_rows: int = 4096) -> None:
+        """
+        :param file: binary stream opened for writing
+        :param compression: None, 'zlib' or 'lzma' block compression
+        :param block_rows: number of rows to buffer before writing a block
+        """
+        self.file = file
+        self.codec = CODECS[compression]
+        self.block_rows = block_rows
+        self.rows_written = 0
+        self.bytes_written = _HEADER.size
+        self._buffer: list[TRow] = []
+        file.write(_HEADER.pack(MAGIC, VERSION, self.codec))
+
+    def write(self, row: TRow) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= self.block_rows:
+            self.flush()
+
+    def write_rows(self, rows: tp.Iterable[TRow]) -> None:
+        for row in rows:
+            self.write(row)
+
+    def write_block(self, rows: tp.Sequence[TRow]) -> None:
+        """Write rows as a separate block bypassing buffer"""
+        self.flush()
+        self._write_block(rows)
+
+    def _write_block(self, rows: tp.Sequence[TRow]) -> None:
+        if not rows:
+            return
+        raw = encode_rows(rows)
+        stored = _compress(self.codec, raw)
+        self.file.write(_BLOCK.pack(len(stored), len(raw)))
+        self.file.write(stored)
+        self.rows_written += len(rows)
+        self.bytes_written += _BLOCK.size + len(stored)
+
+    def flush(self) -> None:
+        self._write_block(self._buffer)
+        self._buffer = []
+
+    def close(self) -> None:
+        self.flush()
+        self.file.flush()
+
+    def __enter__(self) -> 'RecordWriter':
+        return self
+
+    def __exit__(self, *args: tp.Any) -> None:
+        self.close()
+
+
+class RecordReader:
+    """Read rows written by RecordWriter sequentially"""
+
+    def __init__(self, file: tp.BinaryIO) -> None:
+        """
+        :param file: binary stream opened for reading
+        """
+        self.file = file
+        header = file.read(_HEADER.size)
+        magic, version, self.codec = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a compgraph record stream')
+
+    def blocks(self) -> tp.Generator[list[TRow], None, None]:
+        while True:
+            header = self.file.read(_BLOCK.size)
+            if not header:
+                return
+            size, _ = _BLOCK.unpack(header)
+            stored = self.file.read(size)
+            yield decode_rows(_decompress(self.codec, stored))
+
+    def __iter__(self) -> tp.Iterator[TRow]:
+        for block in self.blocks():
+            yield from block
+
+
+def write_records(path: str, rows: tp.Iterable[TRow],
+                  compression: str | None = None) -> int:
+    """Write rows to file, return number of rows written
+    :param path: file to write
+    :param rows: rows to write
+    :param compression: None, 'zlib' or 'lzma' block compression
+    """
+    with open(path, 'wb') as f:
+        with RecordWriter(f, compression) as writer:
+            writer.write_rows(rows)
+        return writer.rows_written
+
+
+def read_records(path: str) -> tp.Generator[TRow, None, None]:
+    """Read rows from file written by write_records
+    :param path: file to read
+    """
+    with open(path, 'rb') as f:
+        yield from RecordReader(f)
@@ -0,0 +1,154 @@
+"""
+Reduce by partitions of keys, with hot keys spread over all partitions.
+
+Rows are split into partitions by hash of keys and every partition is
+sorted and reduced on its own, one after another in this process, not in
+parallel: partitions bound what each sort holds. Partitions and their
+results spill to disk past SPILL_ROWS rows in all or under the memory
+budget. A few frequent keys would make their partitions much larger than
+others, so rows of such hot keys are salted: dealt to all partitions in
+turn. For reducers whose results on parts of a group can be combined
+(Reducer.combiner) partial results of hot keys are then merged.
+
+Hot keys are taken from statistics of earlier runs or found in a sample
+of the first rows by the Misra-Gries summary.
+"""
+import heapq
+import typing as tp
+from itertools import chain, groupby, islice
+
+from . import adaptive
+from . import budget
+from . import operations as ops
+from . import statistics
+
+PARTITIONS = 8
+# Rows of all partitions kept in memory, more are spilled to disk
+SPILL_ROWS = 100_000
+# Rows read to find hot keys when statistics do not know them
+SAMPLE_ROWS = 10000
+
+
+def hot_keys(heavy: tp.Iterable[tuple[tp.Any, int]], rows: int,
+             partitions: int) -> set[tp.Any]:
+    """Keys taking more rows than a partition would get on average
+    :param heavy: frequent keys with their counts
+    :param rows: number of rows counted
+    :param partitions: number of partitions
+    """
+    return {value for value, count in heavy if count * partitions > rows}
+
+
+def detect(rows: ops.TRowsIterable, keys: tp.Sequence[str],
+           partitions: int) -> tuple[ops.TRowsIterable, set[tp.Any]]:
+    """Find hot keys in a sample of first rows
+    :return: all rows, sample included, and hot keys
+    """
+    iterator = iter(rows)
+    sample = list(islice(iterator, SAMPLE_ROWS))
+    key = ops.row_key(keys)
+    heavy = statistics.HeavyHitters(2 * partitions)
+    for row in sample:
+        heavy.add(key(row))
+    return chain(sample, iterator), \
+        hot_keys(heavy.top(), len(sample), partitions)
+
+
+def partition(rows: ops.TRowsIterable, keys: tp.Sequence[str],
+              partitions: int, hot: tp.Container[tp.Any] = (),
+              spill_rows: int | None = SPILL_ROWS
+              ) -> list[budget.RowBuffer]:
+    """Split rows by hash of keys, rows of hot keys go to all partitions
+    in turn; partitions spill to disk under the memory budget
+    :param rows: rows to split
+    :param keys: keys to split by
+    :param partitions: number of partitions
+    :param hot: keys to salt
+    :param spill_rows: rows of all partitions kept in memory, None to
+     keep all unless the memory budget is exceeded
+    """
+    key = ops.row_key(keys)
+    max_rows = _share(spill_rows, partitions)
+    parts = [budget.RowBuffer(max_rows=max_rows)
+             for _ in range(partitions)]
+    salt = 0
+    for row in rows:
+        value = key(row)
+        if value in hot:
+            salt += 1
+            parts[salt % partitions].append(row)
+        else:
+            parts[hash(value) % partitions].append(row)
+    return parts
+
+
+def _share(spill_rows: int | None, partitions: int) -> int | None:
+    return max(1, spill_rows // partitions) \
+        if spill_rows is not None else None
+
+
+class PartitionedReduce(ops.Reduce):
+    """Sort by keys and reduce by partitions, see module description"""
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str],
+                 partitions: int = PARTITIONS,
+                 hot: tp.Iterable[tp.Any] | None = None,
+                 spill_rows: int | None = SPILL_ROWS) -> None:
+        """
+        :param reducer: reducer to use
+        :param keys: keys for grouping
+        :param partitions: number of partitions
+        :param hot: keys to salt, found in input if None
+        :param spill_rows: rows of all partitions and of their results
+         kept in memory, None to keep all unless the memory budget is
+         exceeded
+        """
+        super().__init__(reducer, keys)
+        self.partitions = partitions
+        self.hot = set(hot) if hot is not None else None
+        self.spill_rows = spill_rows
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        combiner = self.reducer.combiner()
+        hot: set[tp.Any] = set()
+        if combiner is not None:
+            if self.hot is None:
+                rows, hot = detect(rows, self.keys, self.partitions)
+            else:
+                hot = self.hot
+        stats = kwargs.get('stats')
+        if stats is not None:
+            stats['hot_keys'] = len(hot)
+
+        # groups of other reducers may depend on each other
+        partitions = self.partitions \
+            if self.reducer.groupwise or not self.keys else 1
+        parts = partition(rows, self.keys, partitions, hot,
+                          self.spill_rows)
+        outputs: list[budget.RowBuffer] = []
+        try:
+            for part in parts:
+                outputs.append(self._reduce(part, partitions))
+                part.close()
+            key = ops.row_key(self.keys)
+            for value, group in groupby(heapq.merge(*outputs, key=key),
+                                        key=key):
+                if value in hot:
+                    assert combiner is not None
+                    yield from combiner(tuple(self.keys), group)
+                else:
+                    yield from group
+        finally:
+            for buffer in parts + outputs:
+                buffer.close()
+
+    def _reduce(self, rows: ops.TRowsIterable,
+                partitions: int) -> budget.RowBuffer:
+        """Results of reducer on a partition in order of keys"""
+        if self.keys:
+            rows, _ = adaptive.sorted_input(rows, self.keys,
+                                            adaptive.MEMORY_LIMIT)
+        output = budget.RowBuffer(
+            max_rows=_share(self.spill_rows, partitions))
+        return output.extend(self.reduce(rows))
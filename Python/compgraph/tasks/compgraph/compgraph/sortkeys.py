@@ -0,0 +1,132 @@
+"""
+Order-preserving binary encoding of sort keys.
+
+A composite key is encoded into one bytes object comparing the way the
+tuple of its values does, so sorts and merges compare bytes instead of
+tuples of mixed types element by element. Every value starts with a type
+tag and ends where its encoding does, so values of a key never run into
+each other:
+
+- numbers (bool, int, float) share a tag and compare with each other:
+  big-endian float with flipped sign bits, then the exact difference of
+  an int from that float as a length-prefixed integer;
+- str and bytes: content with zero bytes escaped, ended by two zeros;
+- datetime: days, seconds and microseconds, aware ones converted to UTC.
+
+Values of other types are not encoded, callers sort them as before.
+"""
+import struct
+import typing as tp
+from datetime import datetime, timezone
+
+TRow = dict[str, tp.Any]
+
+_NONE, _NUMBER, _STR, _BYTES, _DATETIME, _AWARE = (
+    bytes([tag]) for tag in range(6))
+
+_DOUBLE = struct.Struct('>d')
+_UINT64 = struct.Struct('>Q')
+_TIME = struct.Struct('>III')
+_SIGN = 1 << 63
+_MASK = (1 << 64) - 1
+_NAN = _NUMBER + b'\xff' * 8 + b'\x80'
+
+
+def _float(value: float) -> bytes:
+    if value != value:
+        return _NAN
+    # -0.0 == 0.0
+    bits, = _UINT64.unpack(_DOUBLE.pack(value + 0.0))
+    bits = bits ^ _MASK if bits & _SIGN else bits | _SIGN
+    return _NUMBER + _UINT64.pack(bits) + b'\x80'
+
+
+def _difference(value: int) -> bytes:
+    """Integer with its length first, shorter positive ones are smaller"""
+    if value == 0:
+        return b'\x80'
+    length = (abs(value).bit_length() + 7) // 8
+    if value > 0:
+        return bytes([0x80 + length]) + value.to_bytes(length, 'big')
+    return bytes([0x80 - length]) + \
+        ((1 << 8 * length) - 1 + value).to_bytes(length, 'big')
+
+
+def _int(value: int) -> bytes:
+    try:
+        approximation = float(value)
+    except OverflowError:
+        raise TypeError(f'Can not encode int {value}') from None
+    encoded = _float(approximation)
+    if -2 ** 53 <= value <= 2 ** 53:
+        return encoded
+    return encoded[:-1] + _difference(value - int(approximation))
+
+
+def _escaped(tag: bytes, data: bytes) -> bytes:
+    return tag + data.replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+
+
+def _str(value: str) -> bytes:
+    return _escaped(_STR, value.encode('utf-8', 'surrogatepass'))
+
+
+def _bytes(value: bytes) -> bytes:
+    return _escaped(_BYTES, value)
+
+
+def _datetime(value: datetime) -> bytes:
+    tag = _DATETIME
+    offset = value.utcoffset()
+    if offset is not None:
+        tag = _AWARE
+        value = (value - offset).replace(tzinfo=timezone.utc)
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    return tag + _TIME.pack(value.toordinal(), seconds, value.microsecond)
+
+
+_ENCODERS: dict[type, tp.Callable[[tp.Any], bytes]] = {
+    type(None): lambda value: _NONE,
+    bool: _int,
+    int: _int,
+    float: _float,
+    str: _str,
+    bytes: _bytes,
+    datetime: _datetime,
+}
+
+
+def encode(value: tp.Any) -> bytes:
+    """Encode value of a key
+    :raises TypeError: for values of other types
+    """
+    try:
+        return _ENCODERS[type(value)](value)
+    except KeyError:
+        raise TypeError(
+            f'Can not encode {type(value).__name__} key') from None
+
+
+# Usual values are encoded inline: str, and numbers not below zero, whose
+# float with the sign bit set is just the float -value
+_INLINE = (
+    "(_STR + {0}.encode('utf-8', 'surrogatepass')"
+    ".replace(b'\\x00', b'\\x00\\xff') + b'\\x00\\x00'"
+    " if type({0}) is str"
+    " else _NUMBER + _pack(-({0} + 0.0)) + b'\\x80'"
+    " if type({0}) is int and 0 <= {0} <= 9007199254740992"
+    " or type({0}) is float and {0} >= 0"
+    " else encode({0}))")
+
+
+def encoder(keys: tp.Sequence[str]) -> tp.Callable[[TRow], bytes]:
+    """Function encoding keys of row into one bytes object"""
+    lines = ['def encode_key(row):']
+    lines += [f'    v{ind} = row[{key!r}]' for ind, key in enumerate(keys)]
+    lines.append('    return ' + ' + '.join(
+        _INLINE.format(f'v{ind}') for ind in range(len(keys))))
+    namespace: dict[str, tp.Any] = {
+        '_STR': _STR, '_NUMBER': _NUMBER, '_pack': _DOUBLE.pack,
+        'encode': encode}
+    exec('\n'.join(lines), namespace)
+    return tp.cast(tp.Callable[[TRow], bytes], namespace['encode_key'])
@@ -0,0 +1,260 @@
+"""
+Statistics of data observed while running graphs.
+
+Statistics are kept per plan node fingerprint, so they apply to the same
+computation in later runs, also of a graph built again by the same code:
+
+    >>> stats = Statistics()
+    >>> rows = list(graph.run(RunOptions(statistics=stats), docs=...))
+    >>> stats.save('stats.json')
+
+Every node gets the number of rows it produced. Nodes feeding sorts,
+reduces and joins also get the approximate number of distinct keys
+(HyperLogLog) and the most frequent keys (Misra-Gries summary).
+"""
+import base64
+import json
+import math
+import pickle
+import typing as tp
+from operator import itemgetter
+
+TRow = dict[str, tp.Any]
+TRowsGenerator = tp.Generator[TRow, None, None]
+
+_MASK = (1 << 64) - 1
+
+
+def hash64(value: tp.Hashable) -> int:
+    """Python hash with bits spread by finalizer of MurmurHash3, as hash
+    is identity for small ints"""
+    hashed = hash(value) & _MASK
+    hashed = (hashed ^ hashed >> 33) * 0xFF51AFD7ED558CCD & _MASK
+    hashed = (hashed ^ hashed >> 33) * 0xC4CEB9FE1A85EC53 & _MASK
+    return hashed ^ hashed >> 33
+
+
+class HyperLogLog:
+    """Approximate count of distinct values in constant memory"""
+
+    def __init__(self, precision: int = 12) -> None:
+        """
+        :param precision: log2 of number of registers, error is about
+         1.04 / sqrt(2 ** precision)
+        """
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._shift = 64 - precision
+        self._max_rank = 65 - precision
+
+    def add(self, value: tp.Hashable) -> None:
+        hashed = hash64(value)
+        index = hashed >> self._shift
+        rank = min(65 - (hashed << self.precision & _MASK).bit_length(),
+                   self._max_rank)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        assert self.precision == other.precision
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> float:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(
+            2. ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            return size * math.log(size / zeros)
+        return estimate
+
+
+class HeavyHitters:
+    """Misra-Gries summary: finds values occurring more than
+    n / (capacity + 1) times in a stream of n values, counts are
+    underestimated by at most that much"""
+
+    def __init__(self, capacity: int = 32) -> None:
+        """
+        :param capacity: number of counters kept
+        """
+        self.capacity = capacity
+        self.counters: dict[tp.Hashable, int] = {}
+
+    def add(self, value: tp.Hashable) -> None:
+        counters = self.counters
+        if value in counters:
+            counters[value] += 1
+        elif len(counters) < self.capacity:
+            counters[value] = 1
+        else:
+            for key in list(counters):
+                if counters[key] == 1:
+                    del counters[key]
+                else:
+                    counters[key] -= 1
+
+    def top(self) -> list[tuple[tp.Any, int]]:
+        """Candidate frequent values with counts, most frequent first"""
+        return sorted(self.counters.items(), key=itemgetter(1),
+                      reverse=True)
+
+
+class NodeStatistics:
+    """Statistics of rows produced by a plan node"""
+
+    def __init__(self, rows: int = 0,
+                 distinct: dict[tuple[str, ...], float] | None = None,
+                 heavy: dict[tuple[str, ...],
+                             list[tuple[tp.Any, int]]] | None = None
+                 ) -> None:
+        """
+        :param rows: number of rows
+        :param distinct: approximate number of distinct values by keys
+        :param heavy: most frequent values with counts by keys
+        """
+        self.rows = rows
+        self.distinct = distinct if distinct is not None else {}
+        self.heavy = heavy if heavy is not None else {}
+
+    def to_dict(self) -> dict[str, tp.Any]:
+        return {
+            'rows': self.rows,
+            'distinct': [[list(keys), count]
+                         for keys, count in self.distinct.items()],
+            'heavy': [[list(keys), [[encoded, count]
+                                    for value, count in values
+                                    if (encoded := _encode(value))
+                                    is not _UNKNOWN]]
+                      for keys, values in self.heavy.items()],
+        }
+
+    @staticmethod
+    def from_dict(data: dict[str, tp.Any]) -> 'NodeStatistics':
+        return NodeStatistics(
+            data['rows'],
+            {tuple(keys): count for keys, count in data['distinct']},
+            {tuple(keys): [(_decode(value), count)
+                           for value, count in values]
+             for keys, values in data['heavy']})
+
+
+_UNKNOWN = object()
+
+
+def _encode(value: tp.Any) -> tp.Any:
+    """JSON value of a key: tuples become lists, values of other types
+    than JSON ones are pickled and tagged, _UNKNOWN if they can't be"""
+    if isinstance(value, tuple):
+        items = [_encode(item) for item in value]
+        return _UNKNOWN if any(item is _UNKNOWN for item in items) \
+            else items
+    if value is None or type(value) in (bool, int, float, str):
+        return value
+    try:
+        return {'pickle': base64.b64encode(pickle.dumps(value)).decode()}
+    except Exception:
+        return _UNKNOWN
+
+
+def _decode(value: tp.Any) -> tp.Any:
+    if isinstance(value, list):
+        return tuple(_decode(item) for item in value)
+    if isinstance(value, dict):
+        return pickle.loads(base64.b64decode(value['pickle']))
+    return value
+
+
+class Statistics:
+    """Statistics of plan nodes by fingerprint"""
+
+    def __init__(self) -> None:
+        self.nodes: dict[str, NodeStatistics] = {}
+
+    def get(self, fingerprint: str) -> NodeStatistics | None:
+        return self.nodes.get(fingerprint)
+
+    def rows(self, fingerprint: str) -> int | None:
+        """Observed number of rows produced by node, None if unknown"""
+        node = self.nodes.get(fingerprint)
+        return node.rows if node is not None else None
+
+    def distinct(self, fingerprint: str,
+                 keys: tp.Sequence[str]) -> float | None:
+        """Approximate number of distinct keys in node output"""
+        node = self.nodes.get(fingerprint)
+        if node is None:
+            return None
+        if not keys:
+            return 1. if node.rows else 0.
+        return node.distinct.get(tuple(keys))
+
+    def heavy(self, fingerprint: str,
+              keys: tp.Sequence[str]) -> list[tuple[tp.Any, int]] | None:
+        """Frequent keys in node output with their approximate counts"""
+        node = self.nodes.get(fingerprint)
+        if node is None:
+            return None
+        return node.heavy.get(tuple(keys))
+
+    def collect(self, rows: tp.Iterable[TRow], fingerprint: str,
+                keys: tp.Sequence[str] = ()) -> TRowsGenerator:
+        """Pass rows through, keeping their statistics once all are read
+        :param rows: output rows of node
+        :param fingerprint: fingerprint of node
+        :param keys: keys to count distinct and frequent values of
+        """
+        count = 0
+        if not keys:
+            for row in rows:
+                count += 1
+                yield row
+            self._observed(fingerprint, count)
+            return
+
+        key = itemgetter(*keys)
+        distinct = HyperLogLog()
+        heavy = HeavyHitters()
+        for row in rows:
+            value = key(row)
+            distinct.add(value)
+            heavy.add(value)
+            count += 1
+            yield row
+        node = self._observed(fingerprint, count)
+        node.distinct[tuple(keys)] = min(float(count), distinct.count())
+        node.heavy[tuple(keys)] = [(value, number) for value, number
+                                   in heavy.top() if number > 1]
+
+    def _observed(self, fingerprint: str, rows: int) -> NodeStatistics:
+        """Statistics of node producing rows, keeping known key statistics
+        if the number of rows is the same"""
+        node = self.nodes.get(fingerprint)
+        if node is None or node.rows != rows:
+            node = self.nodes[fingerprint] = NodeStatistics(rows)
+        return node
+
+    def update(self, rows: tp.Mapping[str, int]) -> None:
+        """Add row counts observed elsewhere, e.g. in a profile
+        :param rows: rows produced by nodes by fingerprint
+        """
+        for fingerprint, count in rows.items():
+            self._observed(fingerprint, count)
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump({fingerprint: node.to_dict()
+                       for fingerprint, node in self.nodes.items()},
+                      file)
+
+    @staticmethod
+    def load(path: str) -> 'Statistics':
+        """Statistics saved by save; keys of other types than JSON ones
+        are unpickled, so load trusted files only"""
+        statistics = Statistics()
+        with open(path) as file:
+            for fingerprint, data in json.load(file).items():
+                statistics.nodes[fingerprint] = \
+                    NodeStatistics.from_dict(data)
+        return statistics
@@ -0,0 +1,190 @@
+"""
+Aggregation of unbounded streams by windows of event time.
+
+WindowReduce puts every row into windows by the time in its time column:
+tumbling windows follow one another, sliding ones of the same size start
+every slide. Rows are folded into the state of their window and keys as
+they come by an Accumulator, so one state per open window and key is all
+that is kept and input need not be sorted.
+
+Rows may come out of order by up to delay. The watermark, the latest time
+seen less delay, tells which windows get no more rows: their results are
+sent, sorted by ends of windows and keys, as soon as the watermark passes
+their ends, and their state is dropped. Rows of windows already sent are
+dropped and counted in stats['late_rows']. Windows open when the stream
+ends are sent at the end.
+"""
+import heapq
+import typing as tp
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from . import operations as ops
+
+
+class Accumulator(ABC):
+    """Aggregate of rows folded in one at a time"""
+
+    @abstractmethod
+    def start(self, row: ops.TRow) -> tp.Any:
+        """State of the first row"""
+
+    @abstractmethod
+    def add(self, state: tp.Any, row: ops.TRow) -> tp.Any:
+        """State with row folded in"""
+
+    @abstractmethod
+    def result(self, state: tp.Any) -> ops.TRow:
+        """Result columns of state"""
+
+    def required_columns(self) -> set[str]:
+        """Columns of rows used"""
+        return set()
+
+
+class Sums(Accumulator):
+    """
+    Sums of columns, named as by MulSum
+    Example for columns=('b', 'c')
+        {'b': 2, 'c': 4}
+        {'b': 3, 'c': 5}
+        =>
+        {'sum_0': 5, 'sum_1': 9}
+    """
+
+    def __init__(self, columns: tp.Sequence[str]) -> None:
+        """
+        :param columns: names of columns to sum
+        """
+        self.columns = columns
+
+    def start(self, row: ops.TRow) -> tp.Any:
+        return [row[column] for column in self.columns]
+
+    def add(self, state: tp.Any, row: ops.TRow) -> tp.Any:
+        for ind, column in enumerate(self.columns):
+            state[ind] += row[column]
+        return state
+
+    def result(self, state: tp.Any) -> ops.TRow:
+        return {f'sum_{ind}': value for ind, value in enumerate(state)}
+
+    def required_columns(self) -> set[str]:
+        return set(self.columns)
+
+
+class Count(Accumulator):
+    """Number of rows"""
+
+    def __init__(self, column: str) -> None:
+        """
+        :param column: name for result column
+        """
+        self.column = column
+
+    def start(self, row: ops.TRow) -> tp.Any:
+        return 1
+
+    def add(self, state: tp.Any, row: ops.TRow) -> tp.Any:
+        return state + 1
+
+    def result(self, state: tp.Any) -> ops.TRow:
+        return {self.column: state}
+
+
+class WindowReduce(ops.Operation):
+    """Aggregate rows by windows of event time and keys, see module
+    description"""
+
+    def __init__(self, accumulator: Accumulator, keys: tp.Sequence[str],
+                 time_column: str, size: tp.Any, slide: tp.Any = None,
+                 delay: tp.Any = None, origin: tp.Any = None,
+                 start_column: str = 'window_start',
+                 end_column: str = 'window_end') -> None:
+        """
+        :param accumulator: aggregate of rows of a window and keys
+        :param keys: keys for grouping within windows
+        :param time_column: column of event time, a number or datetime
+        :param size: length of windows, a number or timedelta
+        :param slide: time between starts of windows, tumbling windows if
+         None
+        :param delay: how late rows may come, none if None
+        :param origin: a start of a window, 0 or the epoch if None
+        :param start_column: name for column of starts of windows
+        :param end_column: name for column of ends of windows
+        """
+        self.accumulator = accumulator
+        self.keys = keys
+        self.time_column = time_column
+        self.size = size
+        self.slide = size if slide is None else slide
+        self.delay = size * 0 if delay is None else delay
+        self.origin = origin
+        self.start_column = start_column
+        self.end_column = end_column
+
+    def required_columns(self, columns: ops.TColumns) -> set[str] | None:
+        return {*self.keys, self.time_column,
+                *self.accumulator.required_columns()}
+
+    def _origin(self, time: tp.Any) -> tp.Any:
+        if self.origin is not None:
+            return self.origin
+        if isinstance(time, datetime):
+            return datetime(1970, 1, 1, tzinfo=time.tzinfo)
+        return 0
+
+    def __call__(self, rows: ops.TRowsIterable,
+                 *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        stats = kwargs.get('stats')
+        accumulator = self.accumulator
+        key = ops.row_key(self.keys)
+        size, slide = self.size, self.slide
+        origin: tp.Any = None
+        # states with key columns by keys, by starts of open windows
+        windows: dict[tp.Any, dict[tp.Any, tuple[ops.TRow, tp.Any]]] = {}
+        starts: list[tp.Any] = []
+        watermark: tp.Any = None
+        late = 0
+        for row in rows:
+            time = row[self.time_column]
+            if origin is None:
+                origin = self._origin(time)
+            if watermark is None or time - self.delay > watermark:
+                watermark = time - self.delay
+            row_keys = key(row)
+            start = origin + (time - origin) // slide * slide
+            added = False
+            while start + size > time:
+                if start + size > watermark:
+                    window = windows.get(start)
+                    if window is None:
+                        window = windows[start] = {}
+                        heapq.heappush(starts, start)
+                    state = window.get(row_keys)
+                    if state is None:
+                        window[row_keys] = (
+                            {column: row[column] for column in self.keys},
+                            accumulator.start(row))
+                    else:
+                        window[row_keys] = (
+                            state[0], accumulator.add(state[1], row))
+                    added = True
+                start -= slide
+            if not added:
+                late += 1
+                if stats is not None:
+                    stats['late_rows'] = late
+            while starts and starts[0] + size <= watermark:
+                yield from self._results(heapq.heappop(starts), windows)
+        while starts:
+            yield from self._results(heapq.heappop(starts), windows)
+
+    def _results(self, start: tp.Any, windows: dict[tp.Any, tp.Any]
+                 ) -> ops.TRowsGenerator:
+        window = windows.pop(start)
+        for row_keys in sorted(window):
+            columns, state = window[row_keys]
+            yield {**columns, self.start_column: start,
+                   self.end_column: start + self.size,
+                   **self.accumulator.result(state)}
@@ -0,0 +1,18 @@
+import random
+
+from compgraph import operations
+
+
+def random_rows(count: int, keys: int, seed: int = 0,
+                hot: float = 0.) -> list[operations.TRow]:
+    """Rows with random 'id' of keys values and 'value' numbering them,
+    the same for the same seed
+    :param count: number of rows
+    :param keys: number of values of 'id'
+    :param seed: seed of random values
+    :param hot: share of rows with 'id' 0
+    """
+    generator = random.Random(seed)
+    return [{'id': 0 if generator.random() < hot
+             else generator.randrange(keys), 'value': i}
+            for i in range(count)]
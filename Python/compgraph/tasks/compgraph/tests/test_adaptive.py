@@ -0,0 +1,69 @@
+import typing as tp
+
+import pytest
+
+from compgraph import adaptive, external_sort, operations
+
+from .rows import random_rows
+
+
+def _sorted(rows: list[operations.TRow]) -> list[operations.TRow]:
+    return list(external_sort.ExternalSort(['id'])(rows))
+
+
+@pytest.mark.parametrize('limit, strategy', [
+    (adaptive.MEMORY_LIMIT, 'hash'), (2000, 'sort'), (0, 'sort')])
+def test_adaptive_reduce(limit: int, strategy: str) -> None:
+    rows = random_rows(300, 20, 0)
+    expected = list(operations.Reduce(operations.FirstReducer(), ['id'])(
+        _sorted(rows)))
+    stats: dict[str, tp.Any] = {}
+    reduce = adaptive.AdaptiveReduce(operations.FirstReducer(), ['id'],
+                                     memory_limit=limit)
+    assert list(reduce(iter(rows), stats=stats)) == expected
+    assert stats['strategy'] == strategy
+
+
+@pytest.mark.parametrize('joiner', [
+    operations.InnerJoiner(), operations.LeftJoiner(),
+    operations.RightJoiner(), operations.OuterJoiner()])
+@pytest.mark.parametrize('limit, strategy', [
+    (adaptive.MEMORY_LIMIT, 'hash'), (20000, 'hash+sort'),
+    (2000, 'sort-merge')])
+def test_adaptive_join(joiner: operations.Joiner, limit: int,
+                       strategy: str) -> None:
+    rows_a = random_rows(200, 30, 1)
+    rows_b = random_rows(40, 40, 2)
+    expected = list(operations.Join(joiner, ['id'])(_sorted(rows_a),
+                                                    _sorted(rows_b)))
+    stats: dict[str, tp.Any] = {}
+    join = adaptive.AdaptiveJoin(joiner, ['id'], memory_limit=limit)
+    assert list(join(iter(rows_a), iter(rows_b), stats=stats)) == expected
+    assert stats['strategy'] == strategy
+
+
+@pytest.mark.parametrize('joiner', [
+    operations.InnerJoiner(), operations.LeftJoiner(),
+    operations.OuterJoiner()])
+@pytest.mark.parametrize('limit, strategy', [
+    (adaptive.MEMORY_LIMIT, 'broadcast'), (2000, 'sort-merge')])
+def test_unordered_join(joiner: operations.Joiner, limit: int,
+                        strategy: str) -> None:
+    rows_a = random_rows(200, 30, 1)
+    rows_b = random_rows(40, 40, 2)
+    expected = list(operations.Join(joiner, ['id'])(_sorted(rows_a),
+                                                    _sorted(rows_b)))
+    stats: dict[str, tp.Any] = {}
+    join = adaptive.AdaptiveJoin(joiner, ['id'], memory_limit=limit,
+                                 ordered=False)
+    rows = list(join(iter(rows_a), iter(rows_b), stats=stats))
+    assert _sorted(rows) == expected
+    assert stats['strategy'] == strategy
+
+
+def test_join_empty_side() -> None:
+    rows = [{'id': 1, 'a': 1}]
+    join = operations.Join(operations.LeftJoiner(), ['id'])
+    assert list(join(iter(rows), iter([]))) == rows
+    join = adaptive.AdaptiveJoin(operations.RightJoiner(), ['id'])
+    assert list(join(iter([]), iter(rows))) == rows
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import typing as tp
+
+import pytest
+
+from compgraph import Graph, operations
+
+
+async def _stream(count: int) -> tp.AsyncGenerator[operations.TRow, None]:
+    for i in range(count):
+        if i % 100 == 0:
+            await asyncio.sleep(0.001)
+        yield {'id': i % 10, 'value': i}
+
+
+async def _collect(rows: tp.AsyncIterator[operations.TRow]
+                   ) -> list[operations.TRow]:
+    return [row async for row in rows]
+
+
+def test_run_async() -> None:
+    graph = Graph.graph_from_iter('rows') \
+        .sort(['id']) \
+        .reduce(operations.Sum('value'), ['id'])
+    expected = list(graph.run(rows=lambda: iter(
+        {'id': i % 10, 'value': i} for i in range(5000))))
+
+    async def main() -> tuple[list[operations.TRow], int]:
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        result = await _collect(graph.run_async(rows=_stream(5000)))
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == expected
+    # the loop kept running while the graph sorted rows
+    assert ticks > 0
+
+
+def test_run_async_sources() -> None:
+    async def names() -> tp.AsyncIterable[operations.TRow]:
+        await asyncio.sleep(0)
+        return _names()
+
+    async def _names() -> tp.AsyncGenerator[operations.TRow, None]:
+        for i in range(10):
+            yield {'id': i, 'name': f'n{i}'}
+
+    graph = Graph.graph_from_iter('rows') \
+        .sort(['id']) \
+        .join(operations.InnerJoiner(), Graph.graph_from_iter('names'),
+              ['id'])
+    result = asyncio.run(_collect(graph.run_async(
+        rows=lambda: _stream(100), names=names)))
+    assert len(result) == 100
+    assert all(row['name'] == f'n{row["id"]}' for row in result)
+
+    failing = Graph.graph_from_iter('rows') \
+        .map(operations.Filter(lambda row: 1 / (row['value'] - 50) != 0))
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(_collect(failing.run_async(rows=lambda: _stream(100))))
+
+
+def test_run_async_stops() -> None:
+    closed = threading.Event()
+
+    async def endless() -> tp.AsyncGenerator[operations.TRow, None]:
+        try:
+            while True:
+                await asyncio.sleep(0)
+                yield {'id': 0}
+        finally:
+            closed.set()
+
+    async def main() -> None:
+        rows = Graph.graph_from_iter('rows').run_async(rows=endless())
+        async for _ in rows:
+            break
+        await tp.cast(tp.AsyncGenerator[operations.TRow, None],
+                      rows).aclose()
+
+    asyncio.run(main())
+    assert threading.active_count() == 1
+    assert closed.is_set()
+
+
+def test_run_async_stalled_source() -> None:
+    async def main() -> list[operations.TRow]:
+        resume = asyncio.Event()
+
+        async def stalled() -> tp.AsyncGenerator[operations.TRow, None]:
+            for i in range(3):
+                yield {'id': i}
+            await resume.wait()
+            yield {'id': 3}
+
+        rows = Graph.graph_from_iter('rows').run_async(rows=stalled())
+        iterator = aiter(rows)
+        # rows come without waiting for the next one
+        first = [await asyncio.wait_for(anext(iterator), 1)
+                 for _ in range(3)]
+        resume.set()
+        return first + [row async for row in iterator]
+
+    assert asyncio.run(main()) == [{'id': i} for i in range(4)]
@@ -0,0 +1,48 @@
+import typing as tp
+
+import pytest
+
+from compgraph import adaptive, bloom, operations
+
+
+def test_bloom_filter() -> None:
+    bloom_filter = bloom.BloomFilter(0.01, capacity=100)
+    for value in range(5000):
+        bloom_filter.add(value)
+    assert all(value in bloom_filter for value in range(5000))
+    false_positives = sum(value in bloom_filter
+                          for value in range(5000, 25000))
+    assert false_positives < 0.02 * 20000
+
+
+@pytest.mark.parametrize('limit', [adaptive.MEMORY_LIMIT, 2000])
+@pytest.mark.parametrize('joiner, pruned', [
+    (operations.InnerJoiner(), True), (operations.RightJoiner(), True),
+    (operations.LeftJoiner(), False)])
+def test_join_prunes_rows(joiner: operations.Joiner, pruned: bool,
+                          limit: int) -> None:
+    rows_a = [{'id': i % 1000, 'a': i} for i in range(3000)]
+    rows_b = [{'id': i * 10, 'b': i} for i in range(20)]
+    expected = list(adaptive.AdaptiveJoin(joiner, ['id'])(
+        iter(rows_a), iter(rows_b)))
+    stats: dict[str, tp.Any] = {}
+    join = adaptive.AdaptiveJoin(joiner, ['id'], memory_limit=limit,
+                                 bloom_error_rate=0.01)
+    assert list(join(iter(rows_a), iter(rows_b), stats=stats)) == expected
+    if pruned:
+        assert stats['bloom_pruned'] > 2800
+    else:
+        assert 'bloom_pruned' not in stats
+
+
+def test_prune_gives_up() -> None:
+    bloom_filter = bloom.BloomFilter()
+    for value in range(10):
+        bloom_filter.add(value)
+    rows = [{'id': i % 10} for i in range(bloom.SAMPLE_ROWS)] + \
+        [{'id': 100}] * 10
+    stats: dict[str, tp.Any] = {}
+    result = list(bloom.prune(rows, lambda row: row['id'], bloom_filter,
+                              stats))
+    assert len(result) == len(rows)
+    assert stats['bloom_pruned'] == 0
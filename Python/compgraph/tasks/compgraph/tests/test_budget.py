@@ -0,0 +1,95 @@
+import os
+import typing as tp
+
+from operator import itemgetter
+
+from compgraph import Graph, RunOptions, budget, external_sort, operations
+
+from .rows import random_rows
+
+
+def test_row_buffer_spills() -> None:
+    rows = random_rows(1000, 10, 0)
+    memory = budget.MemoryBudget(10000)
+    row_buffer = budget.RowBuffer(memory)
+    row_buffer.extend(rows)
+    assert row_buffer.spilled
+    assert memory.used == 0
+    assert memory.spilled_rows == len(rows)
+    assert len(row_buffer) == len(rows)
+    assert list(row_buffer) == rows
+    assert list(row_buffer) == rows
+    path = row_buffer._path
+    assert path is not None and os.path.exists(path)
+    row_buffer.close()
+    assert not os.path.exists(path)
+
+    with budget.RowBuffer(budget.MemoryBudget(10 ** 6)) as row_buffer:
+        row_buffer.extend(rows[:10])
+        assert not row_buffer.spilled
+        assert row_buffer.budget is not None and row_buffer.budget.used > 0
+    assert row_buffer.budget.used == 0
+
+
+def test_join_under_budget() -> None:
+    graph_b = Graph.graph_from_iter('b')
+    graph = Graph.graph_from_iter('a') \
+        .join(operations.InnerJoiner(), graph_b, ['id']) \
+        .sort(['id', 'value_1', 'value_2'])
+    rows_a = random_rows(100, 5, 1)
+    rows_b = random_rows(500, 5, 2)
+    expected = list(graph.run(a=lambda: iter(rows_a), b=lambda: iter(rows_b)))
+
+    memory = budget.MemoryBudget(20000)
+    result = list(graph.run(RunOptions(memory_limit=memory),
+                            a=lambda: iter(rows_a), b=lambda: iter(rows_b)))
+    assert result == expected
+    assert memory.spilled_rows > 0
+    assert memory.used == 0
+
+
+def test_term_frequency_under_budget() -> None:
+    rows = [{'doc_id': 1, 'text': f'w{row["id"]}'}
+            for row in random_rows(3000, 500, 3)]
+    graph = Graph.graph_from_iter('docs') \
+        .reduce(operations.TermFrequency('text'), ['doc_id'])
+    expected = sorted(graph.run(docs=lambda: iter(rows)),
+                      key=itemgetter('text'))
+
+    memory = budget.MemoryBudget(20000)
+    result = list(graph.run(RunOptions(memory_limit=memory),
+                            docs=lambda: iter(rows)))
+    assert result == expected
+    assert memory.spilled_rows > 0
+    assert memory.used == 0
+
+
+def test_sort_worker_spills() -> None:
+    rows = random_rows(5000, 1000, 4)
+    stats: dict[str, tp.Any] = {}
+    memory = budget.MemoryBudget(100000)
+    sort = external_sort.ExternalSort(['id'], run_rows=0)
+    result = list(budget.within(memory, sort(rows, stats=stats)))
+    assert result == sorted(rows, key=itemgetter('id'))
+    assert stats['worker_spilled_runs'] > 1
+    assert memory.used == 0
+
+
+def test_sort_worker_runs_bounded_under_tiny_budget() -> None:
+    rows = random_rows(70000, 1000, 5)
+    stats: dict[str, tp.Any] = {}
+    memory = budget.MemoryBudget(1)
+    sort = external_sort.ExternalSort(['id'])
+    result = list(budget.within(memory, sort(rows, stats=stats)))
+    assert result == sorted(rows, key=itemgetter('id'))
+    assert stats['worker_spilled_runs'] == \
+        len(rows) // external_sort.RUN_ROWS
+
+    stats = {}
+    sort = external_sort.ExternalSort(['id'], run_rows=0, merge_runs=4)
+    result = list(budget.within(memory, sort(rows, stats=stats)))
+    assert result == sorted(rows, key=itemgetter('id'))
+    # a run of each of 69 blocks, merged four at a time
+    assert stats['worker_spilled_runs'] == 69
+    assert stats['worker_merge_levels'] == 4
+    assert memory.used == 0
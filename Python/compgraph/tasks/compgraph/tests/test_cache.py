@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import typing as tp
+
+from compgraph import Graph, RunOptions, algorithms, checkpoint, operations
+from compgraph import cache as result_cache
+from compgraph.cache import ResultCache
+from compgraph.checkpoint import file_state
+
+TEXTS = [{'doc_id': i, 'text': f'Hello, little world {i % 3}!'}
+         for i in range(100)]
+
+
+def _unused() -> tp.Iterator[operations.TRow]:
+    raise AssertionError('source read again')
+
+
+def test_cached_word_count(tmp_path: tp.Any) -> None:
+    source = tmp_path / 'texts.txt'
+    source.write_text('\n'.join(json.dumps(row) for row in TEXTS))
+    graph = algorithms.word_count_graph('texts')
+    cache = ResultCache(str(tmp_path / 'cache'))
+
+    def run(**kwargs: tp.Any) -> list[operations.TRow]:
+        options = RunOptions(
+            cache=cache, input_states={'texts': file_state(str(source))})
+        return list(graph.run(options, **kwargs))
+
+    expected = list(graph.run(texts=lambda: iter(TEXTS)))
+    assert run(texts=lambda: iter(TEXTS)) == expected
+    assert run(texts=_unused) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # a changed input is a miss
+    source.write_text(json.dumps(TEXTS[0]))
+    assert run(texts=lambda: iter(TEXTS[:1])) != expected
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # iterators of unknown state are not cached
+    assert list(graph.run(RunOptions(cache=cache),
+                          texts=lambda: iter(TEXTS))) == \
+        expected
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_files_by_contents(tmp_path: tp.Any) -> None:
+    source = tmp_path / 'texts.txt'
+    source.write_text('\n'.join(json.dumps(row) for row in TEXTS))
+    graph = Graph.graph_from_file(str(source), json.loads) \
+        .sort(['doc_id']) \
+        .reduce(operations.Count('count'), ['text'])
+    cache = ResultCache(str(tmp_path / 'cache'), hash_contents=True)
+    expected = list(graph.run(RunOptions(cache=cache)))
+    # the same contents written again
+    os.utime(source, (0, 0))
+    assert list(graph.run(RunOptions(cache=cache))) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_unfinished_result_is_not_kept(tmp_path: tp.Any) -> None:
+    graph = Graph.graph_from_iter('rows')
+    cache = ResultCache(str(tmp_path))
+    rows = graph.run(RunOptions(cache=cache, input_states={'rows': 'v1'}),
+                     rows=lambda: iter(TEXTS))
+    next(iter(rows))
+    del rows
+    assert os.listdir(tmp_path) == []
+
+
+def test_least_recently_used_evicted(tmp_path: tp.Any) -> None:
+    graph = Graph.graph_from_iter('rows')
+    cache = ResultCache(str(tmp_path))
+
+    def run(version: str) -> None:
+        options = RunOptions(cache=cache, input_states={'rows': version})
+        list(graph.run(options, rows=lambda: iter(TEXTS)))
+
+    for version in 'abc':
+        run(version)
+    assert len(os.listdir(tmp_path)) == 3
+    size = max(entry.stat().st_size for entry in os.scandir(tmp_path))
+    cache.max_bytes = 2 * size
+    # 'a' is used again, so 'b' and 'c' are evicted for 'd'
+    for count, path in enumerate(sorted(
+            os.scandir(tmp_path), key=lambda entry: entry.stat().st_mtime)):
+        os.utime(path, ns=(count, count))
+    run('a')
+    run('d')
+    assert len(os.listdir(tmp_path)) == 2
+    hits = cache.hits
+    run('a')
+    run('d')
+    assert cache.hits == hits + 2
+    run('b')
+    assert cache.hits == hits + 2
+
+
+def test_unfingerprinted_plan_is_not_cached(tmp_path: tp.Any) -> None:
+    lock = threading.Lock()
+    graph = Graph.graph_from_iter('rows') \
+        .map(operations.Filter(lambda row: lock is not None))
+    cache = ResultCache(str(tmp_path))
+    options = RunOptions(cache=cache, input_states={'rows': 'v1'})
+    assert len(list(graph.run(options, rows=lambda: iter(TEXTS)))) == 100
+    assert os.listdir(tmp_path) == []
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_stale_partial_results_evicted(tmp_path: tp.Any) -> None:
+    checkpoint_file = tmp_path / 'other.rows'
+    checkpoint_file.write_bytes(b'')
+    stale = tmp_path / f'key{result_cache.SUFFIX}.x{checkpoint.PARTIAL}'
+    stale.write_bytes(b'')
+    os.utime(stale, (0, 0))
+    fresh = tmp_path / f'other{result_cache.SUFFIX}.y{checkpoint.PARTIAL}'
+    fresh.write_bytes(b'')
+
+    graph = Graph.graph_from_iter('rows')
+    options = RunOptions(cache=ResultCache(str(tmp_path), max_bytes=0),
+                         input_states={'rows': 'v1'})
+    list(graph.run(options, rows=lambda: iter(TEXTS)))
+    # the new result is over the size, checkpoints are not results
+    assert sorted(os.listdir(tmp_path)) == \
+        sorted([checkpoint_file.name, fresh.name])
+
+
+def test_result_evicted_after_lookup_is_read(tmp_path: tp.Any) -> None:
+    graph = Graph.graph_from_iter('rows')
+    options = RunOptions(cache=ResultCache(str(tmp_path)),
+                         input_states={'rows': 'v1'})
+    list(graph.run(options, rows=lambda: iter(TEXTS)))
+    rows = graph.run(options, rows=_unused)
+    # another run evicts the result before rows are read
+    for entry in os.scandir(tmp_path):
+        os.remove(entry.path)
+    assert list(rows) == TEXTS
@@ -0,0 +1,115 @@
+import json
+import os
+import typing as tp
+
+import pytest
+
+from compgraph import Graph, RunOptions, operations, optimizer
+
+from .rows import random_rows
+
+
+def _unused() -> tp.Iterator[operations.TRow]:
+    raise AssertionError('source read again')
+
+
+def test_resume_from_auto_checkpoints(tmp_path: tp.Any) -> None:
+    names = [{'id': i, 'name': f'n{i}'} for i in range(20)]
+    graph = Graph.graph_from_iter('rows') \
+        .sort(['id']) \
+        .join(operations.InnerJoiner(),
+              Graph.graph_from_iter('names').sort(['id']), ['id']) \
+        .map(operations.Project(['name', 'value']))
+    expected = list(graph.run(rows=lambda: iter(random_rows(500, 20)),
+                              names=lambda: iter(names)))
+
+    directory = str(tmp_path)
+    # iterators without states are not checkpointed
+    assert list(graph.run(RunOptions(checkpoint_dir=directory),
+                          rows=lambda: iter(random_rows(500, 20)),
+                          names=lambda: iter(names))) == expected
+    assert os.listdir(directory) == []
+
+    def run(version: str, rows: tp.Callable[[], tp.Iterator[operations.TRow]],
+            names_rows: tp.Callable[[], tp.Iterator[operations.TRow]]
+            ) -> list[operations.TRow]:
+        options = RunOptions(checkpoint_dir=directory,
+                             input_states={'rows': version, 'names': 'v1'})
+        return list(graph.run(options, rows=rows, names=names_rows))
+
+    assert run('v1', lambda: iter(random_rows(500, 20)),
+               lambda: iter(names)) == expected
+    # outputs of the join and of both sorts merged into it
+    assert len(os.listdir(directory)) == 1
+    assert run('v1', _unused, _unused) == expected
+
+    # changed rows are read again
+    changed = random_rows(100, 20)
+    assert run('v2', lambda: iter(changed), lambda: iter(names)) == \
+        list(graph.run(rows=lambda: iter(changed), names=lambda: iter(names)))
+    assert len(os.listdir(directory)) == 2
+
+
+def test_resume_from_marked_stage(tmp_path: tp.Any) -> None:
+    source = tmp_path / 'rows.txt'
+    rows = random_rows(500, 20)
+    source.write_text('\n'.join(json.dumps(row) for row in rows))
+
+    def fail(row: operations.TRow) -> bool:
+        if row['id'] == 19:
+            raise RuntimeError('late failure')
+        return True
+
+    def graph(condition: tp.Callable[[operations.TRow], bool]) -> Graph:
+        return Graph.graph_from_file(str(source), json.loads) \
+            .sort(['id']) \
+            .reduce(operations.Sum('value'), ['id']) \
+            .checkpoint() \
+            .sort(['value']) \
+            .map(operations.Filter(condition))
+
+    directory = str(tmp_path / 'checkpoints')
+    with pytest.raises(RuntimeError):
+        list(graph(fail).run(RunOptions(checkpoint_dir=directory)))
+    # the sort after the checkpoint has read all rows before the failure
+    assert len(os.listdir(directory)) == 1
+
+    fixed = graph(lambda row: row['id'] != 19)
+    plan = optimizer.optimize(fixed)
+    optimizer.add_checkpoints(plan, directory)
+    assert [optimizer.strategy(node.operation) for node in plan.nodes] == \
+        ['scan', 'external sort', 'stream']
+    expected = list(fixed.run())
+    assert list(fixed.run(RunOptions(checkpoint_dir=directory))) == expected
+    assert len(expected) == 19
+
+    # checkpoints of changed files are not used
+    source.write_text('\n'.join(json.dumps(row) for row in rows[:100]))
+    assert len(list(fixed.run(RunOptions(checkpoint_dir=directory)))) == 19
+    assert len(os.listdir(directory)) == 2
+
+
+def test_least_recently_used_checkpoints_evicted(tmp_path: tp.Any) -> None:
+    graph = Graph.graph_from_iter('rows').sort(['id'])
+    rows = random_rows(500, 20)
+    directory = str(tmp_path)
+
+    def run(version: str, max_bytes: int = 10 ** 6) -> None:
+        options = RunOptions(checkpoint_dir=directory,
+                             input_states={'rows': version},
+                             checkpoint_bytes=max_bytes)
+        list(graph.run(options, rows=lambda: iter(rows)))
+
+    paths = {}
+    for count, version in enumerate('abc'):
+        before = set(os.listdir(directory))
+        run(version)
+        name, = set(os.listdir(directory)) - before
+        paths[version] = os.path.join(directory, name)
+        os.utime(paths[version], ns=(count, count))
+    size = os.path.getsize(paths['a'])
+    # 'a' is resumed from, so 'b' and 'c' are evicted for 'd'
+    run('a')
+    run('d', 2 * size)
+    assert len(os.listdir(directory)) == 2
+    assert os.path.exists(paths['a'])
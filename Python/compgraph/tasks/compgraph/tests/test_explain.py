@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+import typing as tp
+from copy import deepcopy
+from datetime import datetime
+
+from compgraph import graph, operations, optimizer, statistics
+from compgraph.expressions import col
+
+LIMIT = 1
+
+
+def _graph(limit: int) -> graph.Graph:
+    return graph.Graph.graph_from_iter('docs') \
+        .map(operations.Filter(lambda row: row['a'] > limit, ['a'])) \
+        .sort(['a'])
+
+
+def test_fingerprints() -> None:
+    first = optimizer.optimize(_graph(1))
+    second = optimizer.optimize(deepcopy(_graph(1)))
+    other = optimizer.optimize(_graph(2))
+    assert [node.fingerprint for node in first.nodes] == \
+        [node.fingerprint for node in second.nodes]
+    assert first.nodes[0].fingerprint == other.nodes[0].fingerprint
+    assert first.nodes[1].fingerprint != other.nodes[1].fingerprint
+
+
+def _last(g: graph.Graph) -> str:
+    return optimizer.optimize(g).nodes[-1].fingerprint
+
+
+def test_fingerprints_of_values() -> None:
+    def after(time: datetime) -> graph.Graph:
+        return graph.Graph.graph_from_iter('docs').map(
+            operations.Filter(lambda row: row['time'] > time))
+
+    assert _last(after(datetime(2020, 1, 1))) == \
+        _last(after(datetime(2020, 1, 1)))
+    assert _last(after(datetime(2020, 1, 1))) != \
+        _last(after(datetime(2030, 1, 1)))
+
+    global LIMIT
+    above = graph.Graph.graph_from_iter('docs').map(
+        operations.Filter(lambda row: row['a'] > LIMIT))
+    before = _last(above)
+    LIMIT = 2
+    try:
+        assert _last(above) != before
+    finally:
+        LIMIT = 1
+
+
+def test_fingerprints_between_processes() -> None:
+    script = ('from compgraph import graph, operations, optimizer\n'
+              'from compgraph.expressions import col\n'
+              'g = graph.Graph.graph_from_iter("docs").map(operations.Filter('
+              'col("w").isin([f"w{i}" for i in range(50)])))\n'
+              'print(optimizer.optimize(g).nodes[-1].fingerprint)')
+    fingerprints = {subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True,
+        check=True, env={**os.environ, 'PYTHONHASHSEED': str(seed)}).stdout
+        for seed in range(3)}
+    assert len(fingerprints) == 1
+
+
+def test_unknown_state_is_not_fingerprinted() -> None:
+    rows: tp.Iterator[int] = (i for i in range(10))
+    g = graph.Graph.graph_from_iter('docs') \
+        .map(operations.Filter(col('a') > 1)) \
+        .map(operations.Filter(lambda row: next(rows) > 0)) \
+        .sort(['a'])
+    plan = optimizer.optimize(g)
+    assert [node.fingerprinted for node in plan.nodes] == \
+        [True, True, False, False]
+    assert not plan.fingerprinted
+
+
+def test_estimate_rows() -> None:
+    g = graph.Graph.graph_from_iter('docs') \
+        .map(operations.Split('text')) \
+        .sort(['text']) \
+        .reduce(operations.Count('count'), ['text'])
+    plan = optimizer.optimize(g)
+    optimizer.estimate_rows(plan)
+    rows = optimizer.DEFAULT_ROWS
+    assert [node.rows for node in plan.nodes] == [rows, rows * 10, rows]
+
+    known = statistics.Statistics()
+    known.update({plan.nodes[1].fingerprint: 50})
+    optimizer.estimate_rows(plan, known)
+    assert [node.rows for node in plan.nodes] == [rows, 50, 5]
+
+
+def test_explain_analyze() -> None:
+    docs = [{'a': i % 4, 'b': i} for i in range(20)]
+    prefix = _graph(0)
+    first = deepcopy(prefix).reduce(operations.FirstReducer(), ['a'])
+    g = prefix.join(operations.InnerJoiner(), first, ['a'])
+
+    lines = g.explain().splitlines()
+    assert lines[1].split() == ['#1', 'ReadIterFactory(docs)', 'scan', '1000']
+    assert '= #1..#2' in lines[3]
+    assert 'shared, recomputed' in lines[3]
+    assert 'adaptive hash join' in lines[-1]
+
+    lines = g.explain(True, docs=lambda: iter(docs)).splitlines()
+    assert lines[0].split()[-3:] == ['rows', 'time,', 's']
+    assert lines[-1].split()[-3:-1] == ['500', '15']
+    assert g.explain().splitlines()[-1].split()[-1] == '15'
@@ -0,0 +1,110 @@
+import math
+import typing as tp
+
+import pytest
+
+from compgraph import expressions as ex
+from compgraph import graph, operations, optimizer
+
+
+def test_expression_values() -> None:
+    row = {'a': 6, 'b': 4, 'text': 'Hello'}
+    assert (ex.col('a') / ex.col('b'))(row) == 1.5
+    assert (ex.col('a') - ex.col('b') * 2)(row) == -2
+    assert (10 - ex.col('a'))(row) == 4
+    assert ex.log(ex.col('a') / 2)(row) == math.log(3)
+    assert ex.sqrt(ex.col('b'))(row) == 2
+    assert ex.exp(0)(row) == 1
+    assert (-ex.col('a') ** 2)(row) == -36
+    assert abs(ex.col('b') - ex.col('a'))(row) == 2
+    assert ex.lower(ex.col('text'))(row) == 'hello'
+    assert (ex.length(ex.col('text')) > 4)(row) is True
+    assert ((ex.col('a') > 5) & (ex.col('b') > 5))(row) is False
+    assert ((ex.col('a') > 5) | (ex.col('b') > 5))(row) is True
+    assert (~(ex.col('a') == 6))(row) is False
+    assert ex.col('text').isin(['Hello', 'World'])(row) is True
+    assert (ex.col('a') * 0.5 + ex.lit(1.5))(row) == 4.5
+
+
+def test_expression_columns() -> None:
+    expression = ex.log(ex.col('a') / ex.col('b')) + ex.col('a')
+    assert expression.columns == {'a', 'b'}
+    assert repr(expression) == "(log((col('a') / col('b'))) + col('a'))"
+
+
+def test_expression_must_compile() -> None:
+    class Partial(ex.Expression):
+        @property
+        def columns(self) -> frozenset[str]:
+            return frozenset()
+
+    with pytest.raises(TypeError):
+        Partial()  # type: ignore[abstract]
+
+
+def test_conjuncts() -> None:
+    first = ex.col('a') > 1
+    second = ex.col('b') < 2
+    third = ex.col('c') == 3
+    assert ex.conjuncts(first & second & third) == [first, second, third]
+    either = first | second
+    assert ex.conjuncts(either) == [either]
+
+
+def test_bool_is_ambiguous() -> None:
+    with pytest.raises(TypeError):
+        bool(ex.col('a') > 1)
+
+
+def test_compute_in_order() -> None:
+    mapper = operations.Compute([('c', ex.col('a') + ex.col('b')),
+                                 ('d', ex.col('c') * 2)])
+    assert list(mapper({'a': 1, 'b': 2})) == [{'a': 1, 'b': 2, 'c': 3,
+                                               'd': 6}]
+    assert mapper.required_columns({'d'}) == {'a', 'b'}
+    assert mapper.changed_columns() == {'c', 'd'}
+
+
+def test_filter_expression() -> None:
+    condition = ex.col('count') >= 2
+    mapper = operations.Filter(condition)
+    assert mapper.columns == ['count']
+    rows = [{'count': 1}, {'count': 2}, {'count': 3}]
+    assert list(operations.Map(mapper)(rows)) == [{'count': 2}, {'count': 3}]
+
+
+def test_bound_filter_compiles_once(monkeypatch: pytest.MonkeyPatch
+                                    ) -> None:
+    compiled = 0
+    compile = ex.Expression.compile
+
+    def counted(self: ex.Expression, side: tp.Any = None) -> tp.Any:
+        nonlocal compiled
+        compiled += 1
+        return compile(self, side)
+
+    monkeypatch.setattr(ex.Expression, 'compile', counted)
+    mapper = operations.Filter(ex.col('a') > ex.side('limit')).bind(
+        {'limit': 2})
+    rows = [{'a': i} for i in range(5)]
+    assert [out for row in rows for out in mapper(row)] == rows[3:]
+    assert compiled == 1
+
+
+def test_fused_maps() -> None:
+    g = graph.Graph.graph_from_iter('rows') \
+        .map(operations.Divide('a', 'b', 'ratio')) \
+        .map(operations.Minus('a', 'b', 'diff')) \
+        .map(operations.Filter((ex.col('a') > 1) & (ex.col('b') < 10)))
+    plan = optimizer.optimize(g)
+    assert len(plan.nodes) == 3
+    condition = plan.nodes[1].operation
+    assert isinstance(condition, operations.Map)
+    assert isinstance(condition.mapper, operations.Filter)
+    compute = plan.nodes[2].operation
+    assert isinstance(compute, operations.Map)
+    assert isinstance(compute.mapper, operations.Compute)
+
+    rows = [{'a': 4, 'b': 2}, {'a': 1, 'b': 4}, {'a': 40, 'b': 20}]
+    assert list(g.run(rows=lambda: iter(rows))) == \
+        [{'a': 4, 'b': 2, 'ratio': 2.0, 'diff': 2}]
@@ -1,5 +1,9 @@
 import typing as tp
+
+import pytest
+
 from compgraph import graph, operations
+from compgraph.expressions import col, side
 
 
 def test_read_from_file(tmp_path: tp.Any) -> None:
@@ -153,3 +157,88 @@ def test_consecutive() -> None:
                       count_mass=lambda: iter(rows_b_1_b)):
         res.append(row)
     compare(expected_4, res)
+
+
+def test_scalar_side_input() -> None:
+    rows = [{'id': 1, 'count': 2}, {'id': 2, 'count': 6}]
+    total = graph.Graph.graph_from_iter('rows') \
+        .reduce(operations.SumOfAllTable('count', 'total'), [])
+    g = graph.Graph.graph_from_iter('rows').map(
+        operations.Divide('count', side('total'), 'share'),
+        side_inputs={'total': total.as_scalar('total')})
+    assert list(g.run(rows=lambda: iter(rows))) == [
+        {'id': 1, 'count': 2, 'share': 0.25},
+        {'id': 2, 'count': 6, 'share': 0.75}]
+
+    empty = graph.Graph.graph_from_iter('empty')
+    g = graph.Graph.graph_from_iter('rows').map(
+        operations.Compute({'limit': side('limit')}),
+        side_inputs={'limit': empty.as_scalar('limit', default=0)})
+    assert [row['limit'] for row in g.run(rows=lambda: iter(rows),
+                                          empty=lambda: iter([]))] == [0, 0]
+
+    g = graph.Graph.graph_from_iter('rows').map(
+        operations.Compute({'count': side('count')}),
+        side_inputs={'count': graph.Graph.graph_from_iter('rows')
+                     .as_scalar('count')})
+    with pytest.raises(ValueError):
+        list(g.run(rows=lambda: iter(rows)))
+
+
+def test_table_side_input() -> None:
+    rows = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]
+    names = [{'name': 'a', 'title': 'A'}, {'name': 'b', 'title': 'B'},
+             {'name': 'c', 'title': 'C'}]
+    titles = graph.Graph.graph_from_iter('names').as_table(['name'])
+    g = graph.Graph.graph_from_iter('rows').map(
+        operations.Filter(col('name').isin(['a'])
+                          | (side('titles')[col('name')]['title'] == 'B')),
+        side_inputs={'titles': titles})
+    assert list(g.run(rows=lambda: iter(rows),
+                      names=lambda: iter(names))) == rows
+
+    g = graph.Graph.graph_from_iter('rows').map(
+        operations.Compute({'title': side('titles')[col('name')]['title']}),
+        side_inputs={'titles': titles})
+    assert list(g.run(rows=lambda: iter(rows),
+                      names=lambda: iter(names))) == [
+        {'id': 1, 'name': 'a', 'title': 'A'},
+        {'id': 2, 'name': 'b', 'title': 'B'}]
+
+
+def test_join_many() -> None:
+    a = [{'id': 1, 'x': 1, 'a': 'a1'}, {'id': 2, 'x': 2, 'a': 'a2'},
+         {'id': 3, 'x': 3, 'a': 'a3'}]
+    b = [{'id': 3, 'x': 30, 'b': 'b3'}, {'id': 1, 'x': 10, 'b': 'b1'},
+         {'id': 1, 'x': 11, 'b': 'b1'}]
+    c = [{'id': 1, 'c': 'c1'}, {'id': 2, 'c': 'c2'}]
+    graph_b = graph.Graph.graph_from_iter('b').sort(['id'])
+    graph_c = graph.Graph.graph_from_iter('c').sort(['id'])
+    g = graph.Graph.graph_from_iter('a').sort(['id']) \
+        .join_many([graph_b, graph_c], ['id'])
+    sources = {'a': lambda: iter(a), 'b': lambda: iter(b),
+               'c': lambda: iter(c)}
+    assert list(g.run(**sources)) == [
+        {'id': 1, 'x_1': 1, 'a': 'a1', 'x_2': 10, 'b': 'b1', 'c': 'c1'},
+        {'id': 1, 'x_1': 1, 'a': 'a1', 'x_2': 11, 'b': 'b1', 'c': 'c1'}]
+
+    g = graph.Graph.graph_from_iter('a').sort(['id']) \
+        .join_many([graph_b, graph_c], ['id'], left=True) \
+        .map(operations.Project(['id', 'b', 'c']))
+    assert list(g.run(**sources)) == [
+        {'id': 1, 'b': 'b1', 'c': 'c1'}, {'id': 1, 'b': 'b1', 'c': 'c1'},
+        {'id': 2, 'c': 'c2'}, {'id': 3, 'b': 'b3'}]
+
+    with pytest.raises(ValueError):
+        g.join_many([graph_b], ['id'], suffixes=['_a'])
+
+
+def test_sources_named_as_options() -> None:
+    rows = [{'id': 2}, {'id': 1}]
+    g = graph.Graph.graph_from_iter('profile').sort(['id']) \
+        .join(operations.InnerJoiner(),
+              graph.Graph.graph_from_iter('options').sort(['id']), ['id'])
+    result = g.run(graph.RunOptions(profile=True),
+                   profile=lambda: iter(rows), options=lambda: iter(rows))
+    assert list(result) == [{'id': 1}, {'id': 2}]
+    assert g.last_profile is not None
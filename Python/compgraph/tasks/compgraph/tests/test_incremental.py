@@ -0,0 +1,66 @@
+import typing as tp
+from operator import itemgetter
+
+from pytest import approx
+
+from compgraph import algorithms
+from compgraph.incremental import IncrementalTfIdf, IncrementalWordCount
+
+DOCUMENTS = [
+    {'doc_id': 1, 'text': 'hello, little world'},
+    {'doc_id': 2, 'text': 'little'},
+    {'doc_id': 3, 'text': 'little little little'},
+    {'doc_id': 4, 'text': 'little? hello little world'},
+    {'doc_id': 5, 'text': 'HELLO HELLO! WORLD...'},
+    {'doc_id': 6, 'text': 'world? world... world!!! WORLD!!! HELLO!!!'}
+]
+
+
+def test_word_count(tmp_path: tp.Any) -> None:
+    path = str(tmp_path / 'counts.db')
+    with IncrementalWordCount(path) as counts:
+        assert counts.update(DOCUMENTS[:4]) == [
+            {'text': 'hello', 'count': 2},
+            {'text': 'world', 'count': 2},
+            {'text': 'little', 'count': 7},
+        ]
+    with IncrementalWordCount(path) as counts:
+        assert counts.update(DOCUMENTS[4:]) == [
+            {'text': 'hello', 'count': 5},
+            {'text': 'world', 'count': 7},
+        ]
+        expected = algorithms.word_count_graph('texts').run(
+            texts=lambda: iter(DOCUMENTS))
+        assert list(counts.rows()) == list(expected)
+
+
+def test_tf_idf(tmp_path: tp.Any) -> None:
+    path = str(tmp_path / 'tf_idf.db')
+    with IncrementalTfIdf(path) as index:
+        changed = index.update(DOCUMENTS[:3])
+        assert [row['doc_id'] for row in changed] == [1, 1, 1, 2, 3]
+        assert changed[0] == {'doc_id': 1, 'text': 'hello',
+                              'tf_idf': approx(0.3662, 0.001)}
+    with IncrementalTfIdf(path) as index:
+        changed = index.update(iter(DOCUMENTS[3:]))
+        assert index.documents == 6
+        assert {row['text'] for row in changed} == \
+            {'hello', 'little', 'world'}
+
+        expected = algorithms.inverted_index_graph('texts').run(
+            texts=lambda: iter(DOCUMENTS))
+        key = itemgetter('doc_id', 'text')
+        result = list(index.rows())
+        assert result == sorted(result, key=key)
+        assert result == [{**row, 'tf_idf': approx(row['tf_idf'])}
+                          for row in sorted(expected, key=key)]
+
+
+def test_tf_idf_changes_only_new_words(tmp_path: tp.Any) -> None:
+    with IncrementalTfIdf(str(tmp_path / 'tf_idf.db'), n=1) as index:
+        index.update(DOCUMENTS)
+        changed = index.update([{'doc_id': 7, 'text': 'Little cat'}])
+        assert changed == [
+            {'doc_id': 2, 'text': 'little', 'tf_idf': approx(0.3365, 0.001)},
+            {'doc_id': 7, 'text': 'cat', 'tf_idf': approx(0.9730, 0.001)},
+        ]
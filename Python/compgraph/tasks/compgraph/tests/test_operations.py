@@ -1,6 +1,7 @@
 import math
 import typing as tp
 from datetime import datetime, timedelta
+import pytest
 from pytest import approx
 
 from compgraph import operations
@@ -260,3 +261,84 @@ def test_MulSum() -> None:
     for ind, case in enumerate(tests_data):
         res = operations.MulSum(['b', 'c'])(['id'], case)  # type:ignore
         compare_reduce(expected[ind], res)
+
+
+def test_spilled_join_groups() -> None:
+    def key(row: dict[str, tp.Any]) -> str:
+        return repr(sorted(row.items()))
+
+    rows_a = [{'id': i // 100, 'a': i, 'c': 1} for i in range(300)]
+    rows_b = [{'id': i // 10, 'b': i, 'c': 2} for i in range(20)]
+    for joiner_type in (operations.InnerJoiner, operations.OuterJoiner,
+                        operations.LeftJoiner, operations.RightJoiner):
+        for keys in (['id'], []):
+            join = operations.Join(joiner_type(), keys)
+            expected = list(join(rows_a, rows_b))
+            join = operations.Join(joiner_type(spill_rows=10), keys)
+            spilled = list(join(rows_a, rows_b))
+            assert sorted(spilled, key=key) == sorted(expected, key=key)
+            join = operations.Join(joiner_type(spill_rows=10), keys)
+            spilled = list(join(rows_b, rows_a))
+            expected = list(operations.Join(joiner_type(), keys)(rows_b,
+                                                                 rows_a))
+            assert sorted(spilled, key=key) == sorted(expected, key=key)
+
+
+def test_join_merge_plan_keeps_columns() -> None:
+    rows_a = [{'id': 1, 'x': 1, 'a': 2}, {'id': 1, 'a': 3, 'x': 4},
+              {'id': 1, 'x': 5, 'x_1': 6}]
+    rows_b = [{'id': 1, 'x': 7, 'b': 8}, {'b': 9, 'id': 1},
+              {'id': 1, 'a': 10, 'x': 11}]
+    for joiner in (operations.InnerJoiner(), operations.LeftJoiner(),
+                   operations.OuterJoiner(), operations.CrossJoin(),
+                   operations.InnerJoiner(suffix_a='_a', suffix_b='_b')):
+        keys = [] if isinstance(joiner, operations.CrossJoin) else ['id']
+        result = list(joiner(keys, rows_a, rows_b))
+        expected = [joiner._combine(keys, row_a, row_b)
+                    for row_a in rows_a for row_b in rows_b]
+        assert [list(row.items()) for row in result] == \
+            [list(row.items()) for row in expected]
+
+    right = operations.RightJoiner()
+    result = list(right(['id'], rows_a[:2], rows_b))
+    expected = [right._combine_right(['id'], row_b, row_a)
+                for row_b in rows_b for row_a in rows_a[:2]]
+    assert [list(row.items()) for row in result] == \
+        [list(row.items()) for row in expected]
+
+
+class _Batched(operations.Count):
+    def __init__(self) -> None:
+        super().__init__('count')
+        self.batches: list[int] = []
+
+    def reduce_batch(self, group_key: tuple[str, ...],
+                     groups: list[list[operations.TRow]]
+                     ) -> operations.TRowsGenerator:
+        self.batches.append(len(groups))
+        yield from super().reduce_batch(group_key, groups)
+
+
+def test_reduce_batches_small_groups() -> None:
+    large = operations.BATCH_ROWS + 5
+    rows = [{'id': i // 2, 'a': i} for i in range(10)] + \
+        [{'id': 5, 'a': i} for i in range(large)] + \
+        [{'id': 6, 'a': 0}]
+    reducer = _Batched()
+    result = list(operations.Reduce(reducer, ['id'])(iter(rows)))
+    assert result == [{'id': i, 'count': 2} for i in range(5)] + \
+        [{'id': 5, 'count': large}, {'id': 6, 'count': 1}]
+    # the large group is reduced on its own between two batches
+    assert reducer.batches == [5, 1]
+    assert list(operations.Reduce(operations.FirstReducer(), ['id'])(
+        iter(rows))) == [rows[i] for i in (0, 2, 4, 6, 8, 10, large + 10)]
+
+
+def test_reducer_implements_one_method() -> None:
+    group = [{'id': 1, 'a': 1}, {'id': 1, 'a': 2}]
+    assert list(operations.CountRows('count').reduce_group(
+        ('id',), group)) == [{'id': 1, 'a': 1, 'count': 2}]
+
+    with pytest.raises(TypeError):
+        class Empty(operations.Reducer):
+            pass
@@ -0,0 +1,144 @@
+import typing as tp
+from copy import deepcopy
+
+from compgraph import algorithms, external_sort, graph, operations, optimizer
+
+
+def test_source_columns() -> None:
+    g = algorithms.yandex_maps_graph('travel_time', 'edge_length')
+    plan = optimizer.optimize(g)
+    assert optimizer.source_columns(plan) == {
+        'travel_time': {'enter_time', 'leave_time', 'edge_id'},
+        'edge_length': {'start', 'end', 'edge_id'}
+    }
+
+    g = algorithms.word_count_graph('docs')
+    plan = optimizer.optimize(g)
+    assert optimizer.source_columns(plan) == {'docs': {'text'}}
+
+
+def test_unknown_mapper_reads_everything() -> None:
+    class Custom(operations.Mapper):
+        def __call__(self, row: operations.TRow) -> operations.TRowsGenerator:
+            yield row
+
+    g = graph.Graph.graph_from_iter('docs').map(Custom()) \
+        .map(operations.Project(['a']))
+    plan = optimizer.optimize(g)
+    assert optimizer.source_columns(plan) == {'docs': None}
+
+
+def test_project_before_sort() -> None:
+    g = graph.Graph.graph_from_iter('docs') \
+        .map(operations.Minus('a', 'b', 'c')) \
+        .sort(['c']) \
+        .map(operations.Project(['c']))
+    plan = optimizer.optimize(g)
+    operation = plan.nodes[2].operation
+    assert isinstance(operation, operations.Map)
+    assert isinstance(operation.mapper, operations.Project)
+    assert set(operation.mapper.columns) == {'c'}
+    assert isinstance(plan.nodes[3].operation, external_sort.ExternalSort)
+
+    rows = [{'a': 5, 'b': 1, 'd': 'x'}, {'a': 2, 'b': 1, 'd': 'y'}]
+    assert list(g.run(docs=lambda: iter(rows))) == [{'c': 1}, {'c': 4}]
+
+
+def test_join_keeps_suffixes() -> None:
+    left = [{'id': 1, 'score': 10, 'unused': 'x'}]
+    right = [{'id': 1, 'score': 20, 'unused': 'y', 'name': 'a'}]
+
+    joined = graph.Graph.graph_from_iter('right')
+    g = graph.Graph.graph_from_iter('left') \
+        .join(operations.InnerJoiner(), joined, ['id']) \
+        .map(operations.Project(['score_1', 'name']))
+
+    plan = optimizer.optimize(g)
+    columns: dict[str, tp.Any] = optimizer.source_columns(plan)
+    assert columns['left'] == {'id', 'score', 'score_1', 'name'}
+    assert list(g.run(left=lambda: iter(left), right=lambda: iter(right))) \
+        == [{'score_1': 10, 'name': 'a'}]
+
+
+def _operations(plan: optimizer.Plan) -> list[tp.Any]:
+    result: list[tp.Any] = []
+    for node in plan.nodes:
+        operation = node.operation
+        if isinstance(operation, operations.Map):
+            result.append(type(operation.mapper).__name__)
+        elif isinstance(operation, operations.Reduce):
+            result.append(type(operation.reducer).__name__)
+        else:
+            result.append(type(operation).__name__)
+    return result
+
+
+def test_push_filters() -> None:
+    g = graph.Graph.graph_from_iter('docs') \
+        .map(operations.LowerCase('text')) \
+        .sort(['doc_id', 'text']) \
+        .reduce(operations.Count('count'), ['doc_id', 'text']) \
+        .map(operations.Filter(lambda row: row['count'] > 1, ['count'])) \
+        .map(operations.Filter(lambda row: row['doc_id'] > 1, ['doc_id'])) \
+        .map(operations.Filter(lambda row: len(row['text']) > 1, ['text']))
+    plan = optimizer.optimize(g)
+    assert _operations(plan) == [
+        'ReadIterFactory', 'Filter', 'LowerCase', 'Filter', 'Count', 'Filter'
+    ]
+
+    docs = [{'doc_id': 1, 'text': 'AA'}, {'doc_id': 2, 'text': 'BB'},
+            {'doc_id': 2, 'text': 'bb'}, {'doc_id': 2, 'text': 'C'},
+            {'doc_id': 2, 'text': 'c'}, {'doc_id': 3, 'text': 'dd'}]
+    assert list(g.run(docs=lambda: iter(docs))) == \
+        [{'doc_id': 2, 'text': 'bb', 'count': 2}]
+
+
+def test_filters_stay() -> None:
+    g = graph.Graph.graph_from_iter('docs') \
+        .reduce(operations.CountRows('count'), ['doc_id']) \
+        .map(operations.Filter(lambda row: row['doc_id'] > 1, ['doc_id'])) \
+        .map(operations.Filter(lambda row: row['count'] > 1))
+    plan = optimizer.optimize(g)
+    assert _operations(plan) == [
+        'ReadIterFactory', 'CountRows', 'Filter', 'Filter'
+    ]
+
+
+def test_push_filters_into_join() -> None:
+    right = graph.Graph.graph_from_iter('right').sort(['id'])
+    g = graph.Graph.graph_from_iter('left').sort(['id']) \
+        .join(operations.LeftJoiner(), right, ['id']) \
+        .map(operations.Filter(lambda row: row['id'] != 2, ['id']))
+    plan = optimizer.optimize(g)
+    assert _operations(plan) == [
+        'ReadIterFactory', 'Filter', 'AdaptiveJoin'
+    ]
+    assert _operations(plan.nodes[2].inputs[0]) == [
+        'ReadIterFactory', 'Filter'
+    ]
+
+    left = [{'id': 3, 'a': 1}, {'id': 2, 'a': 2}, {'id': 1, 'a': 3}]
+    right_rows = [{'id': 2, 'b': 1}, {'id': 1, 'b': 2}]
+    assert list(g.run(left=lambda: iter(left),
+                      right=lambda: iter(right_rows))) == \
+        [{'id': 1, 'a': 3, 'b': 2}, {'id': 3, 'a': 1}]
+
+
+def test_broadcast_join_before_sort() -> None:
+    right = graph.Graph.graph_from_iter('right').sort(['id'])
+    joined = graph.Graph.graph_from_iter('left').sort(['id']) \
+        .join(operations.InnerJoiner(), right, ['id'])
+    assert 'adaptive hash join' in joined.explain()
+
+    g = deepcopy(joined).map(operations.Product(['a', 'b'], 'c')) \
+        .sort(['c', 'id'])
+    assert 'adaptive broadcast join' in g.explain()
+
+    left = [{'id': i % 3, 'a': i} for i in range(9)]
+    right_rows = [{'id': i % 4, 'b': i} for i in range(8)]
+    expected = sorted(
+        [{'id': a['id'], 'a': a['a'], 'b': b['b'], 'c': a['a'] * b['b']}
+         for a in left for b in right_rows if a['id'] == b['id']],
+        key=lambda row: (row['c'], row['id']))
+    assert list(g.run(left=lambda: iter(left),
+                      right=lambda: iter(right_rows))) == expected
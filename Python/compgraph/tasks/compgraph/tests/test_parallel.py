@@ -0,0 +1,100 @@
+import random
+import typing as tp
+
+import pytest
+
+from compgraph import Graph, operations, optimizer, parallel
+from compgraph.expressions import col, side
+
+from .rows import random_rows
+
+
+def _rows(count: int) -> list[operations.TRow]:
+    generator = random.Random(0)
+    return [{'id': i, 'start': [generator.uniform(-180, 180),
+                                generator.uniform(-90, 90)],
+             'end': [generator.uniform(-180, 180),
+                     generator.uniform(-90, 90)]}
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('threads', [False, True])
+@pytest.mark.parametrize('ordered', [False, True])
+def test_parallel_map(ordered: bool, threads: bool) -> None:
+    rows = _rows(5000)
+    mapper = operations.Haversine('start', 'end', 'distance')
+    expected = list(operations.Map(mapper)(iter(rows)))
+    stats: dict[str, tp.Any] = {}
+    operation = parallel.ParallelMap(mapper, workers=2, ordered=ordered,
+                                     threads=threads, batch_rows=100)
+    result = list(operation(iter(rows), stats=stats))
+    if not ordered:
+        result.sort(key=lambda row: row['id'])
+    assert result == expected
+    assert stats['batches'] == 50
+
+
+def test_graph_parallel_map() -> None:
+    rows = [{'id': i, 'count': i % 5} for i in range(3000)]
+    total = Graph.graph_from_iter('rows') \
+        .reduce(operations.SumOfAllTable('count', 'total'), [])
+    graph = Graph.graph_from_iter('rows') \
+        .map(operations.Compute({'share': col('count') / side('total')}),
+             side_inputs={'total': total.as_scalar('total')}, workers=2) \
+        .map(operations.Filter(col('share') > 0))
+    plan = optimizer.optimize(graph)
+    assert [optimizer.strategy(node.operation) for node in plan.nodes] == \
+        ['scan', '2 processes, ordered', 'stream']
+    result = list(graph.run(rows=lambda: iter(rows)))
+    assert [row['id'] for row in result] == \
+        [i for i in range(3000) if i % 5]
+    assert result[0]['share'] == 1 / 6000
+
+
+@pytest.mark.parametrize('threads', [False, True])
+@pytest.mark.parametrize('reducer', [
+    operations.TopN('value', 3), operations.TermFrequency('word'),
+    operations.Count('count'), operations.CountRows('count')])
+def test_parallel_reduce(reducer: operations.Reducer, threads: bool) -> None:
+    rows = sorted(random_rows(5000, 300, 1), key=lambda row: row['id'])
+    for row in rows:
+        row['word'] = f'w{row["value"] % 5}'
+    expected = list(operations.Reduce(reducer, ['id'])(iter(rows)))
+    stats: dict[str, tp.Any] = {}
+    reduce = parallel.ParallelReduce(reducer, ['id'], threads=threads,
+                                     batch_rows=100)
+    assert list(reduce(iter(rows), stats=stats)) == expected
+    # groups are not split between batches
+    assert 40 < stats.get('batches', 0) <= 50 or not reducer.groupwise
+
+
+@pytest.mark.parametrize('threads', [False, True])
+def test_parallel_reduce_streams_large_group(threads: bool) -> None:
+    # the hot group with 'id' 0 comes in the middle
+    rows = sorted(random_rows(5000, 300, 2, hot=0.5),
+                  key=lambda row: (row['id'] - 150) % 300)
+    reducer = operations.TopN('value', 3)
+    expected = list(operations.Reduce(reducer, ['id'])(iter(rows)))
+    stats: dict[str, tp.Any] = {}
+    reduce = parallel.ParallelReduce(reducer, ['id'], threads=threads,
+                                     batch_rows=100, group_rows=1000)
+    assert list(reduce(iter(rows), stats=stats)) == expected
+    # the hot group is not gathered into a batch
+    assert stats['local_batches'] == 1
+    assert stats['batches'] <= 26
+
+
+def test_graph_parallel_reduce() -> None:
+    rows = [{'id': i % 7, 'b': i} for i in range(1000)]
+    graph = Graph.graph_from_iter('rows') \
+        .sort(['id']) \
+        .reduce(operations.TopN('b', 2), ['id'], workers=2)
+    plan = optimizer.optimize(graph)
+    assert [optimizer.strategy(node.operation) for node in plan.nodes] == \
+        ['scan', 'external sort', '2 processes, sorted groups']
+    assert [row['b'] for row in graph.run(rows=lambda: iter(rows))] == \
+        [994, 987, 995, 988, 996, 989, 997, 990, 998, 991, 999, 992, 993,
+         986]
+    with pytest.raises(ValueError):
+        Graph.graph_from_iter('rows').reduce(operations.Count('count'),
+                                             ['id'], partitions=2, workers=2)
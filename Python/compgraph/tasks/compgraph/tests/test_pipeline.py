@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from compgraph import Graph, RunOptions, operations, optimizer, pipeline
+from compgraph import statistics
+
+
+def _failing(count: int) -> operations.TRowsGenerator:
+    for i in range(count):
+        yield {'id': i}
+    raise RuntimeError('source failed')
+
+
+def test_prefetch() -> None:
+    rows = [{'id': i} for i in range(10000)]
+    assert list(pipeline.prefetch(iter(rows), queue_batches=2)) == rows
+
+    with pytest.raises(RuntimeError):
+        list(pipeline.prefetch(_failing(100)))
+
+    closed = threading.Event()
+
+    def endless() -> operations.TRowsGenerator:
+        try:
+            while True:
+                yield {'id': 0}
+        finally:
+            closed.set()
+
+    prefetched = pipeline.prefetch(endless())
+    assert next(prefetched) == {'id': 0}
+    prefetched.close()
+    assert closed.is_set()
+
+
+def test_prefetch_flushes_stalled_source() -> None:
+    resume = threading.Event()
+
+    def stalled() -> operations.TRowsGenerator:
+        for i in range(5):
+            yield {'id': i}
+        resume.wait(10)
+        yield {'id': 5}
+
+    prefetched = pipeline.prefetch(stalled())
+    started = time.perf_counter()
+    assert [next(prefetched) for _ in range(5)] == \
+        [{'id': i} for i in range(5)]
+    assert time.perf_counter() - started < 10 * pipeline.FLUSH_SECONDS
+    resume.set()
+    assert list(prefetched) == [{'id': 5}]
+
+
+def test_graph_pipeline() -> None:
+    rows: list[operations.TRow] = [{'id': i % 10, 'text': f'w{i % 7}'}
+                                   for i in range(5000)]
+    graph = Graph.graph_from_iter('rows') \
+        .map(operations.LowerCase('text')) \
+        .sort(['id']) \
+        .map(operations.Filter(lambda row: row['text'] != 'w0'))
+    expected = list(graph.run(rows=lambda: iter(rows)))
+
+    known = statistics.Statistics()
+    assert list(graph.run(RunOptions(pipeline=True, statistics=known),
+                          rows=lambda: iter(rows))) == expected
+    plan = optimizer.optimize(graph)
+    fingerprints = [node.fingerprint for node in plan.nodes]
+    optimizer.add_prefetch(plan)
+    assert [optimizer.describe(node.operation) for node in plan.nodes] == \
+        ['ReadIterFactory(rows)', 'Prefetch', 'Map(LowerCase)', 'Prefetch',
+         "Sort(keys=['id'])", 'Prefetch', 'Map(Filter)']
+    assert known.rows(fingerprints[1]) == 5000
+    assert known.rows(fingerprints[2]) == 5000
+
+    rows.sort(key=lambda row: row['id'])
+    explicit = Graph.graph_from_iter('rows').prefetch() \
+        .reduce(operations.Count('count'), ['id'])
+    known = statistics.Statistics()
+    assert [row['count'] for row in explicit.run(
+        RunOptions(profile=True, statistics=known),
+        rows=lambda: iter(rows))] == \
+        [500] * 10
+    assert explicit.last_profile is not None
+    assert [stage.rows_out for stage in explicit.last_profile.stages] == \
+        [5000, 5000, 10]
+    # keys of the reduce after the boundary are counted on the source
+    plan = optimizer.optimize(explicit)
+    distinct = known.distinct(plan.nodes[0].fingerprint, ['id'])
+    assert distinct is not None and round(distinct) == 10
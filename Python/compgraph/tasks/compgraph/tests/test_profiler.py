@@ -0,0 +1,71 @@
+import json
+import time
+import typing as tp
+
+from compgraph import graph, operations
+from compgraph.expressions import side
+
+
+class Slow(operations.Mapper):
+    def __call__(self, row: operations.TRow) -> operations.TRowsGenerator:
+        time.sleep(0.01)
+        yield row
+
+
+def test_profile_rows() -> None:
+    left = [{'id': i % 3, 'a': i} for i in range(10)]
+    right = [{'id': i, 'b': i} for i in range(3)]
+    joined = graph.Graph.graph_from_iter('right').sort(['id'])
+    g = graph.Graph.graph_from_iter('left') \
+        .map(operations.Filter(lambda row: row['a'] > 3, ['a'])) \
+        .sort(['id']) \
+        .join(operations.InnerJoiner(), joined, ['id'])
+    assert g.last_profile is None
+    assert len(list(g.run(graph.RunOptions(profile=True),
+                          left=lambda: iter(left),
+                          right=lambda: iter(right)))) == 6
+
+    assert g.last_profile is not None
+    report = g.last_profile.to_dict()
+    stages = report['stages']
+    assert [(stage['operation'], stage['rows_in'], stage['rows_out'])
+            for stage in stages] == [
+        ('ReadIterFactory(left)', 0, 10),
+        ('Map(Filter)', 10, 6),
+        ("Join(InnerJoiner, keys=['id'])", 9, 6),
+    ]
+    assert [stage['operation'] for stage in stages[2]['inputs'][0]] == [
+        'ReadIterFactory(right)']
+    assert stages[2]['counters']['strategy'] == 'hash'
+    assert json.loads(g.last_profile.to_json()) == report
+    assert "Join(InnerJoiner, keys=['id'])" in g.last_profile.table()
+
+    g = graph.Graph.graph_from_iter('left').sort(['a'])
+    assert len(list(g.run(graph.RunOptions(profile=True),
+                          left=lambda: iter(left)))) == 10
+    assert g.last_profile is not None
+    counters = g.last_profile.to_dict()['stages'][1]['counters']
+    assert counters['pipe_bytes'] > 0
+    assert 'worker_cpu' in counters
+
+
+def test_profile_self_time() -> None:
+    rows = [{'a': i} for i in range(10)]
+    total = graph.Graph.graph_from_iter('rows') \
+        .map(Slow()) \
+        .reduce(operations.CountRows('count'), [])
+    g = graph.Graph.graph_from_iter('rows').map(Slow()).map(
+        operations.Compute({'count': side('count')}),
+        side_inputs={'count': total.as_scalar('count')})
+    result = g.run(graph.RunOptions(profile=True), rows=lambda: iter(rows))
+    assert [row['count'] for row in result] == [10] * 10
+
+    profile = g.last_profile
+    assert profile is not None
+    stages: list[tp.Any] = profile.to_dict()['stages']
+    assert 0.1 <= stages[1]['wall'] < 0.5
+    compute = stages[2]
+    assert compute['wall'] < 0.05
+    plan = compute['side_inputs'][0]
+    assert [stage['rows_out'] for stage in plan] == [10, 10, 1]
+    assert 0.1 <= plan[1]['wall'] < 0.5
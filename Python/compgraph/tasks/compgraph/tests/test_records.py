@@ -0,0 +1,62 @@
+import io
+import typing as tp
+from datetime import datetime, timedelta
+
+import pytest
+
+from compgraph import records
+
+
+ROWS = [
+    {'id': 1, 'text': 'hello', 'score': 0.5, 'flag': True, 'none': None},
+    {'id': -7, 'text': 'мир', 'score': -1e300, 'flag': False, 'none': None},
+    {'id': 8414926848168493057, 'text': '', 'score': 3.0, 'flag': True,
+     'none': None},
+    {'start': [37.84, 55.73], 'time': datetime(2017, 10, 20, 11, 22, 38)},
+    {'delta': timedelta(seconds=3), 'big': 2 ** 70, 'mixed': 1},
+    {'delta': timedelta(days=1), 'big': 1, 'mixed': 'one'},
+]
+
+
+def test_encode_rows_roundtrip() -> None:
+    result = records.decode_rows(records.encode_rows(ROWS))
+    assert result == ROWS
+    assert [list(row) for row in result] == [list(row) for row in ROWS]
+
+
+def test_rows_without_columns() -> None:
+    rows: list[records.TRow] = [{}, {}, {'a': 1}, {}]
+    assert records.decode_rows(records.encode_rows(rows)) == rows
+    assert records.unpack_block(records.pack_block([{}] * 3)) == [{}] * 3
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib', 'lzma'])
+def test_pack_block(compression: str | None) -> None:
+    block = records.pack_block(ROWS, compression)
+    assert records.unpack_block(block) == ROWS
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib', 'lzma'])
+def test_writer_reader(compression: str | None) -> None:
+    rows = [{'key': i % 7, 'value': str(i)} for i in range(10000)]
+    stream = io.BytesIO()
+    with records.RecordWriter(stream, compression, block_rows=1000) as writer:
+        writer.write_rows(rows)
+    assert writer.rows_written == len(rows)
+    assert writer.bytes_written == len(stream.getvalue())
+
+    stream.seek(0)
+    blocks = list(records.RecordReader(stream).blocks())
+    assert len(blocks) == 10
+    assert [row for block in blocks for row in block] == rows
+
+
+def test_files(tmp_path: tp.Any) -> None:
+    path = str(tmp_path / 'rows.cgr')
+    assert records.write_records(path, iter(ROWS), 'zlib') == len(ROWS)
+    assert list(records.read_records(path)) == ROWS
+
+
+def test_bad_stream() -> None:
+    with pytest.raises(ValueError):
+        records.RecordReader(io.BytesIO(b'not a record stream'))
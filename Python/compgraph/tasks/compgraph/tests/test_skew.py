@@ -0,0 +1,80 @@
+import typing as tp
+
+import pytest
+
+from compgraph import Graph, RunOptions, external_sort, operations, optimizer
+from compgraph import skew, statistics
+
+from .rows import random_rows
+
+
+@pytest.mark.parametrize('reducer, keys', [
+    (operations.Count('count'), ['id']),
+    (operations.Sum('value'), ['id']),
+    (operations.MulSum(['id', 'value']), ['id']),
+    (operations.SumOfAllTable('value'), []),
+    (operations.FirstReducer(), ['id'])])
+def test_partitioned_reduce(reducer: operations.Reducer,
+                            keys: list[str]) -> None:
+    rows = random_rows(2000, 50, 0, hot=0.5)
+    if keys:
+        expected = list(operations.Reduce(reducer, keys)(
+            external_sort.ExternalSort(keys)(rows)))
+    else:
+        expected = list(operations.Reduce(reducer, keys)(rows))
+    stats: dict[str, tp.Any] = {}
+    reduce = skew.PartitionedReduce(reducer, keys, partitions=4)
+    result = list(reduce(iter(rows), stats=stats))
+    if isinstance(reducer, operations.SumOfAllTable):
+        assert [row['sum'] for row in result] == \
+            [row['sum'] for row in expected]
+    else:
+        assert result == expected
+    assert stats['hot_keys'] == (reducer.combiner() is not None)
+
+
+def test_partition_salts_hot_keys() -> None:
+    rows, hot = skew.detect(random_rows(2000, 50, 1, hot=0.5), ['id'], 4)
+    assert hot == {0}
+    parts = skew.partition(rows, ['id'], 4, hot)
+    sizes = [len(part) for part in parts]
+    assert sum(sizes) == 2000
+    assert max(sizes) < 800
+    assert not any(part.spilled for part in parts)
+    for part in parts:
+        part.close()
+
+
+def test_partitions_spill() -> None:
+    rows = random_rows(2000, 50, 3, hot=0.5)
+    parts = skew.partition(rows, ['id'], 4, {0}, spill_rows=400)
+    assert all(part.spilled for part in parts)
+    assert sorted(row['value'] for part in parts for row in part) == \
+        list(range(2000))
+    for part in parts:
+        part.close()
+
+    reduce = skew.PartitionedReduce(operations.Sum('value'), ['id'],
+                                    partitions=4, spill_rows=400)
+    expected = operations.Reduce(operations.Sum('value'), ['id'])(
+        external_sort.ExternalSort(['id'])(rows))
+    assert list(reduce(iter(rows))) == list(expected)
+
+
+def test_graph_partitioned_reduce() -> None:
+    graph = Graph.graph_from_iter('rows') \
+        .sort(['id']) \
+        .reduce(operations.Count('count'), ['id'], partitions=4)
+    plan = optimizer.optimize(graph)
+    assert [optimizer.strategy(node.operation) for node in plan.nodes] == \
+        ['scan', '4 partitions']
+
+    rows = random_rows(1000, 50, 2, hot=0.5)
+    known = statistics.Statistics()
+    result = list(graph.run(RunOptions(statistics=known),
+                            rows=lambda: iter(rows)))
+    assert sum(row['count'] for row in result) == 1000
+    optimizer.choose_strategies(plan, known)
+    operation = plan.nodes[-1].operation
+    assert isinstance(operation, skew.PartitionedReduce)
+    assert operation.hot == {0}
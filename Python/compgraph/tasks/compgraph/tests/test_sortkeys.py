@@ -0,0 +1,64 @@
+import itertools
+import random
+import typing as tp
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+
+import pytest
+
+from compgraph import budget, external_sort, sortkeys
+
+
+def _numbers() -> list[float]:
+    generator = random.Random(0)
+    return [0, -0.0, 1, True, 1.5, -3, 2 ** 53, 2 ** 53 + 1, float(2 ** 60),
+            2 ** 60 - 1, 2 ** 60 + 1, -2 ** 70 - 3, float(-2 ** 70),
+            float('inf'), float('-inf')] + \
+        [generator.uniform(-1e20, 1e20) for _ in range(20)] + \
+        [generator.randrange(-2 ** 80, 2 ** 80) for _ in range(20)]
+
+
+@pytest.mark.parametrize('values', [
+    _numbers(),
+    ['', 'a', 'ab', 'a\x00', 'a\x00b', 'b', '\x00', '\udc80', '\U0001f600'],
+    [b'', b'a', b'a\x00', b'b'],
+    [datetime(2020, 1, 1), datetime(2020, 1, 1, 0, 0, 1), datetime(1, 1, 1)],
+    [datetime(2020, 1, 1, 12, tzinfo=timezone.utc),
+     datetime(2020, 1, 1, 13, tzinfo=timezone(timedelta(hours=1))),
+     datetime(2020, 1, 1, 11, 0, 1, tzinfo=timezone(timedelta(hours=-1)))]])
+def test_encoding_keeps_order(values: list[tp.Any]) -> None:
+    for a, b in itertools.product(values, repeat=2):
+        assert (a < b) == (sortkeys.encode(a) < sortkeys.encode(b))
+        assert (a == b) == (sortkeys.encode(a) == sortkeys.encode(b))
+        # a value never runs into the next one
+        assert ((a, 1) < (b, 0)) == \
+            (sortkeys.encode(a) + sortkeys.encode(1) <
+             sortkeys.encode(b) + sortkeys.encode(0))
+
+
+def test_encoder() -> None:
+    encode_key = sortkeys.encoder(['a', 'b'])
+    for a, b in itertools.product(
+            [0, -0.0, 5, 2 ** 53, 2 ** 60, -1.5, 1e300, 'x\x00', None],
+            [True, 'y', datetime(2020, 1, 1)]):
+        assert encode_key({'a': a, 'b': b}) == \
+            sortkeys.encode(a) + sortkeys.encode(b)
+
+
+def test_sort_encoded_keys() -> None:
+    generator = random.Random(1)
+    rows = [{'a': f'w{generator.randrange(50)}', 'b': generator.random(),
+             'c': i} for i in range(3000)]
+    key = itemgetter('a', 'b')
+    sort = external_sort.ExternalSort(['a', 'b'], encode_keys=True)
+    assert list(sort(iter(rows))) == sorted(rows, key=key)
+    memory = budget.MemoryBudget(100000)
+    assert list(budget.within(memory, sort(iter(rows)))) == \
+        sorted(rows, key=key)
+
+    with pytest.raises(TypeError):
+        sortkeys.encode((1, 2))
+    rows = [{'a': (i % 7, i)} for i in range(100)]
+    sort = external_sort.ExternalSort(['a'], memory_rows=100,
+                                      encode_keys=True)
+    assert list(sort(iter(rows))) == sorted(rows, key=itemgetter('a'))
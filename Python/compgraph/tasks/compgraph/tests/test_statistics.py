@@ -0,0 +1,118 @@
+import random
+import typing as tp
+from datetime import datetime
+
+from pytest import approx
+
+from compgraph import adaptive, external_sort, graph, operations, optimizer
+from compgraph.statistics import HeavyHitters, HyperLogLog, Statistics
+
+
+def test_hyper_log_log() -> None:
+    for count in (10, 1000, 100000):
+        sketch = HyperLogLog()
+        for value in range(count):
+            sketch.add(value)
+            sketch.add(value)
+        assert sketch.count() == approx(count, rel=0.05)
+
+    first, second = HyperLogLog(), HyperLogLog()
+    for value in range(3000):
+        (first if value % 2 else second).add(f'word{value}')
+    first.merge(second)
+    assert first.count() == approx(3000, rel=0.05)
+
+
+def test_heavy_hitters() -> None:
+    values = ['hot'] * 300 + ['warm'] * 100 + [str(i) for i in range(2000)]
+    random.Random(0).shuffle(values)
+    sketch = HeavyHitters(capacity=16)
+    for value in values:
+        sketch.add(value)
+    top = sketch.top()
+    assert [value for value, _ in top[:2]] == ['hot', 'warm']
+    assert 300 - len(values) / 17 <= top[0][1] <= 300
+
+
+def _word_count() -> graph.Graph:
+    return graph.Graph.graph_from_iter('docs') \
+        .map(operations.Split('text')) \
+        .sort(['text']) \
+        .reduce(operations.Count('count'), ['text'])
+
+
+def test_collect_statistics(tmp_path: tp.Any) -> None:
+    docs = [{'text': 'a b a c a'}, {'text': 'b a d'}]
+    collected = Statistics()
+    assert list(_word_count().run(graph.RunOptions(statistics=collected),
+                                  docs=lambda: iter(docs))) == [
+        {'text': 'a', 'count': 4}, {'text': 'b', 'count': 2},
+        {'text': 'c', 'count': 1}, {'text': 'd', 'count': 1}]
+
+    path = str(tmp_path / 'stats.json')
+    collected.save(path)
+    loaded = Statistics.load(path)
+    plan = optimizer.optimize(_word_count())
+    assert [loaded.rows(node.fingerprint) for node in plan.nodes] == \
+        [2, 8, 4]
+    words = plan.nodes[1].fingerprint
+    assert loaded.distinct(words, ['text']) == approx(4, rel=0.05)
+    node = loaded.get(words)
+    assert node is not None and node.heavy[('text',)][0] == ('a', 4)
+
+    optimizer.estimate_rows(plan, loaded)
+    assert [node.rows for node in plan.nodes] == \
+        approx([2, 8, 4], rel=0.05)
+
+
+def test_saved_keys_keep_types(tmp_path: tp.Any) -> None:
+    day = datetime(2024, 5, 1)
+    rows = [{'day': day, 'id': (1, b'x'), 'name': 'a'}] * 5 + \
+        [{'day': day, 'id': 2, 'name': 'b'}] * 3
+    collected = Statistics()
+    keys = ['day', 'id', 'name']
+    list(collected.collect(rows, 'node', keys))
+    path = str(tmp_path / 'stats.json')
+    collected.save(path)
+    assert Statistics.load(path).heavy('node', keys) == [
+        ((day, (1, b'x'), 'a'), 5), ((day, 2, 'b'), 3)]
+
+
+def _words() -> graph.Graph:
+    return graph.Graph.graph_from_iter('docs') \
+        .map(operations.Split('text')) \
+        .sort(['text'])
+
+
+def test_small_sort_in_memory() -> None:
+    docs = [{'text': 'b c a'}]
+    plan = optimizer.optimize(_words())
+    known = Statistics()
+    known.update({plan.nodes[1].fingerprint: 3})
+    optimizer.choose_strategies(plan, known)
+    sort = plan.nodes[2].operation
+    assert isinstance(sort, external_sort.ExternalSort)
+    assert sort.memory_rows == optimizer.MEMORY_SORT_ROWS
+    assert 'in-memory sort' in _words().explain(False, known)
+
+    g = _words()
+    options = graph.RunOptions(statistics=known, profile=True)
+    assert [row['text'] for row in g.run(options,
+                                         docs=lambda: iter(docs))] == \
+        ['a', 'b', 'c']
+    assert g.last_profile is not None
+    assert 'pipe_bytes' not in g.last_profile.stages[2].counters
+
+    sort = external_sort.ExternalSort(['a'], memory_rows=2)
+    rows = [{'a': 3}, {'a': 1}, {'a': 2}]
+    assert list(sort(rows)) == [{'a': 1}, {'a': 2}, {'a': 3}]
+
+
+def test_big_input_sorted_at_once() -> None:
+    plan = optimizer.optimize(_word_count())
+    known = Statistics()
+    known.update({plan.nodes[1].fingerprint: optimizer.MEMORY_SORT_ROWS + 1})
+    optimizer.choose_strategies(plan, known)
+    reduce = plan.nodes[2].operation
+    assert isinstance(reduce, adaptive.AdaptiveReduce)
+    assert reduce.memory_limit == 0
@@ -0,0 +1,152 @@
+import asyncio
+import typing as tp
+from datetime import datetime, timedelta
+from itertools import count, islice
+
+from pytest import approx
+
+from compgraph import Graph, algorithms, operations, windows
+
+LENGTHS = [
+    {'start': [37.84870228730142, 55.73853974696249],
+     'end': [37.8490418381989, 55.73832445777953],
+     'edge_id': 8414926848168493057},
+    {'start': [37.524768467992544, 55.88785375468433],
+     'end': [37.52415172755718, 55.88807155843824],
+     'edge_id': 5342768494149337085},
+]
+
+TIMES = [
+    {'leave_time': '20171020T112238.723000',
+     'enter_time': '20171020T112237.427000',
+     'edge_id': 8414926848168493057},
+    {'leave_time': '20171020T090548.939000',
+     'enter_time': '20171020T090547.463000',
+     'edge_id': 8414926848168493057},
+    {'leave_time': '20171020T114101.879000',
+     'enter_time': '20171020T114059.102000',
+     'edge_id': 5342768494149337085},
+    {'leave_time': '20171020T113000.000000',
+     'enter_time': '20171020T112959.000000',
+     'edge_id': 1},
+    {'leave_time': '20171022T131828.330000',
+     'enter_time': '20171022T131820.842000',
+     'edge_id': 5342768494149337085},
+]
+
+
+def test_tumbling_windows() -> None:
+    rows = [{'key': key, 'time': time, 'value': time}
+            for time in range(10) for key in 'ba']
+    operation = windows.WindowReduce(windows.Sums(['value']), ['key'],
+                                     'time', size=4)
+    assert list(operation(iter(rows))) == [
+        {'key': 'a', 'window_start': 0, 'window_end': 4, 'sum_0': 6},
+        {'key': 'b', 'window_start': 0, 'window_end': 4, 'sum_0': 6},
+        {'key': 'a', 'window_start': 4, 'window_end': 8, 'sum_0': 22},
+        {'key': 'b', 'window_start': 4, 'window_end': 8, 'sum_0': 22},
+        {'key': 'a', 'window_start': 8, 'window_end': 12, 'sum_0': 17},
+        {'key': 'b', 'window_start': 8, 'window_end': 12, 'sum_0': 17},
+    ]
+
+
+def test_sliding_windows_of_endless_stream() -> None:
+    read = 0
+
+    def stream() -> tp.Iterator[operations.TRow]:
+        nonlocal read
+        for time in count():
+            read += 1
+            yield {'time': time / 2}
+
+    graph = Graph.graph_from_iter('stream').window(
+        windows.Count('count'), [], 'time', size=2, slide=1)
+    result = list(islice(graph.run(stream=stream), 3))
+    assert result == [
+        {'window_start': -1, 'window_end': 1, 'count': 2},
+        {'window_start': 0, 'window_end': 2, 'count': 4},
+        {'window_start': 1, 'window_end': 3, 'count': 4},
+    ]
+    # results are sent once the stream passes ends of windows
+    assert read == 7
+
+
+def test_closed_window_of_stalled_stream() -> None:
+    graph = Graph.graph_from_iter('stream') \
+        .window(windows.Count('count'), [], 'time', size=4)
+
+    async def main() -> list[operations.TRow]:
+        resume = asyncio.Event()
+
+        async def stream() -> tp.AsyncGenerator[operations.TRow, None]:
+            for time in range(5):
+                yield {'time': time}
+            await resume.wait()
+            yield {'time': 9}
+
+        iterator = aiter(graph.run_async(stream=stream()))
+        # the row of time 4 closes the first window
+        first = await asyncio.wait_for(anext(iterator), 1)
+        resume.set()
+        return [first] + [row async for row in iterator]
+
+    assert asyncio.run(main()) == [
+        {'window_start': 0, 'window_end': 4, 'count': 4},
+        {'window_start': 4, 'window_end': 8, 'count': 1},
+        {'window_start': 8, 'window_end': 12, 'count': 1}]
+
+
+def test_late_rows() -> None:
+    start = datetime(2024, 5, 1, 12)
+    minutes = [0, 3, 1, 11, 9, 4, 13, 2, 22, 8]
+    rows = [{'time': start + timedelta(minutes=minute)}
+            for minute in minutes]
+    stats: dict[str, tp.Any] = {}
+    operation = windows.WindowReduce(
+        windows.Count('count'), [], 'time', size=timedelta(minutes=10),
+        delay=timedelta(minutes=2))
+    result = list(operation(iter(rows), stats=stats))
+    # 9 and 4 are in time for the first window, 2 and 8 come after it is
+    # sent at 13
+    assert [(row['window_start'].minute, row['count'])
+            for row in result] == [(0, 5), (10, 2), (20, 1)]
+    assert stats['late_rows'] == 2
+
+
+def test_stream_speed() -> None:
+    read = 0
+
+    def lengths() -> tp.Iterator[operations.TRow]:
+        nonlocal read
+        read += 1
+        return iter(LENGTHS)
+
+    batch = algorithms.yandex_maps_graph('travel_time', 'edge_length')
+    expected = list(batch.run(travel_time=lambda: iter(TIMES),
+                              edge_length=lambda: iter(LENGTHS)))
+    graph = algorithms.yandex_maps_stream_graph(
+        'travel_time', 'edge_length', delay=timedelta(hours=3))
+    result = list(graph.run(travel_time=lambda: iter(TIMES),
+                            edge_length=lengths))
+    # the edge length table is built once for both of its uses
+    assert read == 1
+    assert [(row['weekday'], row['hour'], row['window_start'].hour)
+            for row in result] == [('Fri', 9, 9), ('Fri', 11, 11),
+                                   ('Sun', 13, 13)]
+    # the batch graph takes one of the edges passed at 11
+    assert [row['speed'] for row in result] == [
+        approx(expected[0]['speed']), approx(_speed(TIMES[0], TIMES[2])),
+        approx(expected[2]['speed'])]
+
+
+def _speed(*times: operations.TRow) -> float:
+    lengths = {row['edge_id']: row for row in operations.Map(
+        operations.Haversine('start', 'end', 'length'))(iter(LENGTHS))}
+    hours = 0.
+    kilometers = 0.
+    for row in times:
+        leave, enter = (datetime.strptime(row[column], '%Y%m%dT%H%M%S.%f')
+                        for column in ('leave_time', 'enter_time'))
+        hours += (leave - enter).total_seconds() / 3600
+        kilometers += lengths[row['edge_id']]['length']
+    return kilometers / hours